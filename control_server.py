@@ -0,0 +1,344 @@
+import asyncio
+import hmac
+import ipaddress
+import json
+import logging
+import typing as tp
+import urllib.parse
+from http import HTTPStatus
+
+from http_server import (
+    HttpServer,
+    HttpRequest,
+    HttpResponse,
+    HttpError,
+    write_response,
+)
+from http_websocket import WebSocket, WebSocketClosed
+from multimedia.player import PlayerSnapshot
+from multimedia.playlist_entry import PlaylistEntry
+from tg_bot.callbacks import Callbacks
+
+logger = logging.getLogger(__name__)
+
+API_PREFIX = "/api/"
+WEBSOCKET_PATH = "/ws"
+
+DEFAULT_QUEUE_LIMIT = 50
+# Changes are coalesced, cursor alone changes few times per second
+PUSH_INTERVAL = 0.02
+# Client, that doesn't read pushed states, is disconnected
+MAX_CLIENT_BUFFER = 1024 * 1024
+# Without token only browser pages of these hosts are trusted
+LOOPBACK_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+
+def is_loopback_host(host: str) -> bool:
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return host == "localhost"
+
+
+Operation = tp.Callable[[tp.Dict[str, tp.Any]], tp.Awaitable[tp.Any]]
+
+
+def _entry_json(entry: PlaylistEntry) -> tp.Dict[str, tp.Any]:
+    title, artist, duration = entry.known_metadata
+    return {
+        "mrl": entry.mrl,
+        "title": title,
+        "artist": artist,
+        "duration": duration,
+        "requester": entry.requester,
+    }
+
+
+def _snapshot_json(snapshot: PlayerSnapshot) -> tp.Dict[str, tp.Any]:
+    media = None
+    if snapshot.media is not None:
+        title, artist, duration = snapshot.media.known_metadata
+        media = {
+            "mrl": snapshot.media.mrl,
+            "title": title,
+            "artist": artist,
+            "duration": duration,
+        }
+
+    return {
+        "version": snapshot.version,
+        "state": snapshot.state.name,
+        "media": media,
+        "cursor": snapshot.cursor,
+        "length": snapshot.length,
+        "volume": snapshot.volume,
+    }
+
+
+def _json_response(value: tp.Any, status: HTTPStatus = HTTPStatus.OK) -> HttpResponse:
+    return HttpResponse(
+        status=status,
+        body=json.dumps(value, ensure_ascii=False).encode("utf-8"),
+        content_type="application/json; charset=utf-8",
+    )
+
+
+# Local control of player without Telegram round trips. Operations are
+# the same as in Callbacks, they are available as `POST /api/<name>`
+# with JSON body and as `{"id": .., "op": <name>, "args": {..}}`
+# messages over WebSocket at /ws. WebSocket clients also receive state
+# of player and queue, whenever it changes.
+class ControlServer:
+    def __init__(
+        self,
+        callbacks: Callbacks,
+        host: str = "127.0.0.1",
+        port: int = 8780,
+        token: tp.Optional[str] = None,
+    ):
+        # Origin check stops only browsers, other clients on network could
+        # queue any uri, local files included
+        if token is None and not is_loopback_host(host):
+            raise ValueError(f"Control api listening on {host} needs token")
+
+        self._callbacks = callbacks
+        self._token = token
+
+        self._operations: tp.Dict[str, Operation] = {
+            "state": self._op_state,
+            "queue": self._op_queue,
+            "add": self._op_add,
+            "skip": self._op_skip,
+            "clear": self._op_clear,
+            "pause": self._op_pause,
+            "resume": self._op_resume,
+            "seek": self._op_seek,
+            "volume": self._op_volume,
+            "shuffle": self._op_shuffle,
+            "fair": self._op_fair,
+        }
+        # Reading operations are also available with GET
+        self._read_only = {"state", "queue"}
+
+        self._clients: tp.Set[WebSocket] = set()
+        self._requests: tp.Set[asyncio.Task] = set()
+        self._changed = asyncio.Event()
+        self._push_task: tp.Optional[asyncio.Task] = None
+
+        self._http = HttpServer(
+            self._on_request,
+            host=host,
+            port=port,
+            upgrade_handler=self._on_upgrade,
+        )
+
+    @property
+    def port(self) -> int:
+        return self._http.port
+
+    async def start(self):
+        await self._http.start()
+        self._push_task = asyncio.create_task(self._push_worker())
+
+    async def stop(self):
+        if self._push_task is not None:
+            self._push_task.cancel()
+            self._push_task = None
+        for task in list(self._requests):
+            task.cancel()
+        for client in list(self._clients):
+            await client.close()
+        await self._http.stop()
+
+    def notify_changed(self, *_):
+        # Cheap enough to be called on every snapshot change
+        self._changed.set()
+
+    @staticmethod
+    def _local_origin(request: HttpRequest) -> bool:
+        # Any web page may call local server from browser, so only
+        # clients without Origin (not browsers) and local pages are let
+        # in. Host isn't trusted, it's under page control after DNS
+        # rebinding.
+        origin = request.headers.get("origin")
+        if origin is None:
+            return True
+        return urllib.parse.urlsplit(origin).hostname in LOOPBACK_HOSTS
+
+    def _authorized(self, request: HttpRequest) -> bool:
+        if self._token is None:
+            return self._local_origin(request)
+
+        # Browsers can't set headers of WebSocket, so query is accepted too
+        provided = request.headers.get("authorization", "").removeprefix("Bearer ")
+        if not provided:
+            provided = request.query.get("token", [""])[0]
+        return hmac.compare_digest(provided, self._token)
+
+    async def _on_request(self, request: HttpRequest) -> HttpResponse:
+        if not request.path.startswith(API_PREFIX):
+            return HttpResponse(status=HTTPStatus.NOT_FOUND)
+        if not self._authorized(request):
+            return HttpResponse(status=HTTPStatus.UNAUTHORIZED)
+
+        name = request.path[len(API_PREFIX) :]
+        if name not in self._operations:
+            return HttpResponse(status=HTTPStatus.NOT_FOUND)
+        if request.method != "POST" and not (
+            request.method == "GET" and name in self._read_only
+        ):
+            return HttpResponse(status=HTTPStatus.METHOD_NOT_ALLOWED)
+
+        try:
+            args = json.loads(request.body) if request.body else {}
+            if request.method == "GET":
+                args = {key: values[0] for key, values in request.query.items()}
+            result = await self._operations[name](args)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            return _json_response({"error": str(e)}, HTTPStatus.BAD_REQUEST)
+
+        return _json_response({"result": result})
+
+    async def _on_upgrade(
+        self,
+        request: HttpRequest,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ):
+        if request.path != WEBSOCKET_PATH:
+            write_response(writer, HttpResponse(status=HTTPStatus.NOT_FOUND), False)
+            return
+        if not self._authorized(request):
+            write_response(writer, HttpResponse(status=HTTPStatus.UNAUTHORIZED), False)
+            return
+
+        try:
+            client = await WebSocket.accept(request, reader, writer)
+        except HttpError as e:
+            write_response(writer, HttpResponse(status=e.status), False)
+            return
+
+        self._clients.add(client)
+        try:
+            # Client starts with full state, then gets changes
+            client.send(json.dumps({"type": "state", **self._state()}))
+            while True:
+                # Slow operation, e.g. add, doesn't hold next ones
+                task = asyncio.create_task(
+                    self._on_message(client, await client.receive())
+                )
+                self._requests.add(task)
+                task.add_done_callback(self._requests.discard)
+        except WebSocketClosed:
+            pass
+        finally:
+            self._clients.discard(client)
+
+    async def _on_message(self, client: WebSocket, data: tp.Union[str, bytes]):
+        request_id = None
+        try:
+            message = json.loads(data)
+            request_id = message.get("id")
+            operation = self._operations[message["op"]]
+            result = await operation(message.get("args") or {})
+            reply = {"type": "result", "id": request_id, "result": result}
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            reply = {"type": "error", "id": request_id, "error": repr(e)}
+        try:
+            client.send(json.dumps(reply, ensure_ascii=False))
+        except WebSocketClosed:
+            # Client left before its result was ready
+            pass
+
+    def _state(self) -> tp.Dict[str, tp.Any]:
+        return {
+            "player": _snapshot_json(self._callbacks.get_player_snapshot()),
+            "playlist_version": self._callbacks.get_playlist_version(),
+            "shuffle": self._callbacks.get_shuffle_play(),
+            "fair": self._callbacks.get_fair_queue(),
+        }
+
+    async def _push_worker(self):
+        playlist_version = None
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+
+            if self._clients:
+                try:
+                    playlist_version = self._push_state(playlist_version)
+                except Exception:
+                    logger.error("Unable to push control state", exc_info=True)
+
+            await asyncio.sleep(PUSH_INTERVAL)
+
+    def _push_state(self, playlist_version: tp.Optional[int]) -> int:
+        state = self._state()
+        # Queue is sent only when it's changed, it may be long
+        if state["playlist_version"] != playlist_version:
+            entries = self._callbacks.head_playlist(DEFAULT_QUEUE_LIMIT)
+            state["queue"] = [_entry_json(e) for e in entries]
+        data = json.dumps({"type": "state", **state}, ensure_ascii=False)
+
+        for client in list(self._clients):
+            if client.write_buffer_size > MAX_CLIENT_BUFFER:
+                logger.warning("Control client doesn't read, closing it")
+                self._clients.discard(client)
+                client.abort()
+                continue
+            try:
+                client.send(data)
+            except WebSocketClosed:
+                self._clients.discard(client)
+
+        return state["playlist_version"]
+
+    async def _op_state(self, args: tp.Dict[str, tp.Any]) -> tp.Dict[str, tp.Any]:
+        return self._state()
+
+    async def _op_queue(self, args: tp.Dict[str, tp.Any]) -> tp.List[tp.Any]:
+        limit = int(args.get("limit", DEFAULT_QUEUE_LIMIT))
+        return [_entry_json(e) for e in self._callbacks.head_playlist(limit)]
+
+    async def _op_add(self, args: tp.Dict[str, tp.Any]) -> tp.List[tp.Any]:
+        entries = await self._callbacks.add_to_playlist(str(args["uri"]), None)
+        return [_entry_json(e) for e in entries]
+
+    async def _op_skip(self, args: tp.Dict[str, tp.Any]) -> bool:
+        return bool(await self._callbacks.skip())
+
+    async def _op_clear(self, args: tp.Dict[str, tp.Any]) -> bool:
+        return bool(await self._callbacks.skipall())
+
+    async def _op_pause(self, args: tp.Dict[str, tp.Any]) -> None:
+        await self._callbacks.pause()
+
+    async def _op_resume(self, args: tp.Dict[str, tp.Any]) -> None:
+        await self._callbacks.resume()
+
+    async def _op_seek(self, args: tp.Dict[str, tp.Any]) -> int:
+        # Absolute `position` or relative `delta`, in seconds
+        if "delta" in args:
+            position = self._callbacks.get_seek() + float(args["delta"])
+        else:
+            position = float(args["position"])
+        position = sorted((0, position, self._callbacks.get_length()))[1]
+        self._callbacks.set_seek(position)
+        return int(position)
+
+    async def _op_volume(self, args: tp.Dict[str, tp.Any]) -> int:
+        volume = sorted((0, int(args["volume"]), 100))[1]
+        self._callbacks.set_volume(volume)
+        return volume
+
+    async def _op_shuffle(self, args: tp.Dict[str, tp.Any]) -> bool:
+        seed = args.get("seed")
+        self._callbacks.set_shuffle_play(
+            bool(args["enabled"]), None if seed is None else int(seed)
+        )
+        return self._callbacks.get_shuffle_play()
+
+    async def _op_fair(self, args: tp.Dict[str, tp.Any]) -> bool:
+        self._callbacks.set_fair_queue(bool(args["enabled"]))
+        return self._callbacks.get_fair_queue()
+
@@ -1,5 +1,8 @@
 import typing as tp
 import asyncio
+import contextlib
+import dataclasses
+import time
 
 import aiosqlite
 
@@ -36,6 +39,34 @@ CREATE TABLE IF NOT EXISTS "play_messages_uris" (
 );
 """
 
+QUERY_CREATE_PLAY_MESSAGES_MEDIAS_TABLE = """
+CREATE TABLE IF NOT EXISTS "play_messages_medias" (
+    "id" INTEGER NOT NULL UNIQUE,
+    "play_message_id" INTEGER NOT NULL,
+    "uri" TEXT NOT NULL,
+    "mrl" TEXT NOT NULL,
+    "title" TEXT,
+    "artist" TEXT,
+    "duration" INTEGER,
+    "resolved_at" REAL NOT NULL,
+    FOREIGN KEY("play_message_id") REFERENCES "play_messages"("id"),
+    PRIMARY KEY("id" AUTOINCREMENT)
+);
+"""
+
+QUERY_CREATE_PLAY_MESSAGES_MEDIAS_INDEX = """
+CREATE INDEX IF NOT EXISTS "play_messages_medias_message"
+ON "play_messages_medias"("play_message_id");
+"""
+
+QUERY_CREATE_TRACK_LOUDNESS_TABLE = """
+CREATE TABLE IF NOT EXISTS "track_loudness" (
+    "mrl" TEXT NOT NULL UNIQUE,
+    "integrated_lufs" REAL NOT NULL,
+    PRIMARY KEY("mrl")
+);
+"""
+
 QUERY_INSERT_PLAY_MESSAGE = """
 INSERT INTO play_messages DEFAULT VALUES;
 """
@@ -48,41 +79,212 @@ QUERY_SELECT_URIS_FROM_PLAY_MESSAGE = """
 SELECT uri FROM play_messages_uris WHERE play_message_id = ?;
 """
 
+QUERY_INSERT_PLAY_MESSAGE_MEDIA = """
+INSERT INTO play_messages_medias(
+    play_message_id, uri, mrl, title, artist, duration, resolved_at
+) VALUES (?, ?, ?, ?, ?, ?, ?);
+"""
+
+QUERY_DELETE_PLAY_MESSAGE_MEDIAS = """
+DELETE FROM play_messages_medias WHERE play_message_id = ? AND uri = ?;
+"""
+
+QUERY_SELECT_PLAY_MESSAGE_MEDIAS = """
+SELECT uri, mrl, title, artist, duration, resolved_at
+FROM play_messages_medias WHERE play_message_id = ? ORDER BY id;
+"""
+
+# SQLite takes bare columns from the row with maximum
+QUERY_SELECT_KNOWN_MEDIAS = """
+SELECT mrl, mrl, title, artist, duration, MAX(resolved_at) AS seen_at
+FROM play_messages_medias GROUP BY mrl ORDER BY seen_at DESC LIMIT ?;
+"""
+
+QUERY_SELECT_TRACK_LOUDNESS = """
+SELECT integrated_lufs FROM track_loudness WHERE mrl = ?;
+"""
+
+QUERY_UPSERT_TRACK_LOUDNESS = """
+INSERT OR REPLACE INTO track_loudness(mrl, integrated_lufs) VALUES (?, ?);
+"""
+
+
+QUERY_ENABLE_WAL = "PRAGMA journal_mode=WAL;"
+QUERY_SYNCHRONOUS_NORMAL = "PRAGMA synchronous=NORMAL;"
+QUERY_ONLY = "PRAGMA query_only=ON;"
+
+# sqlite3 keeps LRU of prepared statements per connection
+STATEMENT_CACHE_SIZE = 64
+
+
+@dataclasses.dataclass()
+class ResolvedMedia:
+    # Requested uri and one of leaf mrls it was resolved to
+    uri: str
+    mrl: str
+    title: tp.Optional[str] = None
+    artist: tp.Optional[str] = None
+    duration: tp.Optional[int] = None
+    resolved_at: float = dataclasses.field(default_factory=time.time)
+
+
+MediasCallback = tp.Callable[[tp.List[ResolvedMedia]], None]
+
+
+def _media_row(
+    message_id: int, media: ResolvedMedia, uri: tp.Optional[str] = None
+) -> tp.Tuple:
+    return (
+        message_id,
+        media.uri if uri is None else uri,
+        media.mrl,
+        media.title,
+        media.artist,
+        media.duration,
+        media.resolved_at,
+    )
+
 
 class Database:
-    def __init__(self, path: str):
+    def __init__(self, path: str, readers: int = 3):
+        # Single writer connection, reads are served by pool of read-only
+        # connections. WAL lets readers work while writer commits.
         self._db: tp.Optional[aiosqlite.Connection] = None
         self._path: str = path
+        self._readers_count = readers if path != ":memory:" else 0
+        self._readers: asyncio.Queue = asyncio.Queue()
+        self._write_lock = asyncio.Lock()
+        self._medias_callbacks: tp.List[MediasCallback] = []
 
     @staticmethod
     async def create(self, path) -> "Database":
         db = Database(path)
         await db.initialize()
 
-    async def add_play_message(self, uris: tp.List[str]) -> int:
-        message_id = (await self._db.execute_insert(QUERY_INSERT_PLAY_MESSAGE))[0]
-        await asyncio.gather(
-            *[
-                self._db.execute(QUERY_INSERT_PLAY_MESSAGE_URI, (message_id, uri))
-                for uri in uris
-            ]
-        )
-        await self._db.commit()
+    def add_medias_callback(self, callback: MediasCallback):
+        # Called after resolved medias are saved
+        self._medias_callbacks.append(callback)
+
+    @contextlib.asynccontextmanager
+    async def _reader(self) -> tp.AsyncIterator[aiosqlite.Connection]:
+        if not self._readers_count:
+            yield self._db
+            return
+
+        db = await self._readers.get()
+        try:
+            yield db
+        finally:
+            self._readers.put_nowait(db)
+
+    async def add_play_message(
+        self,
+        uris: tp.List[str],
+        medias: tp.Sequence[ResolvedMedia] = (),
+    ) -> int:
+        # Request and its resolution are saved by one transaction
+        async with self._write_lock:
+            message_id = (await self._db.execute_insert(QUERY_INSERT_PLAY_MESSAGE))[0]
+            await self._db.executemany(
+                QUERY_INSERT_PLAY_MESSAGE_URI,
+                [(message_id, uri) for uri in uris],
+            )
+            if medias:
+                await self._db.executemany(
+                    QUERY_INSERT_PLAY_MESSAGE_MEDIA,
+                    [_media_row(message_id, media) for media in medias],
+                )
+            await self._db.commit()
+
+        if medias:
+            for callback in self._medias_callbacks:
+                callback(list(medias))
         return message_id
 
     async def fetch_uris_from_play_message(self, message_id) -> tp.List[str]:
-        return [
-            row[0]
-            for row in await self._db.execute_fetchall(
-                QUERY_SELECT_URIS_FROM_PLAY_MESSAGE, (message_id,)
+        async with self._reader() as db:
+            return [
+                row[0]
+                for row in await db.execute_fetchall(
+                    QUERY_SELECT_URIS_FROM_PLAY_MESSAGE, (message_id,)
+                )
+            ]
+
+    async def set_play_message_medias(
+        self,
+        message_id: int,
+        uri: str,
+        medias: tp.List[ResolvedMedia],
+    ):
+        async with self._write_lock:
+            await self._db.execute(QUERY_DELETE_PLAY_MESSAGE_MEDIAS, (message_id, uri))
+            await self._db.executemany(
+                QUERY_INSERT_PLAY_MESSAGE_MEDIA,
+                [_media_row(message_id, media, uri) for media in medias],
             )
-        ]
+            await self._db.commit()
+
+        for callback in self._medias_callbacks:
+            callback(medias)
+
+    async def fetch_play_message_medias(self, message_id) -> tp.List[ResolvedMedia]:
+        async with self._reader() as db:
+            return [
+                ResolvedMedia(*row)
+                for row in await db.execute_fetchall(
+                    QUERY_SELECT_PLAY_MESSAGE_MEDIAS, (message_id,)
+                )
+            ]
+
+    async def fetch_known_medias(self, limit: int) -> tp.List[ResolvedMedia]:
+        # Latest resolution of every mrl, most recent first. Uri isn't
+        # kept per track, mrl is enough to play it again.
+        async with self._reader() as db:
+            rows = await db.execute_fetchall(QUERY_SELECT_KNOWN_MEDIAS, (limit,))
+        return [ResolvedMedia(*row) for row in rows]
+
+    async def fetch_track_loudness(self, mrl: str) -> tp.Optional[float]:
+        async with self._reader() as db:
+            rows = await db.execute_fetchall(QUERY_SELECT_TRACK_LOUDNESS, (mrl,))
+        if not rows:
+            return None
+        return rows[0][0]
+
+    async def set_track_loudness(self, mrl: str, integrated_lufs: float):
+        async with self._write_lock:
+            await self._db.execute(QUERY_UPSERT_TRACK_LOUDNESS, (mrl, integrated_lufs))
+            await self._db.commit()
 
     async def initialize(self):
-        self._db = await aiosqlite.connect(self._path)
+        self._db = await aiosqlite.connect(
+            self._path, cached_statements=STATEMENT_CACHE_SIZE
+        )
+
+        if self._path != ":memory:":
+            await self._db.execute(QUERY_ENABLE_WAL)
+            await self._db.execute(QUERY_SYNCHRONOUS_NORMAL)
 
         await self._db.execute(QUERY_CREATE_GROUPS_TABLE)
         await self._db.execute(QUERY_CREATE_PLAYLIST_TABLE)
         await self._db.execute(QUERY_CREATE_PLAY_MESSAGES_TABLE)
         await self._db.execute(QUERY_CREATE_PLAY_MESSAGES_URIS_TABLE)
+        await self._db.execute(QUERY_CREATE_PLAY_MESSAGES_MEDIAS_TABLE)
+        await self._db.execute(QUERY_CREATE_PLAY_MESSAGES_MEDIAS_INDEX)
+        await self._db.execute(QUERY_CREATE_TRACK_LOUDNESS_TABLE)
         await self._db.commit()
+
+        # Readers are opened after schema is created
+        for _ in range(self._readers_count):
+            reader = await aiosqlite.connect(
+                f"file:{self._path}?mode=ro",
+                uri=True,
+                cached_statements=STATEMENT_CACHE_SIZE,
+            )
+            await reader.execute(QUERY_ONLY)
+            self._readers.put_nowait(reader)
+
+    async def close(self):
+        while not self._readers.empty():
+            await self._readers.get_nowait().close()
+        await self._db.close()
+
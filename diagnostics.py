@@ -0,0 +1,104 @@
+import itertools
+import json
+import time
+import typing as tp
+
+DEFAULT_CAPACITY = 4096
+
+
+class DiagnosticEvent(tp.NamedTuple):
+    # time.monotonic() of recording
+    timestamp: float
+    sequence: int
+    kind: str
+    fields: tp.Dict[str, tp.Any]
+
+
+class DiagnosticsBuffer:
+    # Fixed size ring of recent events. Writers never take locks: slot
+    # index comes from itertools.count, which is atomic under GIL, and
+    # slot is replaced with single store. Readers copy the ring and
+    # order it by sequence number.
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self._capacity = capacity
+        self._slots: tp.List[tp.Optional[DiagnosticEvent]] = [None] * capacity
+        self._sequence = itertools.count()
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def record(self, kind: str, **fields):
+        sequence = next(self._sequence)
+        self._slots[sequence % self._capacity] = DiagnosticEvent(
+            time.monotonic(), sequence, kind, fields
+        )
+
+    def events(
+        self,
+        last: tp.Optional[int] = None,
+        window: tp.Optional[float] = None,
+    ) -> tp.List[DiagnosticEvent]:
+        # Oldest first. `window` is in seconds back from now.
+        events = sorted(
+            (event for event in list(self._slots) if event is not None),
+            key=lambda event: event.sequence,
+        )
+
+        if window is not None:
+            since = time.monotonic() - window
+            events = [event for event in events if event.timestamp >= since]
+        if last is not None:
+            events = events[-last:] if last > 0 else []
+
+        return events
+
+    def clear(self):
+        self._slots = [None] * self._capacity
+
+
+def dump_events(events: tp.Iterable[DiagnosticEvent]) -> bytes:
+    # JSON lines with wall clock time restored from monotonic one
+    offset = time.time() - time.monotonic()
+    lines = []
+    for event in events:
+        wall_time = event.timestamp + offset
+        lines.append(
+            json.dumps(
+                {
+                    "time": time.strftime(
+                        "%Y-%m-%d %H:%M:%S", time.localtime(wall_time)
+                    )
+                    + f".{int(wall_time * 1000) % 1000:03d}",
+                    "seq": event.sequence,
+                    "kind": event.kind,
+                    **event.fields,
+                },
+                ensure_ascii=False,
+                default=repr,
+            )
+        )
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+# Process wide buffer, recording is cheap enough to stay always on
+recorder = DiagnosticsBuffer()
+record = recorder.record
+
+
+if __name__ == "__main__":
+    count = 1000000
+    buffer = DiagnosticsBuffer()
+
+    started = time.perf_counter()
+    for i in range(count):
+        buffer.record("player.state", state="Playing", mrl="file:///music/track.mp3")
+    elapsed = time.perf_counter() - started
+    print(f"record: {elapsed / count * 1e6:.2f} us per event")
+
+    started = time.perf_counter()
+    data = dump_events(buffer.events())
+    print(
+        f"dump of {buffer.capacity} events: {len(data)} bytes in "
+        f"{(time.perf_counter() - started) * 1000:.1f} ms"
+    )
@@ -0,0 +1,183 @@
+import asyncio
+import dataclasses
+import typing as tp
+import logging
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+
+logger = logging.getLogger(__name__)
+
+MAX_HEADER_LINES = 100
+DEFAULT_MAX_BODY_SIZE = 1024 * 1024
+
+
+class HttpError(Exception):
+    def __init__(self, status: HTTPStatus):
+        super().__init__(status.phrase)
+        self.status = status
+
+
+@dataclasses.dataclass()
+class HttpRequest:
+    method: str
+    path: str
+    query: tp.Dict[str, tp.List[str]]
+    headers: tp.Dict[str, str]
+    body: bytes
+
+
+@dataclasses.dataclass()
+class HttpResponse:
+    status: HTTPStatus = HTTPStatus.OK
+    body: bytes = b""
+    content_type: str = "text/plain; charset=utf-8"
+    headers: tp.Dict[str, str] = dataclasses.field(default_factory=dict)
+
+
+HttpHandler = tp.Callable[[HttpRequest], tp.Awaitable[HttpResponse]]
+# Takes over connection, e.g. for WebSocket. Writer is closed afterwards.
+UpgradeHandler = tp.Callable[
+    [HttpRequest, asyncio.StreamReader, asyncio.StreamWriter], tp.Awaitable[None]
+]
+
+
+async def read_request(
+    reader: asyncio.StreamReader,
+    max_body_size: int = DEFAULT_MAX_BODY_SIZE,
+) -> tp.Optional[HttpRequest]:
+    request_line = await reader.readline()
+    if not request_line:
+        # Connection was closed between requests
+        return None
+
+    try:
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST)
+
+    headers = {}
+    for _ in range(MAX_HEADER_LINES):
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+
+    try:
+        content_length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST)
+
+    if content_length > max_body_size:
+        raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+
+    body = await reader.readexactly(content_length) if content_length else b""
+
+    url = urlsplit(target)
+    return HttpRequest(
+        method=method.upper(),
+        path=url.path,
+        query=parse_qs(url.query),
+        headers=headers,
+        body=body,
+    )
+
+
+def write_response(
+    writer: asyncio.StreamWriter,
+    response: HttpResponse,
+    keep_alive: bool = True,
+):
+    headers = {
+        "Content-Type": response.content_type,
+        "Content-Length": str(len(response.body)),
+        "Connection": "keep-alive" if keep_alive else "close",
+        **response.headers,
+    }
+
+    head = f"HTTP/1.1 {response.status.value} {response.status.phrase}\r\n"
+    head += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+    head += "\r\n"
+
+    writer.write(head.encode("latin-1") + response.body)
+
+
+# Tiny HTTP/1.1 server on top of asyncio streams. It is enough for local
+# listeners (webhook behind reverse proxy, LAN control panels) and does
+# not pull any web framework onto the Pi.
+class HttpServer:
+    def __init__(
+        self,
+        handler: HttpHandler,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        max_body_size: int = DEFAULT_MAX_BODY_SIZE,
+        upgrade_handler: tp.Optional[UpgradeHandler] = None,
+    ):
+        self._handler = handler
+        self._upgrade_handler = upgrade_handler
+        self._host = host
+        self._port = port
+        self._max_body_size = max_body_size
+        self._server: tp.Optional[asyncio.AbstractServer] = None
+
+    @property
+    def port(self) -> int:
+        if self._server is None:
+            return self._port
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._on_connection, self._host, self._port
+        )
+        logger.info("Listening for HTTP on %s:%d", self._host, self.port)
+
+    async def stop(self):
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _on_connection(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader, self._max_body_size)
+                except HttpError as e:
+                    write_response(writer, HttpResponse(status=e.status), False)
+                    await writer.drain()
+                    break
+
+                if request is None:
+                    break
+
+                upgrade = request.headers.get("upgrade", "").lower()
+                if upgrade and self._upgrade_handler is not None:
+                    await self._upgrade_handler(request, reader, writer)
+                    break
+
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+
+                try:
+                    response = await self._handler(request)
+                except Exception:
+                    logger.error("Unable to handle %s request", request.path, exc_info=True)
+                    response = HttpResponse(status=HTTPStatus.INTERNAL_SERVER_ERROR)
+
+                write_response(writer, response, keep_alive)
+                await writer.drain()
+
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
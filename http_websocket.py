@@ -0,0 +1,172 @@
+import asyncio
+import base64
+import hashlib
+import struct
+import typing as tp
+from http import HTTPStatus
+
+from http_server import HttpError, HttpRequest
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+DEFAULT_MAX_MESSAGE_SIZE = 64 * 1024
+
+OPCODE_CONTINUATION = 0x0
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+CLOSE_NORMAL = 1000
+CLOSE_TOO_BIG = 1009
+
+
+class WebSocketClosed(Exception):
+    pass
+
+
+def _accept_key(key: str) -> str:
+    digest = hashlib.sha1((key + WEBSOCKET_GUID).encode("latin-1")).digest()
+    return base64.b64encode(digest).decode("latin-1")
+
+
+def _unmask(payload: bytes, mask: bytes) -> bytes:
+    # Whole payload is xored as one big integer, much faster than bytes loop
+    length = len(payload)
+    key = (mask * (length // 4 + 1))[:length]
+    value = int.from_bytes(payload, "little") ^ int.from_bytes(key, "little")
+    return value.to_bytes(length, "little")
+
+
+def _frame(opcode: int, payload: bytes) -> bytes:
+    # Server frames are never masked and never fragmented
+    length = len(payload)
+    if length < 126:
+        head = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        head = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        head = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return head + payload
+
+
+# Server side of RFC 6455, just enough for JSON messages on LAN:
+# text and binary messages, fragmentation, ping and close.
+class WebSocket:
+    def __init__(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        max_message_size: int = DEFAULT_MAX_MESSAGE_SIZE,
+    ):
+        self._reader = reader
+        self._writer = writer
+        self._max_message_size = max_message_size
+        self._closed = False
+
+    @classmethod
+    async def accept(
+        cls,
+        request: HttpRequest,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        max_message_size: int = DEFAULT_MAX_MESSAGE_SIZE,
+    ) -> "WebSocket":
+        key = request.headers.get("sec-websocket-key")
+        if request.headers.get("upgrade", "").lower() != "websocket" or not key:
+            raise HttpError(HTTPStatus.BAD_REQUEST)
+
+        writer.write(
+            (
+                "HTTP/1.1 101 Switching Protocols\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                f"Sec-WebSocket-Accept: {_accept_key(key)}\r\n"
+                "\r\n"
+            ).encode("latin-1")
+        )
+        await writer.drain()
+        return cls(reader, writer, max_message_size)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed or self._writer.is_closing()
+
+    @property
+    def write_buffer_size(self) -> int:
+        return self._writer.transport.get_write_buffer_size()
+
+    def send(self, message: tp.Union[str, bytes]):
+        # Not awaited, so it's safe to send from several tasks
+        if self.closed:
+            raise WebSocketClosed()
+        if isinstance(message, str):
+            self._writer.write(_frame(OPCODE_TEXT, message.encode("utf-8")))
+        else:
+            self._writer.write(_frame(OPCODE_BINARY, message))
+
+    async def receive(self) -> tp.Union[str, bytes]:
+        # Raises WebSocketClosed, when peer closes connection
+        opcode, chunks, size = None, [], 0
+        while True:
+            fin, frame_opcode, payload = await self._read_frame()
+
+            if frame_opcode == OPCODE_PING:
+                self._writer.write(_frame(OPCODE_PONG, payload))
+                continue
+            if frame_opcode == OPCODE_PONG:
+                continue
+            if frame_opcode == OPCODE_CLOSE:
+                await self.close()
+                raise WebSocketClosed()
+
+            if frame_opcode != OPCODE_CONTINUATION:
+                opcode, chunks, size = frame_opcode, [], 0
+            chunks.append(payload)
+            size += len(payload)
+            if size > self._max_message_size:
+                await self.close(CLOSE_TOO_BIG)
+                raise WebSocketClosed()
+
+            if fin:
+                data = b"".join(chunks)
+                return data.decode("utf-8") if opcode == OPCODE_TEXT else data
+
+    async def close(self, code: int = CLOSE_NORMAL):
+        if self.closed:
+            return
+        self._closed = True
+        self._writer.write(_frame(OPCODE_CLOSE, struct.pack("!H", code)))
+        try:
+            await self._writer.drain()
+        except ConnectionError:
+            pass
+
+    def abort(self):
+        # For peers, that stopped reading, close handshake would hang
+        self._closed = True
+        self._writer.transport.abort()
+
+    async def _read_frame(self) -> tp.Tuple[bool, int, bytes]:
+        try:
+            first, second = await self._reader.readexactly(2)
+            length = second & 0x7F
+            if length == 126:
+                (length,) = struct.unpack("!H", await self._reader.readexactly(2))
+            elif length == 127:
+                (length,) = struct.unpack("!Q", await self._reader.readexactly(8))
+
+            if length > self._max_message_size:
+                await self.close(CLOSE_TOO_BIG)
+                raise WebSocketClosed()
+
+            # Client frames are always masked
+            mask = await self._reader.readexactly(4) if second & 0x80 else b""
+            payload = await self._reader.readexactly(length)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            self._closed = True
+            raise WebSocketClosed()
+
+        if mask:
+            payload = _unmask(payload, mask)
+        return bool(first & 0x80), first & 0x0F, payload
@@ -9,9 +9,14 @@ import pdb_attach
 
 from multimedia.media import Media
 from multimedia.player import Player
-from multimedia.playlist import Playlist
+from multimedia.playlist import Playlist, DuplicatePolicy
+from multimedia.engine_profiles import EngineProfile, profile_from_env
+from media_parser.yandex_music_parser import YandexMusicParser
+from multiroom import MultiroomFollower, parse_address
 
+from control_server import is_loopback_host
 from service import Service
+from tg_bot.webhook_server import WebhookConfig
 
 pdb_attach.listen(50000)
 
@@ -64,11 +69,79 @@ def vlc_log_handler(instance, log_level, ctx, fmt, va_list):
         )
 
 
-async def main():
+def webhook_config_from_env():
+    if os.getenv("TG_BOT_MODE", "polling") != "webhook":
+        return None
+
+    return WebhookConfig(
+        url=os.getenv("TG_WEBHOOK_URL"),
+        listen=os.getenv("TG_WEBHOOK_LISTEN", "127.0.0.1"),
+        port=int(os.getenv("TG_WEBHOOK_PORT", "8443")),
+        secret_token=os.getenv("TG_WEBHOOK_SECRET"),
+    )
+
+
+def multiroom_listen_from_env():
+    if os.getenv("MULTIROOM_MODE") != "leader":
+        return None
+    return parse_address(os.getenv("MULTIROOM_LISTEN", "0.0.0.0:7700"))
+
+
+def control_listen_from_env():
+    # Control api is local only, unless host is set explicitly
+    listen = os.getenv("CONTROL_API_LISTEN")
+    if not listen:
+        return None
+
+    host, port = parse_address(listen, "127.0.0.1")
+    if not is_loopback_host(host) and not os.getenv("CONTROL_API_TOKEN"):
+        raise ValueError(
+            f"Control api on {host} is reachable from network, "
+            "set CONTROL_API_TOKEN"
+        )
+    return host, port
+
+
+def debug_admins_from_env():
+    # Comma separated ids of Telegram users, allowed to /debug and /reload
+    admins = os.getenv("TG_DEBUG_ADMINS", "")
+    return [int(user_id) for user_id in admins.split(",") if user_id.strip()]
+
+
+async def run_multiroom_follower():
+    # Follower has no bot and playlist, it plays what leader says
+    host, port = parse_address(os.getenv("MULTIROOM_LEADER"))
+    player = Player(stream_resolver=YandexMusicParser().resolve_stream)
+    await MultiroomFollower(player, host, port).run()
+
+
+async def main(engine_profile: EngineProfile):
     try:
+        # Dead links must not hang parsing forever
+        parse_timeout = float(os.getenv("MEDIA_PARSE_TIMEOUT", "15"))
+        Media.parse_timeout = parse_timeout if parse_timeout > 0 else None
+
+        if os.getenv("MULTIROOM_MODE") == "follower":
+            await run_multiroom_follower()
+            return
+
         service = Service(
             telegram_bot_token=os.getenv("TG_BOT_TOKEN"),
             database_path="db.sqlite3",
+            prefetch_cache_path=os.getenv("PREFETCH_CACHE_PATH", "prefetch_cache"),
+            prefetch_cache_bytes=int(
+                os.getenv("PREFETCH_CACHE_BYTES", str(512 * 1024 * 1024))
+            ),
+            prefetch_ahead=int(os.getenv("PREFETCH_AHEAD", "3")),
+            webhook_config=webhook_config_from_env(),
+            engine_profile=engine_profile,
+            max_concurrent_updates=int(os.getenv("TG_MAX_CONCURRENT_UPDATES", "8")),
+            duplicate_policy=DuplicatePolicy(os.getenv("PLAYLIST_DUPLICATES", "skip")),
+            link_warmup=os.getenv("LINK_WARMUP", "0") == "1",
+            multiroom_listen=multiroom_listen_from_env(),
+            control_listen=control_listen_from_env(),
+            control_token=os.getenv("CONTROL_API_TOKEN") or None,
+            debug_admins=debug_admins_from_env(),
         )
 
         await service.run()
@@ -82,17 +155,11 @@ async def main():
 
 
 if __name__ == "__main__":
-    vlc._default_instance = vlc.Instance(
-        [
-            "--no-video",
-            "--audio-resampler=speex_resampler",
-            "--advanced",
-            "--speex-resampler-quality",
-            "0",
-            "-v",
-        ]
-    )
+    # CPU is traded for quality with VLC_ENGINE_PROFILE
+    engine_profile = profile_from_env()
+    logger.info("Using '%s' engine profile", engine_profile.name)
+    vlc._default_instance = vlc.Instance(engine_profile.vlc_args())
 
     vlc._default_instance.log_set(vlc_log_handler, None)
 
-    asyncio.run(main())
+    asyncio.run(main(engine_profile))
@@ -10,3 +10,8 @@ class BasicParser(abc.ABC):
     @abc.abstractmethod
     async def parse_media(self, url: str) -> tp.List[str]:
         pass
+
+    async def resolve_stream(self, mrl: str) -> tp.Optional[str]:
+        # Direct audio url of parsed mrl, that is given to libvlc instead
+        # of mrl itself. None, if mrl is played as is.
+        return None
@@ -1,21 +1,58 @@
+import asyncio
+import collections
+import dataclasses
+import functools
+import hashlib
+import logging
 import typing as tp
 import re
 import os
-from urllib.parse import urlparse
+import time
+from urllib.parse import urlparse, urlsplit
+from xml.etree import ElementTree
 
+import httpx
+
+import diagnostics
 from .basic_parser import BasicParser
 
+logger = logging.getLogger(__name__)
+
 BASE_URL_RE = re.compile(r"music\.yandex\.(ru|com)")
 PLAYLIST_RE = re.compile(r"/users/.*/playlists/[0-9]+")
 TRACK_RE = re.compile(r"/album/[0-9]+/track/[0-9]+")
 ALBUM_RE = re.compile(r"/album/[0-9]+")
+TRACK_ID_RE = re.compile(r"/track/([0-9]+)")
 
 TOKEN_RE = re.compile(r"\?access_token=.+")
 
+API_URL = "https://api.music.yandex.net"
+# Salt of download link signature, same one is used by official clients
+SIGN_SALT = "XGRlBW9FXlekgbPrRHuSiA"
+
+# download-info doesn't report expiry of signed links, they are known
+# to live longer than that
+STREAM_TTL = 10 * 60
+MAX_CACHED_STREAMS = 512
+
+
+@dataclasses.dataclass()
+class CachedStream:
+    url: str
+    expires_at: float
+
 
 class YandexMusicParser(BasicParser):
-    def __init__(self):
+    def __init__(self, api_url: str = API_URL, stream_ttl: float = STREAM_TTL):
         self._token = os.getenv("YA_MUSIC_TOKEN")
+        self._api_url = api_url
+        self._stream_ttl = stream_ttl
+
+        # Track id to direct url, ordered from least to most recently used
+        self._streams: tp.OrderedDict[str, CachedStream] = collections.OrderedDict()
+        # Concurrent plays of one track share single resolution
+        self._resolving: tp.Dict[str, asyncio.Task] = {}
+        self._client: tp.Optional[httpx.AsyncClient] = None
 
     async def is_suitable(self, url: str) -> bool:
         return all(
@@ -36,10 +73,85 @@ class YandexMusicParser(BasicParser):
         url = urlparse(url)._replace(query="").geturl()
         return [f"{url}?access_token={self._token}"]
 
+    async def resolve_stream(self, mrl: str) -> tp.Optional[str]:
+        if not BASE_URL_RE.search(mrl):
+            return None
 
-if __name__ == "__main__":
-    import asyncio
+        match = TRACK_ID_RE.search(urlparse(mrl).path)
+        if match is None:
+            return None
+        track_id = match[1]
+
+        cached = self._streams.get(track_id)
+        if cached is not None and cached.expires_at > time.monotonic():
+            self._streams.move_to_end(track_id)
+            return cached.url
+
+        task = self._resolving.get(track_id)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_stream(track_id))
+            self._resolving[track_id] = task
+            task.add_done_callback(functools.partial(self._on_fetched, track_id))
+
+        try:
+            # Cancelled caller must not cancel resolution for others
+            return await asyncio.shield(task)
+        except Exception as e:
+            diagnostics.record("yandex.stream", track=track_id, error=repr(e))
+            logger.warning(
+                "Unable to resolve stream of track %s", track_id, exc_info=True
+            )
+            return None
+
+    def _on_fetched(self, track_id: str, task: asyncio.Task):
+        self._resolving.pop(track_id, None)
+        # Waiters may all have timed out, then nobody else retrieves failure
+        if not task.cancelled():
+            task.exception()
+
+    async def _fetch_stream(self, track_id: str) -> str:
+        if self._client is None:
+            self._client = httpx.AsyncClient(follow_redirects=True, timeout=10)
 
+        started = time.monotonic()
+        headers = {"Authorization": f"OAuth {self._token}"} if self._token else {}
+
+        response = await self._client.get(
+            f"{self._api_url}/tracks/{track_id}/download-info", headers=headers
+        )
+        response.raise_for_status()
+        info = max(
+            (i for i in response.json()["result"] if i["codec"] == "mp3"),
+            key=lambda i: i["bitrateInKbps"],
+        )
+
+        response = await self._client.get(info["downloadInfoUrl"], headers=headers)
+        response.raise_for_status()
+        download_info = ElementTree.fromstring(response.text)
+        host, path, ts, s = (
+            download_info.findtext(name) for name in ("host", "path", "ts", "s")
+        )
+
+        sign = hashlib.md5(f"{SIGN_SALT}{path[1:]}{s}".encode("utf-8")).hexdigest()
+        scheme = urlsplit(info["downloadInfoUrl"]).scheme
+        url = f"{scheme}://{host}/get-mp3/{sign}/{ts}{path}"
+
+        self._streams[track_id] = CachedStream(
+            url=url, expires_at=time.monotonic() + self._stream_ttl
+        )
+        while len(self._streams) > MAX_CACHED_STREAMS:
+            self._streams.popitem(last=False)
+
+        diagnostics.record(
+            "yandex.stream",
+            track=track_id,
+            bitrate=info["bitrateInKbps"],
+            elapsed=round(time.monotonic() - started, 3),
+        )
+        return url
+
+
+if __name__ == "__main__":
     u = "https://music.yandex.com/album/21370360/track/101378847"
     parser = YandexMusicParser()
 
@@ -0,0 +1,249 @@
+import dataclasses
+import logging
+import os
+import typing as tp
+
+logger = logging.getLogger(__name__)
+
+ENGINE_PROFILE_ENV = "VLC_ENGINE_PROFILE"
+
+# Option with quality of every supported resampler
+RESAMPLER_QUALITY_OPTIONS = {
+    "speex_resampler": "speex-resampler-quality",
+    "soxr": "soxr-resampler-quality",
+}
+
+# libvlc defaults of input caching, milliseconds
+DEFAULT_NETWORK_CACHING = 1000
+DEFAULT_FILE_CACHING = 300
+# Input caching of overheated device is that many times bigger
+DEGRADED_CACHING_FACTOR = 4
+
+
+@dataclasses.dataclass(frozen=True)
+class EngineProfile:
+    name: str
+    description: str
+    resampler: str = "speex_resampler"
+    resampler_quality: int = 0
+    # None keeps libvlc choice (usually pulseaudio)
+    audio_output: tp.Optional[str] = None
+    # Milliseconds, None keeps libvlc defaults
+    network_caching: tp.Optional[int] = None
+    file_caching: tp.Optional[int] = None
+    verbosity: int = 1
+
+    def vlc_args(self) -> tp.List[str]:
+        args = [
+            "--no-video",
+            f"--audio-resampler={self.resampler}",
+            "--advanced",
+            f"--{RESAMPLER_QUALITY_OPTIONS[self.resampler]}",
+            str(self.resampler_quality),
+        ]
+
+        if self.audio_output is not None:
+            args.append(f"--aout={self.audio_output}")
+        if self.network_caching is not None:
+            args.append(f"--network-caching={self.network_caching}")
+        if self.file_caching is not None:
+            args.append(f"--file-caching={self.file_caching}")
+
+        if self.verbosity > 0:
+            args.append("-" + "v" * self.verbosity)
+        else:
+            args.append("--quiet")
+
+        return args
+
+    def degraded_media_options(self) -> tp.List[str]:
+        # Resampler belongs to audio output of player, media options don't
+        # reach it. They are read by input, so throttled device gets bigger
+        # buffers to ride out CPU stalls without underruns.
+        network_caching = self.network_caching or DEFAULT_NETWORK_CACHING
+        file_caching = self.file_caching or DEFAULT_FILE_CACHING
+        return [
+            f":network-caching={network_caching * DEGRADED_CACHING_FACTOR}",
+            f":file-caching={file_caching * DEGRADED_CACHING_FACTOR}",
+        ]
+
+
+PROFILES = {
+    profile.name: profile
+    for profile in (
+        EngineProfile(
+            name="default",
+            description="Options bot always used, cheapest speex resampling",
+        ),
+        EngineProfile(
+            name="low-power",
+            description="Pi Zero: plain ALSA without sound server, big buffers",
+            audio_output="alsa",
+            network_caching=5000,
+            file_caching=2000,
+            verbosity=0,
+        ),
+        EngineProfile(
+            name="quality",
+            description="Pi 4 and better: high quality soxr resampling",
+            resampler="soxr",
+            resampler_quality=3,
+            network_caching=2000,
+        ),
+        EngineProfile(
+            name="debug",
+            description="Default options with all libvlc debug messages",
+            verbosity=2,
+        ),
+    )
+}
+
+
+def get_profile(name: str) -> EngineProfile:
+    profile = PROFILES.get(name)
+    if profile is None:
+        raise ValueError(
+            f"Unknown engine profile '{name}', known are: {', '.join(PROFILES)}"
+        )
+    return profile
+
+
+def profile_from_env() -> EngineProfile:
+    return get_profile(os.getenv(ENGINE_PROFILE_ENV, "default"))
+
+
+if __name__ == "__main__":
+    import argparse
+    import ctypes
+    import ctypes.util
+    import json
+    import resource
+    import subprocess
+    import sys
+    import threading
+    import time
+
+    # Messages libvlc prints when audio output runs dry or is late
+    UNDERRUN_MARKERS = (
+        "buffer too late",
+        "buffer way too late",
+        "playback too late",
+        "underflow",
+        "underrun",
+        "discontinuity",
+    )
+
+    def run_profile(name: str, path: str, seconds: float, null_output: bool):
+        # Executed in child process, so rusage covers single profile only
+        import vlc
+
+        args = get_profile(name).vlc_args()
+        if null_output:
+            args += ["--aout=afile", f"--audiofile-file={os.devnull}"]
+        instance = vlc.Instance(args)
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c"))
+        underruns = 0
+
+        @vlc.CallbackDecorators.LogCb
+        def count_underruns(data, level, ctx, fmt, va_list):
+            nonlocal underruns
+            buffer = ctypes.create_string_buffer(1024)
+            libc.vsnprintf(
+                buffer, len(buffer), fmt, ctypes.cast(va_list, ctypes.c_void_p)
+            )
+            message = buffer.value.decode("utf-8", "replace").lower()
+            if any(marker in message for marker in UNDERRUN_MARKERS):
+                underruns += 1
+
+        instance.log_set(count_underruns, None)
+
+        player = instance.media_player_new()
+        player.set_media(instance.media_new(path))
+
+        finished = threading.Event()
+        events = player.event_manager()
+        for event_type in (
+            vlc.EventType.MediaPlayerEndReached,
+            vlc.EventType.MediaPlayerEncounteredError,
+        ):
+            events.event_attach(event_type, lambda _: finished.set())
+
+        before = resource.getrusage(resource.RUSAGE_SELF)
+        started = time.monotonic()
+        player.play()
+        finished.wait(seconds)
+        player.stop()
+        elapsed = time.monotonic() - started
+        after = resource.getrusage(resource.RUSAGE_SELF)
+
+        instance.log_unset()
+
+        print(
+            json.dumps(
+                {
+                    "elapsed": elapsed,
+                    "cpu": (after.ru_utime - before.ru_utime)
+                    + (after.ru_stime - before.ru_stime),
+                    "voluntary": after.ru_nvcsw - before.ru_nvcsw,
+                    "involuntary": after.ru_nivcsw - before.ru_nivcsw,
+                    "underruns": underruns,
+                }
+            )
+        )
+
+    parser = argparse.ArgumentParser(
+        description="Plays local file under every engine profile and reports "
+        "CPU time, wakeups (context switches) and underruns."
+    )
+    parser.add_argument("path", help="Local audio file")
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--profiles", default=",".join(PROFILES))
+    parser.add_argument(
+        "--null-output",
+        action="store_true",
+        help="Write audio to /dev/null instead of real device",
+    )
+    parser.add_argument("--run-profile", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_profile is not None:
+        run_profile(args.run_profile, args.path, args.seconds, args.null_output)
+        sys.exit(0)
+
+    print(
+        f"{'profile':<12} {'cpu, s':>8} {'cpu, %':>7} "
+        f"{'wakeups/s':>10} {'preempt/s':>10} {'underruns':>10}"
+    )
+    for name in args.profiles.split(","):
+        get_profile(name)
+
+        command = [
+            sys.executable,
+            "-m",
+            "multimedia.engine_profiles",
+            args.path,
+            "--seconds",
+            str(args.seconds),
+            "--run-profile",
+            name,
+        ]
+        if args.null_output:
+            command.append("--null-output")
+
+        result = subprocess.run(
+            command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=False
+        )
+        if result.returncode != 0:
+            print(f"{name:<12} failed with code {result.returncode}")
+            continue
+
+        # Short file may end before requested time
+        stats = json.loads(result.stdout.decode().strip().splitlines()[-1])
+        elapsed = stats["elapsed"]
+        print(
+            f"{name:<12} {stats['cpu']:>8.2f} {stats['cpu'] * 100 / elapsed:>7.1f} "
+            f"{stats['voluntary'] / elapsed:>10.1f} "
+            f"{stats['involuntary'] / elapsed:>10.1f} "
+            f"{stats['underruns']:>10}"
+        )
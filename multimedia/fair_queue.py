@@ -0,0 +1,109 @@
+import collections
+import heapq
+import itertools
+import typing as tp
+
+T = tp.TypeVar("T")
+Requester = tp.Hashable
+
+
+# Weighted fair queue. Every requester has own FIFO, heads of queues are
+# ordered by virtual finish time, so each pick costs O(log requesters).
+# Requesters with equal weights are served round-robin.
+class FairQueue(tp.Generic[T]):
+    def __init__(self):
+        self._queues: tp.Dict[Requester, tp.Deque[T]] = {}
+        self._weights: tp.Dict[Requester, float] = {}
+
+        # (virtual finish time of queue head, activation order, requester)
+        self._heap: tp.List[tp.Tuple[float, int, Requester]] = []
+        self._activations = itertools.count()
+        self._virtual_time = 0.0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def set_weight(self, requester: Requester, weight: float):
+        # Applied to items picked after the call
+        if weight <= 0:
+            raise ValueError(f"Weight must be positive, got {weight}")
+        self._weights[requester] = weight
+
+    def push(self, requester: Requester, items: tp.Iterable[T]):
+        items = list(items)
+        if not items:
+            return
+
+        queue = self._queues.get(requester)
+        if queue is None:
+            queue = self._queues[requester] = collections.deque()
+
+        was_idle = not queue
+        queue.extend(items)
+        self._size += len(items)
+
+        if was_idle:
+            # Idle requester doesn't accumulate credit while it was away
+            heapq.heappush(
+                self._heap,
+                (
+                    self._virtual_time + self._cost(requester),
+                    next(self._activations),
+                    requester,
+                ),
+            )
+
+    def peek(self) -> T:
+        _, _, requester = self._heap[0]
+        return self._queues[requester][0]
+
+    def pop(self) -> T:
+        finish, activation, requester = heapq.heappop(self._heap)
+        queue = self._queues[requester]
+        item = queue.popleft()
+        self._size -= 1
+        self._virtual_time = finish
+
+        if queue:
+            heapq.heappush(
+                self._heap, (finish + self._cost(requester), activation, requester)
+            )
+        else:
+            del self._queues[requester]
+
+        return item
+
+    def move_to_front(self, requester: Requester, item: T):
+        # Item goes first within its requester queue, O(n) of that queue
+        queue = self._queues[requester]
+        queue.remove(item)
+        queue.appendleft(item)
+
+    def ordered(self, limit: tp.Optional[int] = None) -> tp.List[T]:
+        # Order in which items are going to be popped, queue isn't changed
+        heap = list(self._heap)
+        iterators = {r: iter(q) for r, q in self._queues.items()}
+        left = {r: len(q) for r, q in self._queues.items()}
+
+        result = []
+        while heap and (limit is None or len(result) < limit):
+            finish, activation, requester = heapq.heappop(heap)
+            result.append(next(iterators[requester]))
+
+            left[requester] -= 1
+            if left[requester]:
+                heapq.heappush(
+                    heap, (finish + self._cost(requester), activation, requester)
+                )
+
+        return result
+
+    def clear(self):
+        self._queues.clear()
+        self._heap.clear()
+        self._size = 0
+
+    def _cost(self, requester: Requester) -> float:
+        return 1.0 / self._weights.get(requester, 1.0)
+
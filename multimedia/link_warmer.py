@@ -0,0 +1,159 @@
+import asyncio
+import collections
+import dataclasses
+import logging
+import time
+import typing as tp
+
+import diagnostics
+from multimedia.media import Media
+from multimedia.mrl import normalize_mrl
+
+logger = logging.getLogger(__name__)
+
+Resolver = tp.Callable[[str], tp.Awaitable[tp.List[Media]]]
+
+# Big playlists hold too many libvlc medias to keep them just in case
+MAX_WARMED_MEDIAS = 50
+
+
+@dataclasses.dataclass()
+class WarmedLink:
+    medias: tp.List[Media]
+    warmed_at: float
+
+
+class LinkWarmer:
+    # Resolves links posted in chat before anybody asks to play them.
+    # Links are resolved one by one with a pause in between, so real
+    # additions are never delayed much, and at most `budget` links are
+    # accepted per `budget_period` seconds. Resolved medias are handed
+    # over once with take(), link in progress is awaited there.
+    def __init__(
+        self,
+        resolver: Resolver,
+        capacity: int = 32,
+        max_pending: int = 16,
+        budget: int = 30,
+        budget_period: float = 600.0,
+        ttl: float = 600.0,
+        delay: float = 1.0,
+    ):
+        self._resolver = resolver
+        self._capacity = capacity
+        self._max_pending = max_pending
+        self._budget = budget
+        self._budget_period = budget_period
+        self._ttl = ttl
+        self._delay = delay
+
+        # Keys are normalized mrls, values are links as they were posted
+        self._pending: tp.OrderedDict[str, str] = collections.OrderedDict()
+        self._resolving: tp.Dict[str, asyncio.Future] = {}
+        # Ordered from oldest to newest
+        self._cache: tp.OrderedDict[str, WarmedLink] = collections.OrderedDict()
+        self._accepted: tp.Deque[float] = collections.deque()
+
+        self._wakeup = asyncio.Event()
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+        self._worker_task: tp.Optional[asyncio.Task] = None
+
+    def start(self):
+        self._worker_task = asyncio.create_task(self._worker())
+
+    def stop(self):
+        if self._worker_task is not None:
+            self._worker_task.cancel()
+            self._worker_task = None
+
+    @property
+    def paused(self) -> bool:
+        return not self._resumed.is_set()
+
+    def pause(self):
+        # Link in progress is finished, next ones wait for resume
+        self._resumed.clear()
+
+    def resume(self):
+        self._resumed.set()
+
+    def schedule(self, url: str) -> bool:
+        key = normalize_mrl(url)
+        if key in self._pending or key in self._resolving or key in self._cache:
+            return True
+
+        now = time.monotonic()
+        while self._accepted and self._accepted[0] < now - self._budget_period:
+            self._accepted.popleft()
+        if len(self._accepted) >= self._budget:
+            return False
+        self._accepted.append(now)
+
+        # Newer links are more likely to be played, oldest one is dropped
+        if len(self._pending) >= self._max_pending:
+            self._pending.popitem(last=False)
+        self._pending[key] = url
+        self._wakeup.set()
+        return True
+
+    async def take(self, url: str) -> tp.Optional[tp.List[Media]]:
+        # Medias of warmed link, None if caller has to resolve it itself
+        key = normalize_mrl(url)
+
+        # Not started yet, caller resolves it right away instead
+        self._pending.pop(key, None)
+
+        resolving = self._resolving.get(key)
+        if resolving is not None:
+            await asyncio.shield(resolving)
+
+        warmed = self._cache.pop(key, None)
+        if warmed is None or warmed.warmed_at < time.monotonic() - self._ttl:
+            return None
+
+        return warmed.medias
+
+    async def _worker(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            while self._pending:
+                await self._resumed.wait()
+                if not self._pending:
+                    break
+
+                key, url = self._pending.popitem(last=False)
+                await self._warm(key, url)
+
+                # Giving way to requests, that somebody waits for
+                await asyncio.sleep(self._delay)
+
+    async def _warm(self, key: str, url: str):
+        resolving = asyncio.get_running_loop().create_future()
+        self._resolving[key] = resolving
+        started = time.monotonic()
+        try:
+            medias = await self._resolver(url)
+        except Exception as e:
+            diagnostics.record("link.warm", url=url, error=repr(e))
+            logger.warning("Unable to warm up '%s'", url, exc_info=True)
+            return
+        finally:
+            del self._resolving[key]
+            resolving.set_result(None)
+
+        diagnostics.record(
+            "link.warm",
+            url=url,
+            medias=len(medias),
+            elapsed=round(time.monotonic() - started, 3),
+        )
+        if not medias or len(medias) > MAX_WARMED_MEDIAS:
+            return
+
+        self._cache[key] = WarmedLink(medias=medias, warmed_at=time.monotonic())
+        while len(self._cache) > self._capacity:
+            self._cache.popitem(last=False)
+        logger.info("Warmed up '%s' with %d medias", url, len(medias))
@@ -0,0 +1,155 @@
+import asyncio
+import typing as tp
+import logging
+import os
+import re
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlparse, unquote
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+# EBU R128 recommends -23 LUFS, but music services normalize to about -14.
+TARGET_LOUDNESS_LUFS = -14.0
+
+# Never boost quiet tracks too much, it only brings up noise.
+MAX_GAIN_DB = 10.0
+MIN_GAIN_DB = -20.0
+
+INTEGRATED_LOUDNESS_RE = re.compile(r"I:\s+(-?[0-9.]+)\s+LUFS")
+
+
+def local_path_from_mrl(mrl: str) -> tp.Optional[str]:
+    parsed = urlparse(mrl)
+    if parsed.scheme == "file":
+        return unquote(parsed.path)
+    if parsed.scheme == "":
+        return mrl
+    return None
+
+
+def measure_integrated_loudness(path: str) -> tp.Optional[float]:
+    # Executed inside of worker process. Decoding is done by ffmpeg,
+    # we only have to find summary line of ebur128 filter.
+    result = subprocess.run(
+        [
+            "ffmpeg",
+            "-nostats",
+            "-hide_banner",
+            "-i",
+            path,
+            "-vn",
+            "-af",
+            "ebur128",
+            "-f",
+            "null",
+            "-",
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        check=False,
+    )
+
+    matches = INTEGRATED_LOUDNESS_RE.findall(result.stderr.decode("utf-8", "replace"))
+    if not matches:
+        return None
+
+    # Last match is the summary for the whole track
+    return float(matches[-1])
+
+
+class LoudnessAnalyzer:
+    def __init__(self, database: Database, max_workers: int = 1):
+        self._database = database
+        self._max_workers = max_workers
+        self._executor: tp.Optional[ProcessPoolExecutor] = None
+        self._disabled = False
+
+        self._cache: tp.Dict[str, float] = {}
+        self._pending: tp.Dict[str, asyncio.Task] = {}
+
+        # Tracks scheduled while paused, mrl to path
+        self._paused = False
+        self._deferred: tp.Dict[str, str] = {}
+
+    def schedule(self, mrl: str, path: tp.Optional[str] = None):
+        # `path` may point to local copy of remote mrl
+        if path is None:
+            path = local_path_from_mrl(mrl)
+
+        if path is None or self._disabled:
+            return
+
+        if mrl in self._cache or mrl in self._pending:
+            return
+
+        if self._paused:
+            self._deferred[mrl] = path
+            return
+
+        task = asyncio.create_task(self._analyze(mrl, path))
+        self._pending[mrl] = task
+        task.add_done_callback(lambda _: self._pending.pop(mrl, None))
+
+    def pause(self):
+        # Running analysis is finished, new ones wait for resume
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+        deferred, self._deferred = self._deferred, {}
+        for mrl, path in deferred.items():
+            self.schedule(mrl, path)
+
+    async def gain_for(self, mrl: str) -> float:
+        loudness = await self._cached_loudness(mrl)
+        if loudness is None:
+            return 0.0
+
+        return sorted((MIN_GAIN_DB, TARGET_LOUDNESS_LUFS - loudness, MAX_GAIN_DB))[1]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _cached_loudness(self, mrl: str) -> tp.Optional[float]:
+        if mrl in self._cache:
+            return self._cache[mrl]
+
+        loudness = await self._database.fetch_track_loudness(mrl)
+        if loudness is not None:
+            self._cache[mrl] = loudness
+        return loudness
+
+    async def _analyze(self, mrl: str, path: str):
+        try:
+            if await self._cached_loudness(mrl) is not None:
+                return
+
+            if self._executor is None:
+                # Workers are niced, so playback and event loop always win
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self._max_workers,
+                    initializer=os.nice,
+                    initargs=(10,),
+                )
+
+            loudness = await asyncio.get_running_loop().run_in_executor(
+                self._executor, measure_integrated_loudness, path
+            )
+
+            if loudness is None:
+                logger.warning("Unable to measure loudness of '%s'", mrl)
+                return
+
+            logger.info("Integrated loudness of '%s' is %.1f LUFS", mrl, loudness)
+            self._cache[mrl] = loudness
+            await self._database.set_track_loudness(mrl, loudness)
+        except FileNotFoundError:
+            logger.error("ffmpeg is not available, loudness analysis is disabled")
+            self._disabled = True
+        except Exception:
+            logger.error("Loudness analysis of '%s' failed", mrl, exc_info=True)
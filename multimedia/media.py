@@ -2,15 +2,20 @@ import asyncio
 import typing as tp
 import logging
 import enum
+import time
 
 import vlc
 from async_property import async_property
 
+import diagnostics
+
 from multimedia.utils import (
     vlc_flags_or,
-    wrap_vlc_event,
+    VlcEventHub,
 )
 
+logger = logging.getLogger(__name__)
+
 
 class MediaType(enum.Enum):
     Unknown = 0
@@ -21,15 +26,52 @@ class MediaType(enum.Enum):
     Playlist = 5
 
 
+class ParseState(enum.Enum):
+    Pending = enum.auto()
+    Done = enum.auto()
+    Failed = enum.auto()
+    Timeout = enum.auto()
+
+
+# Skipped means there was nothing to parse (e.g. stream without metadata)
+PARSED_STATUS_STATES = {
+    vlc.MediaParsedStatus.skipped.value: ParseState.Done,
+    vlc.MediaParsedStatus.done.value: ParseState.Done,
+    vlc.MediaParsedStatus.failed.value: ParseState.Failed,
+    vlc.MediaParsedStatus.timeout.value: ParseState.Timeout,
+}
+
+# libvlc enforces parse timeout itself, its event is awaited a bit longer
+PARSE_EVENT_GRACE = 2.0
+
+
 class Media:
-    def __init__(self, mrl: str, from_vlc_media: tp.Optional[vlc.Media] = None):
+    # Seconds, None disables timeout
+    parse_timeout: tp.Optional[float] = 15.0
+
+    def __init__(
+        self,
+        mrl: str,
+        from_vlc_media: tp.Optional[vlc.Media] = None,
+        title: tp.Optional[str] = None,
+        artist: tp.Optional[str] = None,
+        duration: tp.Optional[int] = None,
+    ):
         if from_vlc_media is None:
             self._base_url = mrl
             self._media = vlc.Media(mrl)
         else:
             self._base_url = from_vlc_media.get_mrl()
             self._media = from_vlc_media
-        self._metadata_loading_future: asyncio.Future = None
+        self._parse_future: tp.Optional[asyncio.Future] = None
+        self._parse_state = ParseState.Pending
+        self._subitems: tp.Optional[tp.List["Media"]] = None
+
+        # Metadata, that is already known (e.g. stored in database).
+        # It's returned without parsing media.
+        self._title = title
+        self._artist = artist
+        self._duration = duration
 
     @property
     def vlc_media(self) -> vlc.Media:
@@ -39,8 +81,36 @@ class Media:
     def mrl(self) -> str:
         return self._base_url
 
+    @property
+    def parse_state(self) -> ParseState:
+        return self._parse_state
+
+    @property
+    def known_metadata(
+        self,
+    ) -> tp.Tuple[tp.Optional[str], tp.Optional[str], tp.Optional[int]]:
+        # Title, artist and duration known so far, media is never parsed here
+        title = self._title
+        if title is None:
+            title = self._media.get_meta(vlc.Meta.Title)
+
+        artist = self._artist
+        if artist is None:
+            artist = self._media.get_meta(vlc.Meta.Artist)
+
+        duration = self._duration
+        if duration is None and self._parse_state == ParseState.Done:
+            vlc_duration = self._media.get_duration()
+            if vlc_duration >= 0:
+                duration = int(vlc_duration / 1000)
+
+        return title, artist, duration
+
     @async_property
     async def media_title(self) -> tp.Optional[str]:
+        if self._title is not None:
+            return self._title
+
         title = self._media.get_meta(vlc.Meta.Title)
         if title is None:
             await self.load_metadata()
@@ -49,6 +119,9 @@ class Media:
 
     @async_property
     async def media_artist(self) -> tp.Optional[str]:
+        if self._artist is not None:
+            return self._artist
+
         artist = self._media.get_meta(vlc.Meta.Artist)
         if artist is None:
             await self.load_metadata()
@@ -57,21 +130,52 @@ class Media:
         return artist
 
     @async_property
-    async def subitems(self) -> vlc.MediaList:
+    async def media_duration(self) -> tp.Optional[int]:
+        if self._duration is not None:
+            return self._duration
+
         await self.load_metadata()
+        duration = self._media.get_duration()
+        if duration < 0:
+            return None
+        return int(duration / 1000)
+
+    @async_property
+    async def subitems(self) -> tp.List["Media"]:
+        # Wrappers are created once, so callers get the same objects
+        if self._subitems is None:
+            await self.load_metadata()
 
-        return [
-            Media(None, from_vlc_media=vlc_med) for vlc_med in self._media.subitems()
-        ]
+        if self._subitems is None:
+            self._subitems = [
+                Media(None, from_vlc_media=vlc_med)
+                for vlc_med in self._media.subitems()
+            ]
 
-    async def load_metadata(self):
-        if self._metadata_loading_future is None:
-            # Await parsing finished event
-            ev = self._media.event_manager()
-            self._metadata_loading_future = wrap_vlc_event(
-                ev, vlc.EventType.MediaParsedChanged
-            )
+        return self._subitems
+
+    async def load_metadata(self, retry: bool = False) -> ParseState:
+        if retry and self._parse_state == ParseState.Timeout:
+            # Timed out media is parsed again from scratch
+            self._media = vlc.Media(self._base_url)
+            self._parse_future = None
+            self._parse_state = ParseState.Pending
+            self._subitems = None
+
+        if self._parse_future is None:
+            self._parse_future = asyncio.ensure_future(self._parse())
 
+        # Parsing is shared, cancelled caller must not cancel it for others
+        return await asyncio.shield(self._parse_future)
+
+    async def _parse(self) -> ParseState:
+        # Await parsing finished event
+        events = VlcEventHub(self._media.event_manager())
+        parsed = events.wait(vlc.EventType.MediaParsedChanged)
+
+        timeout = self.parse_timeout
+        started = time.monotonic()
+        if (
             self._media.parse_with_options(
                 vlc_flags_or(
                     vlc.MediaParseFlag.local,
@@ -79,7 +183,35 @@ class Media:
                     vlc.MediaParseFlag.network,
                     vlc.MediaParseFlag.fetch_network,
                 ),
-                timeout=-1,
+                timeout=-1 if timeout is None else int(timeout * 1000),
+            )
+            != 0
+        ):
+            parsed.cancel()
+            self._parse_state = ParseState.Failed
+        else:
+            try:
+                await asyncio.wait_for(
+                    parsed,
+                    None if timeout is None else timeout + PARSE_EVENT_GRACE,
+                )
+                self._parse_state = PARSED_STATUS_STATES.get(
+                    self._media.get_parsed_status().value, ParseState.Failed
+                )
+            except asyncio.TimeoutError:
+                self._media.parse_stop()
+                self._parse_state = ParseState.Timeout
+
+        diagnostics.record(
+            "media.parse",
+            mrl=self._base_url,
+            state=self._parse_state.name,
+            elapsed=round(time.monotonic() - started, 3),
+        )
+
+        if self._parse_state != ParseState.Done:
+            logger.warning(
+                "Parsing '%s' finished with %s", self._base_url, self._parse_state.name
             )
 
-        await self._metadata_loading_future
+        return self._parse_state
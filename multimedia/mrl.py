@@ -0,0 +1,46 @@
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Yandex Music serves same tracks on both domains
+YANDEX_MUSIC_HOSTS = {"music.yandex.ru", "music.yandex.com"}
+YANDEX_MUSIC_HOST = "music.yandex.ru"
+
+# Query parameters, which don't change content behind link
+IGNORED_QUERY_PARAMS = {
+    "access_token",
+    "utm_source",
+    "utm_medium",
+    "utm_campaign",
+    "utm_content",
+    "utm_term",
+    "si",
+}
+
+
+def normalize_mrl(mrl: str) -> str:
+    # Key for duplicate detection only, it's never passed to libvlc
+    mrl = mrl.strip()
+    parts = urlsplit(mrl)
+    if not parts.scheme or not parts.netloc:
+        # Local path or something, that isn't url
+        return mrl.rstrip("/") or mrl
+
+    scheme = parts.scheme.lower()
+    if scheme == "http":
+        scheme = "https"
+
+    host = parts.netloc.lower()
+    if host.startswith("www."):
+        host = host[len("www.") :]
+    if host in YANDEX_MUSIC_HOSTS:
+        host = YANDEX_MUSIC_HOST
+
+    query = urlencode(
+        sorted(
+            (name, value)
+            for name, value in parse_qsl(parts.query, keep_blank_values=True)
+            if name not in IGNORED_QUERY_PARAMS
+        )
+    )
+
+    return urlunsplit((scheme, host, parts.path.rstrip("/"), query, ""))
+
@@ -1,17 +1,17 @@
 import asyncio
+import ctypes
+import dataclasses
 import typing as tp
 import logging
 import enum
-from functools import reduce
+import time
 
 import vlc
-from async_property import async_property
 
-from multimedia.utils import (
-    vlc_flags_or,
-    wrap_vlc_event,
-)
-from .media import Media
+import diagnostics
+from multimedia.utils import VlcEventHub
+from .media import Media, ParseState
+from .prefetch_cache import PrefetchCache
 
 logger = logging.getLogger(__name__)
 
@@ -28,32 +28,142 @@ class PlayerState(enum.Enum):
     Paused = enum.auto()
 
 
+# Buffering events are also emitted while paused, so they are not
+# treated as state transitions.
+STATE_EVENTS = {
+    vlc.EventType.MediaPlayerOpening: PlayerState.Playing,
+    vlc.EventType.MediaPlayerPlaying: PlayerState.Playing,
+    vlc.EventType.MediaPlayerPaused: PlayerState.Paused,
+    vlc.EventType.MediaPlayerStopped: PlayerState.Stopped,
+    vlc.EventType.MediaPlayerEndReached: PlayerState.Stopped,
+    vlc.EventType.MediaPlayerEncounteredError: PlayerState.Stopped,
+}
+
+# Player forgets media only when it finished by itself. Explicit stop()
+# clears it on its own, so late Stopped event can't wipe next media.
+MEDIA_FINISHED_EVENTS = {
+    vlc.EventType.MediaPlayerEndReached,
+    vlc.EventType.MediaPlayerEncounteredError,
+}
+
+# Slow stream api shouldn't hold next track, libvlc resolves page then
+STREAM_RESOLVE_TIMEOUT = 3.0
+
+# libvlc reports position about every 250 ms, in between it's advanced
+# by monotonic clock. Older report means stall, it isn't extrapolated.
+POSITION_REPORT_TTL = 0.5
+
+
+@dataclasses.dataclass(frozen=True)
+class PlayerSnapshot:
+    # Incremented on every change, cheap way to detect that state changed
+    version: int
+    state: PlayerState
+    media: tp.Optional[Media]
+    cursor: int
+    length: int
+    volume: int
+
+
+SnapshotCallback = tp.Callable[[PlayerSnapshot], None]
+
+# Direct stream url for mrl, None when mrl is played as is
+StreamResolver = tp.Callable[[str], tp.Awaitable[tp.Optional[str]]]
+
+
+def _extract_time(event: vlc.Event) -> float:
+    return event.u.new_time / 1000
+
+
+def _extract_length(event: vlc.Event) -> int:
+    return int(event.u.new_length / 1000)
+
+
+def _extract_audio_volume(event: vlc.Event) -> float:
+    u = ctypes.cast(ctypes.pointer(event.u), ctypes.POINTER(vlc.Event.U)).contents
+    return u.media_player_audio_volume.volume
+
+
 class Player:
-    def __init__(self):
+    def __init__(
+        self,
+        prefetch_cache: tp.Optional[PrefetchCache] = None,
+        stream_resolver: tp.Optional[StreamResolver] = None,
+    ):
         self._player: vlc.MediaPlayer = vlc.MediaPlayer()
-        self._current_media: tp.Optional[Media] = None
-        self._volume = 100
+        self._prefetch_cache = prefetch_cache
+        self._stream_resolver = stream_resolver
+        self._gain_db = 0.0
+        # Volume, which was last set to libvlc, in percents
+        self._applied_volume = 0
+        self._media_options: tp.List[str] = []
+        self._snapshot_callbacks: tp.List[SnapshotCallback] = []
+        # Last reported position and monotonic time it was received at
+        self._position_report: tp.Optional[tp.Tuple[float, float]] = None
+        self._playing: tp.Optional[asyncio.Future] = None
+
+        self._snapshot = PlayerSnapshot(
+            version=0,
+            state=PlayerState.Stopped,
+            media=None,
+            cursor=0,
+            length=0,
+            volume=100,
+        )
 
         # Setting up player object
-        self._player.audio_set_volume(self._volume)
-        loop = asyncio.get_event_loop()
-
-        ev: vlc.EventManager = self._player.event_manager()
-        ev.event_attach(
-            vlc.EventType.MediaPlayerEndReached,
-            lambda ev: loop.call_soon_threadsafe(self.on_media_player_end_reached),
+        self._apply_volume()
+
+        # Snapshot is maintained from events, so readers never cross ctypes
+        self._events = VlcEventHub(self._player.event_manager())
+        for event_type, state in STATE_EVENTS.items():
+            self._events.subscribe(
+                event_type,
+                lambda _, state=state, finished=(
+                    event_type in MEDIA_FINISHED_EVENTS
+                ): self._on_state_event(state, finished),
+            )
+        self._events.subscribe(
+            vlc.EventType.MediaPlayerTimeChanged,
+            self._on_time_changed,
+            extract=_extract_time,
         )
+        self._events.subscribe(
+            vlc.EventType.MediaPlayerLengthChanged,
+            lambda length: self._update_snapshot(length=length),
+            extract=_extract_length,
+        )
+        self._events.subscribe(
+            vlc.EventType.MediaPlayerAudioVolume,
+            self._on_audio_volume,
+            extract=_extract_audio_volume,
+        )
+
+    @property
+    def snapshot(self) -> PlayerSnapshot:
+        return self._snapshot
+
+    def add_snapshot_callback(self, callback: SnapshotCallback):
+        # Called in event loop thread after every change of snapshot
+        self._snapshot_callbacks.append(callback)
+
+    @property
+    def events(self) -> VlcEventHub:
+        return self._events
 
     async def wait_until_end_reached(self):
-        ev: vlc.EventManager = self._player.event_manager()
-        await wrap_vlc_event(ev, vlc.EventType.MediaPlayerEndReached)
+        await self._events.wait(vlc.EventType.MediaPlayerEndReached)
+
+    async def wait_until_playing(self):
+        # Snapshot is Playing right after play(), libvlc gets there later
+        if self._playing is not None:
+            await asyncio.shield(self._playing)
 
     async def pause(self):
         if self.state != PlayerState.Playing:
             return
 
-        ev: vlc.EventManager = self._player.event_manager()
-        fut = wrap_vlc_event(ev, vlc.EventType.MediaPlayerPaused)
+        fut = self._events.wait(vlc.EventType.MediaPlayerPaused)
 
         self._player.set_pause(True)
 
@@ -62,75 +172,187 @@ class Player:
     async def resume(self):
         if self.state != PlayerState.Paused:
             return
-        ev: vlc.EventManager = self._player.event_manager()
-        fut = wrap_vlc_event(ev, vlc.EventType.MediaPlayerPlaying)
+
+        fut = self._events.wait(vlc.EventType.MediaPlayerPlaying)
 
         self._player.set_pause(False)
 
         await fut
 
-    async def play(self, media: Media):
-        logger.info(f"Playing '{media.mrl}'")
+    async def play(self, media: Media, gain_db: float = 0.0):
+        logger.info(f"Playing '{media.mrl}' with {gain_db:+.1f} dB gain")
 
         # Attempting to load metadata before play
-        await media.load_metadata()
+        if await media.load_metadata() == ParseState.Failed:
+            logger.warning(f"Unable to play '{media.mrl}', it can't be parsed")
+            return False
 
         # If there is subitems - add them.
-        if await media.subitems:
-            media = (await media.subitems)[0]
+        subitems = await media.subitems
+        if subitems:
+            media = subitems[0]
 
         # Set current media
-        self._current_media = media
-
-        # Set media to player
-        self._player.set_media(self._current_media.vlc_media)
+        self._update_snapshot(media=media, cursor=0, length=0)
+
+        # Set media to player. Prefer downloaded copy of remote media,
+        # then direct stream, so libvlc doesn't resolve page on its own.
+        local_mrl = None
+        if self._prefetch_cache is not None:
+            local_mrl = self._prefetch_cache.lookup(media.mrl)
+
+        stream_mrl = None
+        if local_mrl is None and self._stream_resolver is not None:
+            try:
+                stream_mrl = await asyncio.wait_for(
+                    self._stream_resolver(media.mrl), STREAM_RESOLVE_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                logger.warning(f"Stream of '{media.mrl}' isn't resolved in time")
+            except Exception:
+                # Any resolver may fail, queue must keep playing anyway
+                logger.error(
+                    f"Unable to resolve stream of '{media.mrl}'", exc_info=True
+                )
+
+        if local_mrl is not None:
+            logger.info(f"Playing prefetched copy '{local_mrl}'")
+            vlc_media = vlc.Media(local_mrl)
+        elif stream_mrl is not None:
+            logger.info(f"Playing direct stream of '{media.mrl}'")
+            vlc_media = vlc.Media(stream_mrl)
+        else:
+            vlc_media = media.vlc_media
+
+        # Options can't be removed from media, so cached one is kept clean
+        # and copy of it is played
+        if self._media_options and vlc_media is media.vlc_media:
+            vlc_media = vlc_media.duplicate()
+        for option in self._media_options:
+            vlc_media.add_option(option)
+        self._player.set_media(vlc_media)
+
+        # Per track normalization is applied on top of user volume
+        self._gain_db = gain_db
+        self._apply_volume()
 
         # Playing...
-        return self._player.play() == 0
+        self._position_report = None
+        if self._playing is not None:
+            self._playing.cancel()
+        self._playing = self._events.wait(vlc.EventType.MediaPlayerPlaying)
+        if self._player.play() != 0:
+            return False
+
+        # Opening event is emitted later, but callers rely on state right away
+        self._update_snapshot(state=PlayerState.Playing)
+        return True
+
+    def set_media_options(self, options: tp.List[str]):
+        # Applied starting with next track, playing one isn't interrupted
+        self._media_options = list(options)
 
     async def stop(self):
-        self._current_media = None
+        self._update_snapshot(state=PlayerState.Stopped, media=None)
         self._player.stop()
 
     @property
     def volume(self):
-        return self._volume
+        return self._snapshot.volume
 
     @volume.setter
     def volume(self, new_val):
-        self._volume = new_val
-        self._player.audio_set_volume(new_val)
+        self._update_snapshot(volume=new_val)
+        self._apply_volume()
 
     @property
     def cursor(self):
-        return int(self._player.get_time() / 1000)
+        return self._snapshot.cursor
 
     @cursor.setter
-    def cursor(self, new_val: int):
+    def cursor(self, new_val: float):
         self._player.set_time(int(new_val * 1000))
+        self._position_report = None
+        self._update_snapshot(cursor=int(new_val))
+
+    @property
+    def playback_time(self) -> float:
+        # Precise position in seconds, snapshot keeps whole seconds only
+        if self.state == PlayerState.Playing and self._position_report is not None:
+            position, received = self._position_report
+            elapsed = time.monotonic() - received
+            if elapsed < POSITION_REPORT_TTL:
+                return position + elapsed
+        return self._player.get_time() / 1000
 
     @property
     def length(self):
-        return int(self._player.get_length() / 1000)
+        return self._snapshot.length
 
     @property
     def current_media(self) -> tp.Optional[Media]:
-        return self._current_media
+        return self._snapshot.media
 
     @property
     def state(self) -> PlayerState:
-        status_mapping = {
-            vlc.State.Opening: PlayerState.Playing,
-            vlc.State.Buffering: PlayerState.Playing,
-            vlc.State.Playing: PlayerState.Playing,
-            vlc.State.Paused: PlayerState.Paused,
-            vlc.State.Stopped: PlayerState.Stopped,
-            vlc.State.Ended: PlayerState.Stopped,
-            vlc.State.Error: PlayerState.Stopped,
-            vlc.State.NothingSpecial: PlayerState.Stopped,
-        }
-
-        return status_mapping[self._player.get_state()]
-
-    def on_media_player_end_reached(self, event: vlc.Event):
-        self._current_media = None
+        return self._snapshot.state
+
+    def _update_snapshot(self, **changes):
+        if all(getattr(self._snapshot, k) == v for k, v in changes.items()):
+            return
+
+        previous = self._snapshot
+        self._snapshot = dataclasses.replace(
+            previous,
+            version=previous.version + 1,
+            **changes,
+        )
+
+        if self._snapshot.state != previous.state:
+            media = self._snapshot.media or previous.media
+            diagnostics.record(
+                "player.state",
+                previous=previous.state.name,
+                state=self._snapshot.state.name,
+                mrl=media.mrl if media is not None else None,
+            )
+
+        for callback in self._snapshot_callbacks:
+            callback(self._snapshot)
+
+    def _on_state_event(self, state: PlayerState, media_finished: bool):
+        if state != PlayerState.Playing:
+            # Position doesn't run, report is stale on resume
+            self._position_report = None
+        if media_finished:
+            self._update_snapshot(state=state, media=None, cursor=0, length=0)
+        elif self._snapshot.media is None and state != PlayerState.Stopped:
+            # Late event of media, which is already stopped
+            return
+        else:
+            self._update_snapshot(state=state)
+
+    def _on_time_changed(self, position: float):
+        self._position_report = (position, time.monotonic())
+        self._update_snapshot(cursor=int(position))
+
+    def _on_audio_volume(self, effective_volume: float):
+        # Echo of our own change. Clamped volume can't be reverted to
+        # user one, so it's recognized by last set value.
+        if abs(effective_volume * 100 - self._applied_volume) <= 1:
+            return
+
+        # Volume may be changed outside (e.g. by pulseaudio), reverting gain
+        user_volume = round(effective_volume * 100 / self._gain_factor())
+        if abs(user_volume - self._snapshot.volume) > 1:
+            self._update_snapshot(volume=sorted((0, user_volume, 100))[1])
+
+    def _gain_factor(self) -> float:
+        return 10 ** (self._gain_db / 20)
+
+    def _apply_volume(self):
+        gained_volume = round(self._snapshot.volume * self._gain_factor())
+
+        # libvlc allows to amplify up to 200%
+        self._applied_volume = sorted((0, gained_volume, 200))[1]
+        self._player.audio_set_volume(self._applied_volume)
@@ -1,48 +1,270 @@
 import typing as tp
 import logging
 import asyncio
-import random
+import enum
+import itertools
 
+from multimedia.fair_queue import FairQueue
+from multimedia.shuffle_queue import ShuffleQueue
 from multimedia.media import Media
+from multimedia.mrl import normalize_mrl
+from multimedia.playlist_entry import PlaylistEntry
 
 
 logger = logging.getLogger(__name__)
 
+ChangeCallback = tp.Callable[[], None]
+
+
+class DuplicatePolicy(enum.Enum):
+    Skip = "skip"
+    Allow = "allow"
+    MoveToFront = "front"
+
 
 class Playlist:
-    def __init__(self):
-        self._queue: tp.List[Media] = []
+    def __init__(self, window: int = 3):
+        self._queue: tp.List[PlaylistEntry] = []
 
-    async def add_content(self, mri: str) -> tp.List[Media]:
-        logger.info("Adding content with mri: '%s'", mri)
-        media = Media(mri)
+        # Fair mode replaces plain FIFO with per requester queues
+        self._fair: tp.Optional[FairQueue[PlaylistEntry]] = None
+        # Shuffle play draws next entry randomly, keeping order of queue
+        self._shuffle: tp.Optional[ShuffleQueue[PlaylistEntry]] = None
+        self._mode_order: tp.Tuple[int, tp.List[PlaylistEntry]] = (-1, [])
+
+        # Queued entries by normalized mrl and source link, for O(1)
+        # duplicate lookup before link is resolved
+        self._index: tp.Dict[str, tp.List[PlaylistEntry]] = {}
 
-        flatten_medias = await self._unwrap_media(media)
+        # Only entries at the head of queue keep libvlc media
+        self._window = window
+        self._materialized: tp.List[PlaylistEntry] = []
 
-        self._queue += flatten_medias
+        # Incremented on every change of queue
+        self._version = 0
+        self._change_callbacks: tp.List[ChangeCallback] = []
+
+    async def add_content(
+        self, mri: str, requester: tp.Optional[int] = None
+    ) -> tp.List[PlaylistEntry]:
+        logger.info("Adding content with mri: '%s'", mri)
+        flatten_medias = await self.resolve_content(mri)
+        entries = [PlaylistEntry.from_media(m, requester) for m in flatten_medias]
+
+        self._append(entries)
+        self._changed()
+        self._update_window(entries)
 
         logger.info(
-            "mri '%s' adds folowing medias: %s", mri, [m.mrl for m in flatten_medias]
+            "mri '%s' adds folowing medias: %s", mri, [e.mrl for e in entries]
         )
 
-        return flatten_medias
+        return entries
+
+    async def resolve_content(self, mri: str) -> tp.List[Media]:
+        # Medias, which mri adds, queue isn't changed
+        return await self._unwrap_media(Media(mri))
+
+    def add_entries(self, entries: tp.List[PlaylistEntry]) -> tp.List[PlaylistEntry]:
+        # Entries are already resolved, no parsing required
+        self._append(entries)
+        self._changed()
+        self._update_window(entries)
+
+        logger.info("Adding %d resolved medias", len(entries))
+
+        return entries
 
     def clear(self):
+        if self._fair is not None:
+            self._fair.clear()
+        if self._shuffle is not None:
+            self._shuffle.clear()
         self._queue.clear()
+        self._index.clear()
+        self._changed()
+        self._update_window()
+
+    def find_duplicate(self, mrl: str) -> tp.Optional[PlaylistEntry]:
+        entries = self._index.get(normalize_mrl(mrl))
+        return entries[0] if entries else None
+
+    def find_duplicates(self, mri: str) -> tp.List[PlaylistEntry]:
+        # Queued entries of link, all tracks of album for album link
+        return list(self._index.get(normalize_mrl(mri), ()))
 
-    def shuffle(self):
-        random.shuffle(self._queue)
+    def move_to_front(self, entry: PlaylistEntry):
+        # Entry is played next. In fair mode it's first of its requester.
+        if self._fair is not None:
+            self._fair.move_to_front(entry.requester, entry)
+        elif self._shuffle is not None:
+            self._shuffle.move_to_front(entry)
+        else:
+            self._queue.remove(entry)
+            self._queue.insert(0, entry)
+        self._changed()
+        self._update_window()
 
     @property
-    def items(self):
-        return self._queue
+    def is_fair(self) -> bool:
+        return self._fair is not None
+
+    def set_fair(self, enabled: bool):
+        if enabled == self.is_fair:
+            return
+
+        if enabled:
+            self.set_shuffle(False)
+            self._fair = FairQueue()
+            for requester, entries in itertools.groupby(
+                self._queue, key=lambda e: e.requester
+            ):
+                self._fair.push(requester, entries)
+            self._queue = []
+        else:
+            self._queue = self._fair.ordered()
+            self._fair = None
+
+        self._changed()
+        self._update_window()
 
     @property
-    def last(self):
+    def is_shuffled(self) -> bool:
+        return self._shuffle is not None
+
+    def set_shuffle(self, enabled: bool, seed: tp.Optional[int] = None):
+        # Enabling again with seed restarts random sequence
+        if not enabled and self._shuffle is None:
+            return
+
+        if enabled:
+            self.set_fair(False)
+            entries = self._queue
+            if self._shuffle is not None:
+                entries = self._shuffle.remaining()
+            self._shuffle = ShuffleQueue(entries, seed)
+            self._queue = []
+        else:
+            # Not played entries are back in order they were added
+            self._queue = self._shuffle.remaining()
+            self._shuffle = None
+
+        self._changed()
+        self._update_window()
+
+    def add_change_callback(self, callback: ChangeCallback):
+        self._change_callbacks.append(callback)
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def __len__(self) -> int:
+        if self._fair is not None:
+            return len(self._fair)
+        if self._shuffle is not None:
+            return len(self._shuffle)
+        return len(self._queue)
+
+    def head(self, count: int) -> tp.List[PlaylistEntry]:
+        # Next entries to play. Unlike items, it doesn't build whole order
+        # of special mode, so it's cheap to call on every pick.
+        if self._fair is not None:
+            return self._fair.ordered(limit=count)
+        if self._shuffle is not None:
+            return self._shuffle.head(count)
+        return self._queue[:count]
+
+    @property
+    def items(self) -> tp.List[PlaylistEntry]:
+        if self._shuffle is not None:
+            # Order grows with entries drawn by head, so it isn't cached
+            return self._shuffle.ordered()
+        if self._fair is None:
+            return self._queue
+
+        # Order of fair mode is built once per queue change
+        version, order = self._mode_order
+        if version != self._version:
+            order = self._fair.ordered()
+            self._mode_order = (self._version, order)
+        return order
+
+    @property
+    def last(self) -> PlaylistEntry:
+        if self._fair is not None:
+            return self._fair.peek()
+        if self._shuffle is not None:
+            return self._shuffle.peek()
         return self._queue[0]
 
     def pop_last(self):
-        self._queue = self._queue[1:]
+        if self._fair is not None:
+            entry = self._fair.pop()
+        elif self._shuffle is not None:
+            entry = self._shuffle.pop()
+        else:
+            entry = self._queue[0]
+            del self._queue[0]
+        self._unindex(entry)
+        self._changed()
+        self._update_window()
+
+    def _changed(self):
+        self._version += 1
+        for callback in self._change_callbacks:
+            callback()
+
+    def _append(self, entries: tp.List[PlaylistEntry]):
+        for entry in entries:
+            for key in self._index_keys(entry):
+                self._index.setdefault(key, []).append(entry)
+
+        if self._shuffle is not None:
+            self._shuffle.push(entries)
+            return
+
+        if self._fair is None:
+            self._queue += entries
+            return
+
+        for requester, requester_entries in itertools.groupby(
+            entries, key=lambda e: e.requester
+        ):
+            self._fair.push(requester, requester_entries)
+
+    def _unindex(self, entry: PlaylistEntry):
+        for key in self._index_keys(entry):
+            entries = self._index.get(key, [])
+            if entry in entries:
+                entries.remove(entry)
+            if not entries:
+                self._index.pop(key, None)
+
+    @staticmethod
+    def _index_keys(entry: PlaylistEntry) -> tp.Set[str]:
+        keys = {normalize_mrl(entry.mrl)}
+        if entry.source is not None:
+            keys.add(normalize_mrl(entry.source))
+        return keys
+
+    def _update_window(self, added: tp.Iterable[PlaylistEntry] = ()):
+        window = self.head(self._window)
+        in_window = set(window)
+
+        for entry in self._materialized:
+            if entry not in in_window:
+                entry.release()
+
+        # New entries may come with media used to resolve them
+        for entry in added:
+            if entry not in in_window:
+                entry.release()
+
+        for entry in window:
+            entry.materialize()
+
+        self._materialized = window
 
     async def _unwrap_media(self, media: Media, level=0) -> tp.List[Media]:
         submedia = await media.subitems
@@ -57,3 +279,4 @@ class Playlist:
         #     [(await self._unwrap_media(m, level + 1)) for m in submedia],
         #     list(),
         # )
+
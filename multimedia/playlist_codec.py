@@ -0,0 +1,185 @@
+import typing as tp
+import zlib
+
+# Binary playlist format:
+#   magic (4 bytes) | format version (1 byte) | zlib stream of records
+# Every record is mrl, title, artist, duration. Strings are utf-8 prefixed
+# with varint length + 1, duration is varint seconds + 1. Zero means None.
+MAGIC = b"PMBQ"
+FORMAT_VERSION = 1
+HEADER_SIZE = len(MAGIC) + 1
+
+COMPRESSION_LEVEL = 6
+
+# Upload of 20 MB may expand to gigabytes, so output is inflated by steps
+# and whole decoded payload is limited. 16 MiB is over 100k entries.
+MAX_DECODED_SIZE = 16 * 1024 * 1024
+DECOMPRESS_STEP = 256 * 1024
+
+
+class PlaylistRecord(tp.NamedTuple):
+    mrl: str
+    title: tp.Optional[str] = None
+    artist: tp.Optional[str] = None
+    duration: tp.Optional[int] = None
+
+
+class PlaylistCodecError(Exception):
+    pass
+
+
+class _Incomplete(Exception):
+    pass
+
+
+def _write_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _write_optional_str(out: bytearray, value: tp.Optional[str]):
+    if value is None:
+        out.append(0)
+        return
+
+    encoded = value.encode("utf-8")
+    _write_varint(out, len(encoded) + 1)
+    out += encoded
+
+
+def encode_playlist(records: tp.Iterable[PlaylistRecord]) -> bytes:
+    payload = bytearray()
+    for mrl, title, artist, duration in records:
+        _write_optional_str(payload, mrl)
+        _write_optional_str(payload, title)
+        _write_optional_str(payload, artist)
+        _write_varint(payload, 0 if duration is None else max(duration, 0) + 1)
+
+    return (
+        MAGIC
+        + bytes((FORMAT_VERSION,))
+        + zlib.compress(bytes(payload), COMPRESSION_LEVEL)
+    )
+
+
+class PlaylistDecoder:
+    # Incremental decoder, records are returned as soon as chunk with
+    # their last byte is fed.
+    def __init__(self):
+        self._header = bytearray()
+        self._decompressor = zlib.decompressobj()
+        self._buffer = bytearray()
+        self._offset = 0
+        self._decoded_size = 0
+
+    def feed(self, chunk: bytes) -> tp.List[PlaylistRecord]:
+        if len(self._header) < HEADER_SIZE:
+            missing = HEADER_SIZE - len(self._header)
+            self._header += chunk[:missing]
+            chunk = chunk[missing:]
+            if len(self._header) < HEADER_SIZE:
+                return []
+            self._check_header()
+
+        records = []
+        while True:
+            try:
+                decoded = self._decompressor.decompress(chunk, DECOMPRESS_STEP)
+            except zlib.error as e:
+                raise PlaylistCodecError(f"Corrupted playlist: {e}") from e
+
+            self._decoded_size += len(decoded)
+            if self._decoded_size > MAX_DECODED_SIZE:
+                raise PlaylistCodecError("Playlist is too big")
+
+            self._buffer += decoded
+            records += self._read_records()
+
+            # Full step means zlib may have more output for the same input
+            chunk = self._decompressor.unconsumed_tail
+            if not chunk and len(decoded) < DECOMPRESS_STEP:
+                return records
+
+    def finish(self):
+        if len(self._header) < HEADER_SIZE or not self._decompressor.eof:
+            raise PlaylistCodecError("Playlist is truncated")
+
+        if self._offset != len(self._buffer):
+            raise PlaylistCodecError("Playlist ends with incomplete record")
+
+    def _check_header(self):
+        if self._header[: len(MAGIC)] != MAGIC:
+            raise PlaylistCodecError("Not a playlist file")
+
+        version = self._header[len(MAGIC)]
+        if version != FORMAT_VERSION:
+            raise PlaylistCodecError(f"Unsupported playlist version {version}")
+
+    def _read_records(self) -> tp.List[PlaylistRecord]:
+        records = []
+        buffer = self._buffer
+        while True:
+            start = self._offset
+            try:
+                mrl = self._read_optional_str()
+                title = self._read_optional_str()
+                artist = self._read_optional_str()
+                duration = self._read_varint()
+            except _Incomplete:
+                self._offset = start
+                break
+
+            if mrl is None:
+                raise PlaylistCodecError("Playlist record without mrl")
+
+            records.append(
+                PlaylistRecord(mrl, title, artist, duration - 1 if duration else None)
+            )
+
+        # Dropping consumed bytes, so buffer doesn't grow with file size
+        del buffer[: self._offset]
+        self._offset = 0
+
+        return records
+
+    def _read_varint(self) -> int:
+        buffer = self._buffer
+        result = 0
+        shift = 0
+        while True:
+            if self._offset >= len(buffer):
+                raise _Incomplete()
+            byte = buffer[self._offset]
+            self._offset += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def _read_optional_str(self) -> tp.Optional[str]:
+        length = self._read_varint()
+        if length == 0:
+            return None
+
+        end = self._offset + length - 1
+        if end > len(self._buffer):
+            raise _Incomplete()
+
+        value = self._buffer[self._offset : end].decode("utf-8", errors="replace")
+        self._offset = end
+        return value
+
+
+def decode_playlist(
+    data: bytes, chunk_size: int = 64 * 1024
+) -> tp.Iterator[tp.List[PlaylistRecord]]:
+    # Yields batches of records, one per decoded chunk
+    decoder = PlaylistDecoder()
+    for i in range(0, len(data), chunk_size):
+        records = decoder.feed(data[i : i + chunk_size])
+        if records:
+            yield records
+    decoder.finish()
+
@@ -0,0 +1,141 @@
+import asyncio
+import typing as tp
+
+from async_property import async_property
+
+from multimedia.media import Media, ParseState
+
+
+class PlaylistEntry:
+    # Queue element. It holds mrl and known metadata only, libvlc media is
+    # created for entries within playback window, or while metadata loads.
+    __slots__ = (
+        "mrl",
+        "title",
+        "artist",
+        "duration",
+        "requester",
+        "source",
+        "_media",
+        "_pinned",
+        "_loading",
+        "_loaded",
+    )
+
+    def __init__(
+        self,
+        mrl: str,
+        title: tp.Optional[str] = None,
+        artist: tp.Optional[str] = None,
+        duration: tp.Optional[int] = None,
+        requester: tp.Optional[int] = None,
+        source: tp.Optional[str] = None,
+    ):
+        self.mrl = mrl
+        self.title = title
+        self.artist = artist
+        self.duration = duration
+
+        # Telegram user, that added entry. Used by fair queue.
+        self.requester = requester
+        # Link entry was resolved from, e.g. album. Track link for tracks.
+        self.source = source
+
+        self._media: tp.Optional[Media] = None
+        self._pinned = False
+        self._loading: tp.Optional[asyncio.Future] = None
+        self._loaded = False
+
+    @classmethod
+    def from_media(
+        cls, media: Media, requester: tp.Optional[int] = None
+    ) -> "PlaylistEntry":
+        # Media is kept until playlist decides if entry is within window
+        entry = cls(media.mrl, *media.known_metadata, requester=requester)
+        entry._media = media
+        entry._loaded = media.parse_state != ParseState.Pending
+        return entry
+
+    def copy(self, requester: tp.Optional[int] = None) -> "PlaylistEntry":
+        # Same track requested again, libvlc media isn't shared
+        return PlaylistEntry(
+            self.mrl, *self.known_metadata, requester=requester, source=self.source
+        )
+
+    @property
+    def known_metadata(
+        self,
+    ) -> tp.Tuple[tp.Optional[str], tp.Optional[str], tp.Optional[int]]:
+        return self.title, self.artist, self.duration
+
+    @property
+    def is_materialized(self) -> bool:
+        return self._media is not None
+
+    @async_property
+    async def media_title(self) -> tp.Optional[str]:
+        if self.title is None:
+            await self.load_metadata()
+        return self.title
+
+    @async_property
+    async def media_artist(self) -> tp.Optional[str]:
+        if self.artist is None:
+            await self.load_metadata()
+        return self.artist
+
+    @async_property
+    async def media_duration(self) -> tp.Optional[int]:
+        if self.duration is None:
+            await self.load_metadata()
+        return self.duration
+
+    def materialize(self) -> Media:
+        # Pinned media survives until release()
+        self._pinned = True
+        if self._media is None:
+            self._media = self._build_media()
+        return self._media
+
+    def release(self):
+        self._pinned = False
+        if self._loading is None:
+            self._media = None
+
+    async def load_metadata(self):
+        # Parsing is done once, concurrent callers share it
+        if self._loaded:
+            return
+
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(self._load_metadata())
+        await self._loading
+
+    async def _load_metadata(self):
+        media = self._media
+        if media is None:
+            media = self._media = self._build_media()
+
+        try:
+            await media.load_metadata()
+
+            title, artist, duration = media.known_metadata
+            self.title = self.title if self.title is not None else title
+            self.artist = self.artist if self.artist is not None else artist
+            self.duration = self.duration if self.duration is not None else duration
+
+            # Failed and timed out media are not parsed again for metadata,
+            # playback retries them on its own.
+            self._loaded = True
+        finally:
+            self._loading = None
+            if not self._pinned:
+                self._media = None
+
+    def _build_media(self) -> Media:
+        return Media(
+            self.mrl,
+            title=self.title,
+            artist=self.artist,
+            duration=self.duration,
+        )
@@ -0,0 +1,260 @@
+import asyncio
+import dataclasses
+import typing as tp
+import logging
+import hashlib
+import os
+import collections
+from urllib.parse import urlparse
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+REMOTE_SCHEMES = {"http", "https"}
+
+# Anything else (html pages, playlists, etc) is not directly playable
+CACHEABLE_CONTENT_TYPES = ("audio/", "application/ogg", "application/octet-stream")
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+ReadyCallback = tp.Callable[[str, str], None]
+# Direct stream url for mrl, None when mrl is downloaded as is
+StreamResolver = tp.Callable[[str], tp.Awaitable[tp.Optional[str]]]
+
+
+@dataclasses.dataclass()
+class CacheEntry:
+    path: str
+    size: int
+
+
+@dataclasses.dataclass(frozen=True)
+class PrefetchStats:
+    hits: int
+    misses: int
+    bytes_saved: int
+    used_bytes: int
+    byte_budget: int
+    entries: int
+
+
+def is_remote_mrl(mrl: str) -> bool:
+    return urlparse(mrl).scheme in REMOTE_SCHEMES
+
+
+class PrefetchCache:
+    def __init__(
+        self,
+        directory: str,
+        byte_budget: int,
+        lookahead: int = 3,
+        stream_resolver: tp.Optional[StreamResolver] = None,
+    ):
+        self._directory = directory
+        self._byte_budget = byte_budget
+        self._lookahead = lookahead
+        self._stream_resolver = stream_resolver
+
+        # Ordered from least to most recently used
+        self._entries: tp.OrderedDict[str, CacheEntry] = collections.OrderedDict()
+        self._used_bytes = 0
+        self._playing_key: tp.Optional[str] = None
+
+        self._wanted: tp.List[str] = []
+        self._failed: tp.Set[str] = set()
+        self._wakeup = asyncio.Event()
+        self._resumed = asyncio.Event()
+        self._resumed.set()
+        self._worker_task: tp.Optional[asyncio.Task] = None
+        self._ready_callbacks: tp.List[ReadyCallback] = []
+
+        self._hits = 0
+        self._misses = 0
+        self._bytes_saved = 0
+
+    @property
+    def stats(self) -> PrefetchStats:
+        return PrefetchStats(
+            hits=self._hits,
+            misses=self._misses,
+            bytes_saved=self._bytes_saved,
+            used_bytes=self._used_bytes,
+            byte_budget=self._byte_budget,
+            entries=len(self._entries),
+        )
+
+    def add_ready_callback(self, callback: ReadyCallback):
+        self._ready_callbacks.append(callback)
+
+    def start(self):
+        os.makedirs(self._directory, exist_ok=True)
+        self._load_existing()
+        self._worker_task = asyncio.create_task(self._worker())
+
+    @property
+    def lookahead(self) -> int:
+        return self._lookahead
+
+    @property
+    def paused(self) -> bool:
+        return not self._resumed.is_set()
+
+    def pause(self):
+        # Download in progress is finished, next ones wait for resume
+        self._resumed.clear()
+
+    def resume(self):
+        self._resumed.set()
+
+    def update_queue(self, mrls: tp.Iterable[str]):
+        wanted = []
+        for mrl in mrls:
+            if len(wanted) >= self._lookahead:
+                break
+            if is_remote_mrl(mrl):
+                wanted.append(mrl)
+
+        self._wanted = wanted
+        self._failed &= {self._key(mrl) for mrl in wanted}
+        self._wakeup.set()
+
+    def lookup(self, mrl: str) -> tp.Optional[str]:
+        if not is_remote_mrl(mrl):
+            return None
+
+        key = self._key(mrl)
+        entry = self._entries.get(key)
+        if entry is None:
+            self._misses += 1
+            return None
+
+        self._hits += 1
+        self._bytes_saved += entry.size
+        self._entries.move_to_end(key)
+        self._playing_key = key
+
+        return f"file://{entry.path}"
+
+    def _key(self, mrl: str) -> str:
+        return hashlib.sha1(mrl.encode("utf-8")).hexdigest()
+
+    def _load_existing(self):
+        # Restoring cache from previous run. Oldest files are evicted first.
+        files = []
+        for name in os.listdir(self._directory):
+            path = os.path.join(self._directory, name)
+            if name.endswith(".part"):
+                os.remove(path)
+                continue
+            stat = os.stat(path)
+            files.append((stat.st_mtime, name, path, stat.st_size))
+
+        for _, name, path, size in sorted(files):
+            self._entries[name] = CacheEntry(path=path, size=size)
+            self._used_bytes += size
+
+        self._evict(0)
+
+        logger.info(
+            "Prefetch cache has %d entries with %d bytes",
+            len(self._entries),
+            self._used_bytes,
+        )
+
+    def _evict(self, required_bytes: int) -> bool:
+        for key in list(self._entries.keys()):
+            if self._used_bytes + required_bytes <= self._byte_budget:
+                break
+
+            if key == self._playing_key:
+                continue
+
+            entry = self._entries.pop(key)
+            self._used_bytes -= entry.size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+            logger.debug("Evicted '%s' from prefetch cache", entry.path)
+
+        return self._used_bytes + required_bytes <= self._byte_budget
+
+    async def _worker(self):
+        async with httpx.AsyncClient(follow_redirects=True, timeout=30) as client:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+
+                await self._resumed.wait()
+
+                for mrl in list(self._wanted):
+                    key = self._key(mrl)
+                    if key in self._entries or key in self._failed:
+                        continue
+
+                    try:
+                        await self._download(client, mrl, key)
+                    except Exception:
+                        logger.warning("Unable to prefetch '%s'", mrl, exc_info=True)
+                        self._failed.add(key)
+
+                    # Queue may change while we were downloading. Paused
+                    # cache continues with the rest of queue after resume.
+                    if self._wakeup.is_set() or self.paused:
+                        self._wakeup.set()
+                        break
+
+    async def _download(self, client: httpx.AsyncClient, mrl: str, key: str):
+        path = os.path.join(self._directory, key)
+        part_path = f"{path}.part"
+
+        # Cache is keyed by mrl, but audio may come from direct stream
+        url = mrl
+        if self._stream_resolver is not None:
+            url = await self._stream_resolver(mrl) or mrl
+
+        async with client.stream("GET", url) as response:
+            response.raise_for_status()
+
+            content_type = response.headers.get("content-type", "")
+            if not content_type.startswith(CACHEABLE_CONTENT_TYPES):
+                logger.info("Not prefetching '%s' with '%s' content", mrl, content_type)
+                self._failed.add(key)
+                return
+
+            # Live streams have no length and never end
+            content_length = response.headers.get("content-length")
+            if content_length is None:
+                logger.info("Not prefetching '%s' without content length", mrl)
+                self._failed.add(key)
+                return
+
+            size = int(content_length)
+            if not self._evict(size):
+                logger.info("Not prefetching '%s', %d bytes doesn't fit", mrl, size)
+                self._failed.add(key)
+                return
+
+            # Reserving space until download is finished
+            self._used_bytes += size
+            try:
+                written = 0
+                with open(part_path, "wb") as f:
+                    async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                        await asyncio.to_thread(f.write, chunk)
+                        written += len(chunk)
+                os.replace(part_path, path)
+            except BaseException:
+                self._used_bytes -= size
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                raise
+
+        # Decoded body may differ from announced length
+        self._used_bytes += written - size
+        self._entries[key] = CacheEntry(path=path, size=written)
+        logger.info("Prefetched '%s' (%d bytes)", mrl, written)
+
+        for callback in self._ready_callbacks:
+            callback(mrl, path)
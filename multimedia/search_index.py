@@ -0,0 +1,232 @@
+import collections
+import dataclasses
+import heapq
+import itertools
+import re
+import time
+import typing as tp
+from urllib.parse import unquote, urlsplit
+
+from multimedia.mrl import normalize_mrl
+
+WORD_RE = re.compile(r"\w+")
+
+# Telegram shows at most 50 inline results
+DEFAULT_LIMIT = 50
+# Most recent matches, this many times more than asked, are ranked
+RANKED_FACTOR = 4
+DEFAULT_MAX_DOCUMENTS = 200_000
+# Candidates, that are at least such part of library, are walked by recency
+FREQUENT_SHARE = 32
+
+
+class Indexable(tp.Protocol):
+    mrl: str
+
+    @property
+    def known_metadata(
+        self,
+    ) -> tp.Tuple[tp.Optional[str], tp.Optional[str], tp.Optional[int]]:
+        ...
+
+
+@dataclasses.dataclass()
+class SearchDocument:
+    id: int
+    mrl: str
+    title: tp.Optional[str]
+    artist: tp.Optional[str]
+    duration: tp.Optional[int]
+    # Last time track was resolved, queued or played
+    seen_at: float
+
+    @property
+    def display_title(self) -> str:
+        if self.title:
+            return self.title
+        # Unparsed tracks are known by their file names
+        path = urlsplit(self.mrl).path.rstrip("/")
+        return unquote(path.rsplit("/", 1)[-1]).rsplit(".", 1)[0] or self.mrl
+
+
+def _normalize(text: str) -> str:
+    return " ".join(WORD_RE.findall(text.casefold().replace("ё", "е")))
+
+
+def _document_grams(text: str) -> tp.Set[str]:
+    # Words are padded, so one and two letter prefixes get own grams
+    grams = set()
+    for word in text.split():
+        padded = "  " + word
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _token_grams(token: str) -> tp.Set[str]:
+    # Short tokens match word prefixes, longer ones match anywhere
+    if len(token) < 3:
+        return {("  " + token)[-3:]}
+    return {token[i : i + 3] for i in range(len(token) - 2)}
+
+
+# In-memory trigram index over titles and artists of known tracks.
+# Documents are keyed by normalized mrl, so track seen in queue, history
+# and database is found once. Oldest documents are evicted beyond limit.
+class SearchIndex:
+    def __init__(self, max_documents: int = DEFAULT_MAX_DOCUMENTS):
+        self._max_documents = max_documents
+
+        # Normalized mrl to document, from least to most recently seen
+        self._documents: tp.OrderedDict[str, SearchDocument] = (
+            collections.OrderedDict()
+        )
+        self._by_id: tp.Dict[int, SearchDocument] = {}
+        # Normalized text is prefixed by space, so prefixes are checked
+        # as substrings too
+        self._texts: tp.Dict[int, str] = {}
+        self._seen_at: tp.Dict[int, float] = {}
+        self._postings: tp.Dict[str, tp.Set[int]] = collections.defaultdict(set)
+        self._ids = itertools.count(1)
+
+        # Document id to position in play queue
+        self._queued: tp.Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    @property
+    def max_documents(self) -> int:
+        return self._max_documents
+
+    def get(self, document_id: int) -> tp.Optional[SearchDocument]:
+        return self._by_id.get(document_id)
+
+    def add(
+        self,
+        mrl: str,
+        title: tp.Optional[str] = None,
+        artist: tp.Optional[str] = None,
+        duration: tp.Optional[int] = None,
+        seen_at: tp.Optional[float] = None,
+    ) -> SearchDocument:
+        seen_at = time.time() if seen_at is None else seen_at
+        key = normalize_mrl(mrl)
+
+        document = self._documents.get(key)
+        if document is None:
+            document = SearchDocument(
+                next(self._ids), mrl, title, artist, duration, seen_at
+            )
+            self._documents[key] = document
+            self._by_id[document.id] = document
+            self._seen_at[document.id] = seen_at
+            self._index(document)
+
+            while len(self._documents) > self._max_documents:
+                self._remove(self._documents.popitem(last=False)[1])
+            return document
+
+        # Unknown metadata never overrides known one. Untitled track is
+        # indexed by its file name, which changes with mrl.
+        indexed = (document.display_title, document.artist)
+        document.mrl = mrl
+        document.title = title or document.title
+        document.artist = artist or document.artist
+        document.duration = duration or document.duration
+        if (document.display_title, document.artist) != indexed:
+            self._unindex(document)
+            self._index(document)
+
+        if seen_at >= document.seen_at:
+            document.seen_at = self._seen_at[document.id] = seen_at
+            self._documents.move_to_end(key)
+        return document
+
+    def set_queue(self, entries: tp.Iterable[Indexable]):
+        # Queued tracks are found first. Known tracks keep their metadata
+        # and recency, only new ones are indexed.
+        self._queued = {}
+        for position, entry in enumerate(entries):
+            document = self._documents.get(normalize_mrl(entry.mrl))
+            if document is None:
+                document = self.add(entry.mrl, *entry.known_metadata)
+            self._queued.setdefault(document.id, position)
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT) -> tp.List[SearchDocument]:
+        tokens = _normalize(query).split()
+        if not tokens:
+            return self._recent(limit)
+
+        # Rarest grams first, intersection is done by sets in C
+        grams = set().union(*(_token_grams(token) for token in tokens))
+        postings = sorted((self._postings.get(g, set()) for g in grams), key=len)
+        candidates = postings[0].intersection(*postings[1:])
+
+        # Trigrams of long tokens may come from different words
+        long_tokens = [token for token in tokens if len(token) >= 3]
+        texts = self._texts
+
+        def matches(document_id: int) -> bool:
+            text = texts[document_id]
+            return all(token in text for token in long_tokens)
+
+        # Only most recent matches are ranked, candidates aren't sorted.
+        # Frequent grams match a big part of library, then documents are
+        # walked from most recent ones until enough matches are found.
+        ranked = limit * RANKED_FACTOR
+        if len(candidates) * FREQUENT_SHARE >= len(self._documents):
+            recent = (
+                document.id
+                for document in reversed(self._documents.values())
+                if document.id in candidates
+            )
+            matched = list(itertools.islice(filter(matches, recent), ranked))
+        else:
+            matched = heapq.nlargest(
+                ranked, filter(matches, candidates), key=self._seen_at.__getitem__
+            )
+        pool = set(matched)
+        pool.update(i for i in candidates.intersection(self._queued) if matches(i))
+
+        prefixes = [" " + token for token in tokens]
+
+        def rank(document_id: int) -> tp.Tuple[bool, int, float]:
+            text = texts[document_id]
+            return (
+                document_id in self._queued,
+                sum(prefix in text for prefix in prefixes),
+                self._seen_at[document_id],
+            )
+
+        return [self._by_id[i] for i in heapq.nlargest(limit, pool, key=rank)]
+
+    def _recent(self, limit: int) -> tp.List[SearchDocument]:
+        # Queue in play order, then most recently seen tracks
+        queued = sorted(self._queued, key=self._queued.get)[:limit]
+        result = [self._by_id[i] for i in queued]
+        for document in reversed(self._documents.values()):
+            if len(result) >= limit:
+                break
+            if document.id not in self._queued:
+                result.append(document)
+        return result
+
+    def _index(self, document: SearchDocument):
+        text = _normalize(f"{document.display_title} {document.artist or ''}")
+        self._texts[document.id] = " " + text
+        for gram in _document_grams(text):
+            self._postings[gram].add(document.id)
+
+    def _unindex(self, document: SearchDocument):
+        for gram in _document_grams(self._texts.pop(document.id)):
+            posting = self._postings[gram]
+            posting.discard(document.id)
+            if not posting:
+                del self._postings[gram]
+
+    def _remove(self, document: SearchDocument):
+        self._unindex(document)
+        del self._by_id[document.id]
+        del self._seen_at[document.id]
+        self._queued.pop(document.id, None)
+
@@ -0,0 +1,104 @@
+import collections
+import itertools
+import random
+import typing as tp
+
+T = tp.TypeVar("T")
+
+
+# Queue playing items in random order without reordering them. Items
+# stay in order of addition, next one is drawn from pool of indices
+# of not yet drawn items by incremental Fisher-Yates, so each draw and
+# each addition costs O(1).
+class ShuffleQueue(tp.Generic[T]):
+    def __init__(self, items: tp.Iterable[T] = (), seed: tp.Optional[int] = None):
+        self._random = random.Random(seed)
+
+        # Popped items are replaced with None until compaction
+        self._items: tp.List[tp.Optional[T]] = []
+        self._pool: tp.List[int] = []
+        # Already drawn indices, in order they are going to be popped
+        self._upcoming: tp.Deque[int] = collections.deque()
+
+        self.push(items)
+
+    def __len__(self) -> int:
+        return len(self._pool) + len(self._upcoming)
+
+    def push(self, items: tp.Iterable[T]):
+        for item in items:
+            self._pool.append(len(self._items))
+            self._items.append(item)
+
+    def peek(self) -> T:
+        self._draw(1)
+        return self._items[self._upcoming[0]]
+
+    def pop(self) -> T:
+        self._draw(1)
+        index = self._upcoming.popleft()
+        item = self._items[index]
+        self._items[index] = None
+
+        if len(self._items) > 2 * len(self) + 64:
+            self._compact()
+
+        return item
+
+    def move_to_front(self, item: T):
+        # Item is popped next, O(n) search of it is fine for rare calls
+        index = next(i for i, other in enumerate(self._items) if other is item)
+        if index in self._upcoming:
+            self._upcoming.remove(index)
+        else:
+            position = self._pool.index(index)
+            self._pool[position] = self._pool[-1]
+            self._pool.pop()
+        self._upcoming.appendleft(index)
+
+    def head(self, count: int) -> tp.List[T]:
+        # Items that are going to be popped next, drawn in advance
+        self._draw(count)
+        return [self._items[i] for i in itertools.islice(self._upcoming, count)]
+
+    def ordered(self, limit: tp.Optional[int] = None) -> tp.List[T]:
+        # Drawn items first, the rest is in order of addition
+        upcoming = set(self._upcoming)
+        result = [self._items[i] for i in self._upcoming]
+        for index, item in enumerate(self._items):
+            if limit is not None and len(result) >= limit:
+                break
+            if item is not None and index not in upcoming:
+                result.append(item)
+
+        return result if limit is None else result[:limit]
+
+    def remaining(self) -> tp.List[T]:
+        # Not popped items in order of addition
+        return [item for item in self._items if item is not None]
+
+    def clear(self):
+        self._items.clear()
+        self._pool.clear()
+        self._upcoming.clear()
+
+    def _draw(self, count: int):
+        while len(self._upcoming) < count and self._pool:
+            # Swapping random index with the last one and taking it
+            j = self._random.randrange(len(self._pool))
+            self._pool[j], self._pool[-1] = self._pool[-1], self._pool[j]
+            self._upcoming.append(self._pool.pop())
+
+    def _compact(self):
+        # Dropping popped items, it's amortized by pops made before
+        remap = {}
+        items = []
+        for index, item in enumerate(self._items):
+            if item is not None:
+                remap[index] = len(items)
+                items.append(item)
+
+        self._items = items
+        self._pool = [remap[i] for i in self._pool]
+        self._upcoming = collections.deque(remap[i] for i in self._upcoming)
+
@@ -1,4 +1,6 @@
 import asyncio
+import typing as tp
+import threading
 from functools import reduce
 
 import vlc
@@ -16,21 +18,74 @@ def vlc_flags_or(*args):
     )
 
 
-def wrap_vlc_event(ev: vlc.EventType, event: vlc.Event):
-    loop = asyncio.get_event_loop()
-    f = loop.create_future()
+EventCallback = tp.Callable[[tp.Any], None]
+EventExtractor = tp.Callable[[vlc.Event], tp.Any]
 
-    def cb():
-        try:
-            f.set_result(None)
-        except asyncio.exceptions.InvalidStateError:
-            # Future is already done :idk
-            pass
 
-        ev.event_detach(event)
+# python-vlc allows only one callback per event type for each EventManager
+# wrapper and frees ctypes trampoline with the wrapper. Hub keeps single
+# wrapper alive while anybody listens and fans events out to any amount
+# of listeners. Listeners are called in event loop thread with payload,
+# extracted in VLC thread (event struct is only valid there).
+class VlcEventHub:
+    def __init__(self, event_manager: vlc.EventManager):
+        self._event_manager = event_manager
+        self._loop = asyncio.get_event_loop()
+        self._listeners: tp.Dict[
+            int, tp.List[tp.Tuple[EventCallback, tp.Optional[EventExtractor]]]
+        ] = {}
+        self._lock = threading.Lock()
 
-    ev.event_attach(
-        event,
-        lambda event: loop.call_soon_threadsafe(cb),
-    )
-    return f
+    @property
+    def listeners_count(self) -> int:
+        with self._lock:
+            return sum(len(listeners) for listeners in self._listeners.values())
+
+    def subscribe(
+        self,
+        event_type: vlc.EventType,
+        callback: EventCallback,
+        extract: tp.Optional[EventExtractor] = None,
+    ):
+        with self._lock:
+            if event_type.value not in self._listeners:
+                self._listeners[event_type.value] = []
+                self._event_manager.event_attach(event_type, self._on_vlc_event)
+            self._listeners[event_type.value].append((callback, extract))
+
+    def unsubscribe(self, event_type: vlc.EventType, callback: EventCallback):
+        with self._lock:
+            listeners = self._listeners.get(event_type.value, [])
+            for index, (listener, _) in enumerate(listeners):
+                if listener == callback:
+                    del listeners[index]
+                    break
+
+            # Short-lived hub (e.g. of parsed media) is freed with its
+            # trampoline, so libvlc mustn't keep calling it
+            if event_type.value in self._listeners and not listeners:
+                del self._listeners[event_type.value]
+                self._event_manager.event_detach(event_type)
+
+    def wait(self, event_type: vlc.EventType) -> asyncio.Future:
+        f = self._loop.create_future()
+
+        def cb(_):
+            self.unsubscribe(event_type, cb)
+            if not f.done():
+                f.set_result(None)
+
+        # Listener is removed even if nobody awaits future anymore
+        f.add_done_callback(lambda _: self.unsubscribe(event_type, cb))
+
+        self.subscribe(event_type, cb)
+        return f
+
+    def _on_vlc_event(self, event: vlc.Event):
+        # Called from VLC thread
+        with self._lock:
+            listeners = list(self._listeners.get(event.type.value, []))
+
+        for callback, extract in listeners:
+            payload = extract(event) if extract is not None else None
+            self._loop.call_soon_threadsafe(callback, payload)
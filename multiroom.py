@@ -0,0 +1,587 @@
+import asyncio
+import collections
+import dataclasses
+import json
+import logging
+import socket
+import time
+import typing as tp
+
+from multimedia.media import Media
+from multimedia.player import Player, PlayerState
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 7700
+
+# Leader sends its position this often, followers correct drift from it
+BEACON_INTERVAL = 1.0
+WATCH_INTERVAL = 0.1
+# New track is started on followers a bit later, to give them time to
+# open stream. Leader position is extrapolated to that moment.
+PLAY_LEAD = 0.5
+# Seek before libvlc is playing is lost, start is awaited that long
+PLAY_START_TIMEOUT = 5.0
+
+SYNC_BURST = 4
+SYNC_INTERVAL = 5.0
+SYNC_SAMPLES = 8
+
+# Smaller drift is tolerated, seeking isn't free and isn't precise.
+# Seek is not repeated until its result is seen in position beacons.
+MAX_DRIFT = 0.04
+SEEK_COOLDOWN = 2.5
+# Seek target is moved forward by learned latency of seek itself
+MAX_SEEK_LEAD = 1.0
+
+RECONNECT_DELAY = 2.0
+
+Clock = tp.Callable[[], float]
+MediaFactory = tp.Callable[[str], Media]
+
+PAUSE_COMMANDS = {
+    PlayerState.Playing: "resume",
+    PlayerState.Paused: "pause",
+    PlayerState.Stopped: "stop",
+}
+
+
+def _encode(message: tp.Dict[str, tp.Any]) -> bytes:
+    return (json.dumps(message) + "\n").encode("utf-8")
+
+
+def parse_address(address: str, default_host: str = "0.0.0.0") -> tp.Tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return host or default_host, int(port or DEFAULT_PORT)
+
+
+class ClockSample(tp.NamedTuple):
+    # Leader clock minus local one, seconds
+    offset: float
+    round_trip: float
+
+
+class ClockSync:
+    # NTP like estimation of offset between local and leader clocks.
+    # Sample with the smallest round trip is the least affected by
+    # queueing, so it's the one which is trusted.
+    def __init__(self, samples: int = SYNC_SAMPLES):
+        self._samples: tp.Deque[ClockSample] = collections.deque(maxlen=samples)
+
+    def add(self, t0: float, t1: float, t2: float, t3: float) -> ClockSample:
+        # t0 and t3 are local send and receive, t1 and t2 are leader ones
+        sample = ClockSample(
+            offset=((t1 - t0) + (t2 - t3)) / 2,
+            round_trip=(t3 - t0) - (t2 - t1),
+        )
+        self._samples.append(sample)
+        return sample
+
+    @property
+    def synchronized(self) -> bool:
+        return bool(self._samples)
+
+    @property
+    def best(self) -> tp.Optional[ClockSample]:
+        if not self._samples:
+            return None
+        return min(self._samples, key=lambda sample: sample.round_trip)
+
+    @property
+    def offset(self) -> float:
+        best = self.best
+        return best.offset if best is not None else 0.0
+
+
+@dataclasses.dataclass()
+class FollowerInfo:
+    name: str
+    address: str
+    # Follower position minus leader one at the same moment, seconds
+    skew: tp.Optional[float] = None
+    max_skew: float = 0.0
+    reports: int = 0
+
+
+class MultiroomLeader:
+    # Leader owns playlist and bot. It follows its own player and tells
+    # followers what to play and where it is now. Protocol is JSON lines
+    # over TCP, times are leader wall clock seconds.
+    def __init__(
+        self,
+        player: Player,
+        host: str = "0.0.0.0",
+        port: int = DEFAULT_PORT,
+        clock: Clock = time.time,
+    ):
+        self._player = player
+        self._host = host
+        self._port = port
+        self._clock = clock
+
+        self._followers: tp.Dict[asyncio.StreamWriter, FollowerInfo] = {}
+        self._connections: tp.Set[asyncio.Task] = set()
+        self._server: tp.Optional[asyncio.AbstractServer] = None
+        self._watch_task: tp.Optional[asyncio.Task] = None
+
+    @property
+    def port(self) -> int:
+        if self._server is None:
+            return self._port
+        return self._server.sockets[0].getsockname()[1]
+
+    @property
+    def followers(self) -> tp.List[FollowerInfo]:
+        return list(self._followers.values())
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._on_connection, self._host, self._port
+        )
+        self._watch_task = asyncio.create_task(self._watch())
+        logger.info("Multiroom leader is listening on %s:%d", self._host, self.port)
+
+    async def stop(self):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for writer in list(self._followers):
+            writer.close()
+        # Connections see closed streams and finish on their own
+        await asyncio.gather(*self._connections, return_exceptions=True)
+
+    def _position(self) -> float:
+        return max(self._player.playback_time, 0.0)
+
+    def _play_command(self) -> tp.Optional[tp.Dict[str, tp.Any]]:
+        snapshot = self._player.snapshot
+        if snapshot.media is None or snapshot.state == PlayerState.Stopped:
+            return None
+
+        paused = snapshot.state == PlayerState.Paused
+        return {
+            "type": "play",
+            "mrl": snapshot.media.mrl,
+            "at": self._clock() + PLAY_LEAD,
+            "offset": self._position() + (0.0 if paused else PLAY_LEAD),
+            "paused": paused,
+        }
+
+    async def _watch(self):
+        media, state = None, PlayerState.Stopped
+        last_beacon = 0.0
+        while True:
+            await asyncio.sleep(WATCH_INTERVAL)
+
+            snapshot = self._player.snapshot
+            if snapshot.media is not media:
+                media, state = snapshot.media, snapshot.state
+                self._broadcast(self._play_command() or {"type": "stop"})
+                continue
+
+            if snapshot.state != state:
+                state = snapshot.state
+                self._broadcast({"type": PAUSE_COMMANDS[state]})
+
+            now = self._clock()
+            if state == PlayerState.Playing and now - last_beacon >= BEACON_INTERVAL:
+                last_beacon = now
+                self._broadcast(
+                    {
+                        "type": "position",
+                        "mrl": media.mrl,
+                        "at": now,
+                        "offset": self._position(),
+                    }
+                )
+
+    def _broadcast(self, message: tp.Dict[str, tp.Any]):
+        data = _encode(message)
+        for writer in list(self._followers):
+            if not writer.is_closing():
+                writer.write(data)
+
+    async def _on_connection(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ):
+        peer = writer.get_extra_info("peername")
+        info = FollowerInfo(name=str(peer), address=str(peer))
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                message = json.loads(line)
+                if message["type"] == "sync":
+                    received = self._clock()
+                    writer.write(
+                        _encode(
+                            {
+                                "type": "sync",
+                                "t0": message["t0"],
+                                "t1": received,
+                                "t2": self._clock(),
+                            }
+                        )
+                    )
+                elif message["type"] == "hello":
+                    info.name = message.get("name") or info.name
+                    self._followers[writer] = info
+                    logger.info("Follower '%s' joined from %s", info.name, peer)
+
+                    # Follower joining in the middle of track catches up
+                    command = self._play_command()
+                    if command is not None:
+                        writer.write(_encode(command))
+                elif message["type"] == "report":
+                    self._on_report(info, message)
+        except (ConnectionError, ValueError, KeyError):
+            logger.warning("Follower '%s' misbehaved", info.name, exc_info=True)
+        finally:
+            if self._followers.pop(writer, None) is not None:
+                logger.info("Follower '%s' left", info.name)
+            self._connections.discard(task)
+            writer.close()
+
+    def _on_report(self, info: FollowerInfo, message: tp.Dict[str, tp.Any]):
+        media = self._player.snapshot.media
+        if media is None or media.mrl != message["mrl"]:
+            return
+
+        # Leader position at moment of report, extrapolated from now
+        leader_position = self._position() - (self._clock() - message["at"])
+        info.skew = message["offset"] - leader_position
+        info.max_skew = max(info.max_skew, abs(info.skew))
+        info.reports += 1
+
+
+class MultiroomFollower:
+    # Follower plays what leader tells. Its clock is synchronized with
+    # leader one, drift of playback is corrected by seeking.
+    def __init__(
+        self,
+        player: Player,
+        host: str,
+        port: int = DEFAULT_PORT,
+        name: tp.Optional[str] = None,
+        clock: Clock = time.time,
+        media_factory: MediaFactory = Media,
+    ):
+        self._player = player
+        self._host = host
+        self._port = port
+        self._name = name or socket.gethostname()
+        self._clock = clock
+        self._media_factory = media_factory
+
+        self._sync = ClockSync()
+        self._writer: tp.Optional[asyncio.StreamWriter] = None
+        self._play_task: tp.Optional[asyncio.Task] = None
+        self._mrl: tp.Optional[str] = None
+
+        self._last_seek = 0.0
+        self._seek_lead = 0.0
+        self._seek_pending = False
+
+    @property
+    def clock_sync(self) -> ClockSync:
+        return self._sync
+
+    def leader_time(self) -> float:
+        return self._clock() + self._sync.offset
+
+    async def run(self):
+        while True:
+            try:
+                await self._session()
+            except (OSError, asyncio.IncompleteReadError, ValueError, KeyError):
+                logger.warning("Connection to multiroom leader failed", exc_info=True)
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    async def _session(self):
+        reader, writer = await asyncio.open_connection(self._host, self._port)
+        self._writer = writer
+        self._send({"type": "hello", "name": self._name})
+        logger.info("Connected to multiroom leader %s:%d", self._host, self._port)
+
+        sync_task = asyncio.create_task(self._sync_loop())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                await self._on_message(json.loads(line))
+        finally:
+            sync_task.cancel()
+            self._writer = None
+            writer.close()
+
+    def _send(self, message: tp.Dict[str, tp.Any]):
+        if self._writer is not None and not self._writer.is_closing():
+            self._writer.write(_encode(message))
+
+    async def _sync_loop(self):
+        # Few quick exchanges first, so first track starts in sync
+        for _ in range(SYNC_BURST):
+            self._send({"type": "sync", "t0": self._clock()})
+            await asyncio.sleep(0.2)
+
+        while True:
+            self._send({"type": "sync", "t0": self._clock()})
+            await asyncio.sleep(SYNC_INTERVAL)
+
+    async def _on_message(self, message: tp.Dict[str, tp.Any]):
+        kind = message["type"]
+        if kind == "sync":
+            self._sync.add(message["t0"], message["t1"], message["t2"], self._clock())
+        elif kind == "play":
+            self._start(message)
+        elif kind == "position":
+            self._on_position(message)
+        elif kind == "pause":
+            await self._player.pause()
+        elif kind == "resume":
+            await self._player.resume()
+        elif kind == "stop":
+            self._cancel_play()
+            self._mrl = None
+            await self._player.stop()
+
+    def _cancel_play(self):
+        if self._play_task is not None:
+            self._play_task.cancel()
+            self._play_task = None
+
+    def _start(self, message: tp.Dict[str, tp.Any]):
+        self._cancel_play()
+        self._mrl = message["mrl"]
+        self._play_task = asyncio.create_task(self._play(message))
+
+    async def _play(self, message: tp.Dict[str, tp.Any]):
+        # Parsing is done before start time, so it doesn't add latency
+        media = self._media_factory(message["mrl"])
+        await media.load_metadata()
+
+        delay = message["at"] - self.leader_time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        await self._player.play(media)
+        try:
+            await asyncio.wait_for(
+                self._player.wait_until_playing(), PLAY_START_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            logger.warning("'%s' didn't start playing in time", message["mrl"])
+        if message.get("paused"):
+            await self._player.pause()
+        self._seek(message["offset"] + self.leader_time() - message["at"])
+        self._play_task = None
+
+    def _on_position(self, message: tp.Dict[str, tp.Any]):
+        if message["mrl"] != self._mrl:
+            # Play command was missed, e.g. follower was reconnecting
+            if self._play_task is None:
+                self._start({**message, "paused": False})
+            return
+
+        if self._play_task is not None or self._player.state != PlayerState.Playing:
+            return
+
+        expected = message["offset"] + (self.leader_time() - message["at"])
+        actual = self._player.playback_time
+        drift = actual - expected
+        self._send(
+            {
+                "type": "report",
+                "mrl": self._mrl,
+                "at": self.leader_time(),
+                "offset": actual,
+            }
+        )
+
+        if self._clock() - self._last_seek < SEEK_COOLDOWN:
+            return
+
+        if self._seek_pending:
+            # Drift left after seek is its latency, next seeks compensate it
+            self._seek_pending = False
+            self._seek_lead = sorted((0.0, self._seek_lead - drift, MAX_SEEK_LEAD))[1]
+
+        if abs(drift) > MAX_DRIFT:
+            self._seek(expected)
+
+    def _seek(self, position: float):
+        self._player.cursor = max(position + self._seek_lead, 0.0)
+        self._last_seek = self._clock()
+        self._seek_pending = True
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import subprocess
+    import sys
+    import types
+
+    # Stands in for libvlc player: position runs at slightly wrong rate,
+    # start and seek take time, like on real devices
+    class SimulatedPlayer:
+        def __init__(self, rate: float = 1.0, seek_latency: float = 0.03):
+            self._rate = rate
+            self._seek_latency = seek_latency
+            self._media = None
+            self._state = PlayerState.Stopped
+            self._base_position = 0.0
+            self._base_time = time.monotonic()
+
+        @property
+        def snapshot(self):
+            return types.SimpleNamespace(media=self._media, state=self._state)
+
+        @property
+        def state(self) -> PlayerState:
+            return self._state
+
+        @property
+        def playback_time(self) -> float:
+            if self._state != PlayerState.Playing:
+                return self._base_position
+            elapsed = time.monotonic() - self._base_time
+            return self._base_position + elapsed * self._rate
+
+        @property
+        def cursor(self) -> int:
+            return int(self.playback_time)
+
+        @cursor.setter
+        def cursor(self, position: float):
+            self._base_position = position
+            self._base_time = time.monotonic() + self._seek_latency
+
+        async def play(self, media):
+            await asyncio.sleep(random.uniform(0.05, 0.3))
+            self._media = media
+            self._state = PlayerState.Playing
+            self._base_position = 0.0
+            self._base_time = time.monotonic()
+
+        async def wait_until_playing(self):
+            pass
+
+        async def pause(self):
+            self._base_position = self.playback_time
+            self._state = PlayerState.Paused
+
+        async def resume(self):
+            self._base_time = time.monotonic()
+            self._state = PlayerState.Playing
+
+        async def stop(self):
+            self._media = None
+            self._state = PlayerState.Stopped
+
+    class SimulatedMedia:
+        def __init__(self, mrl: str):
+            self.mrl = mrl
+
+        async def load_metadata(self):
+            await asyncio.sleep(0.02)
+
+    async def run_follower(args):
+        # Clock of every room is off by its own skew
+        follower = MultiroomFollower(
+            SimulatedPlayer(rate=args.rate),
+            "127.0.0.1",
+            args.follower,
+            name=args.name,
+            clock=lambda: time.time() + args.skew,
+            media_factory=SimulatedMedia,
+        )
+        await follower.run()
+
+    async def run_leader(args):
+        player = SimulatedPlayer()
+        leader = MultiroomLeader(player, host="127.0.0.1", port=0)
+        await leader.start()
+
+        rooms = [
+            ("kitchen", 0.5, 1.002),
+            ("hall", -1.2, 0.998),
+            ("balcony", 3.0, 1.0005),
+        ][: args.followers]
+        processes = [
+            subprocess.Popen(
+                [
+                    sys.executable,
+                    __file__,
+                    "--follower",
+                    str(leader.port),
+                    "--name",
+                    name,
+                    "--skew",
+                    str(skew),
+                    "--rate",
+                    str(rate),
+                ]
+            )
+            for name, skew, rate in rooms
+        ]
+
+        skews: tp.Dict[str, tp.List[float]] = collections.defaultdict(list)
+        started = time.monotonic()
+        track = 0
+        try:
+            while time.monotonic() - started < args.seconds:
+                if player.state == PlayerState.Stopped or player.playback_time > 15:
+                    track += 1
+                    mrl = f"file:///music/track-{track}.mp3"
+                    await player.play(SimulatedMedia(mrl))
+
+                await asyncio.sleep(1.0)
+                line = []
+                for info in leader.followers:
+                    if info.skew is None:
+                        continue
+                    # Skew right after track start is not steady state
+                    if player.playback_time > 3:
+                        skews[info.name].append(abs(info.skew))
+                    line.append(f"{info.name} {info.skew * 1000:+6.1f} ms")
+                print(f"t={time.monotonic() - started:4.0f}s  " + "  ".join(line))
+        finally:
+            for process in processes:
+                process.terminate()
+            await leader.stop()
+
+        for name, values in sorted(skews.items()):
+            values.sort()
+            print(
+                f"{name}: median {values[len(values) // 2] * 1000:.1f} ms, "
+                f"p95 {values[int(len(values) * 0.95)] * 1000:.1f} ms, "
+                f"max {values[-1] * 1000:.1f} ms over {len(values)} reports"
+            )
+
+    parser = argparse.ArgumentParser(
+        description="Multiroom sync demo with simulated players on loopback"
+    )
+    parser.add_argument("--followers", type=int, default=3)
+    parser.add_argument("--seconds", type=float, default=40.0)
+    parser.add_argument("--follower", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--name", help=argparse.SUPPRESS)
+    parser.add_argument("--skew", type=float, default=0.0, help=argparse.SUPPRESS)
+    parser.add_argument("--rate", type=float, default=1.0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.follower is not None:
+        asyncio.run(run_follower(args))
+    else:
+        asyncio.run(run_leader(args))
@@ -0,0 +1,200 @@
+import asyncio
+import enum
+import glob
+import logging
+import os
+import typing as tp
+
+logger = logging.getLogger(__name__)
+
+
+class RuntimeLevel(enum.IntEnum):
+    # Every level keeps degradations of previous ones
+    Normal = 0
+    # Info messages are refreshed less often
+    Warm = 1
+    # Background prefetch and loudness analysis are paused
+    Hot = 2
+    # Next tracks are played with bigger input buffers
+    Critical = 3
+
+
+# Values entering Warm, Hot and Critical levels
+TEMPERATURE_THRESHOLDS = (65.0, 72.0, 78.0)
+LOAD_THRESHOLDS = (1.5, 2.5, 4.0)
+
+# Level is left only when value is that much below its threshold,
+# so device sitting at threshold doesn't flip levels on every sample
+TEMPERATURE_HYSTERESIS = 5.0
+LOAD_HYSTERESIS = 0.5
+
+LevelCallback = tp.Callable[[RuntimeLevel], None]
+
+
+class RuntimeSample(tp.NamedTuple):
+    # Hottest thermal zone, Celsius
+    temperature: tp.Optional[float]
+    # One minute load average per CPU
+    load: tp.Optional[float]
+
+
+def _metric_level(
+    value: tp.Optional[float],
+    thresholds: tp.Sequence[float],
+    hysteresis: float,
+    current: RuntimeLevel,
+) -> int:
+    if value is None:
+        return RuntimeLevel.Normal
+
+    heating = sum(value >= threshold for threshold in thresholds)
+    if heating >= current:
+        return heating
+
+    # Cooling down one level per sample
+    cooling = sum(value >= threshold - hysteresis for threshold in thresholds)
+    return min(current, max(cooling, current - 1))
+
+
+class RuntimeGovernor:
+    def __init__(
+        self,
+        root: str = "/",
+        interval: float = 10.0,
+        cpu_count: tp.Optional[int] = None,
+    ):
+        # Root is replaced with fake tree to run governor off device
+        self._root = root
+        self._interval = interval
+        self._cpu_count = cpu_count or os.cpu_count() or 1
+
+        self._level = RuntimeLevel.Normal
+        self._last_sample = RuntimeSample(None, None)
+        self._level_callbacks: tp.List[LevelCallback] = []
+        self._worker_task: tp.Optional[asyncio.Task] = None
+
+    @property
+    def level(self) -> RuntimeLevel:
+        return self._level
+
+    @property
+    def last_sample(self) -> RuntimeSample:
+        return self._last_sample
+
+    def add_level_callback(self, callback: LevelCallback):
+        self._level_callbacks.append(callback)
+
+    def start(self):
+        self._worker_task = asyncio.create_task(self._worker())
+
+    def stop(self):
+        if self._worker_task is not None:
+            self._worker_task.cancel()
+            self._worker_task = None
+
+    def sample(self) -> RuntimeSample:
+        return RuntimeSample(
+            temperature=self._read_temperature(),
+            load=self._read_load(),
+        )
+
+    def update(self, sample: RuntimeSample) -> RuntimeLevel:
+        self._last_sample = sample
+
+        level = RuntimeLevel(
+            max(
+                _metric_level(
+                    sample.temperature,
+                    TEMPERATURE_THRESHOLDS,
+                    TEMPERATURE_HYSTERESIS,
+                    self._level,
+                ),
+                _metric_level(
+                    sample.load, LOAD_THRESHOLDS, LOAD_HYSTERESIS, self._level
+                ),
+            )
+        )
+        if level == self._level:
+            return level
+
+        logger.info(
+            "Runtime level changed from %s to %s (temperature %s, load %s)",
+            self._level.name,
+            level.name,
+            sample.temperature,
+            sample.load,
+        )
+        self._level = level
+
+        for callback in self._level_callbacks:
+            try:
+                callback(level)
+            except Exception:
+                logger.error("Runtime level callback failed", exc_info=True)
+
+        return level
+
+    def _read_temperature(self) -> tp.Optional[float]:
+        temperatures = []
+        for path in glob.glob(
+            os.path.join(self._root, "sys/class/thermal/thermal_zone*/temp")
+        ):
+            try:
+                with open(path) as f:
+                    # Millidegrees Celsius
+                    temperatures.append(int(f.read().strip()) / 1000)
+            except (OSError, ValueError):
+                continue
+
+        return max(temperatures, default=None)
+
+    def _read_load(self) -> tp.Optional[float]:
+        try:
+            with open(os.path.join(self._root, "proc/loadavg")) as f:
+                return float(f.read().split()[0]) / self._cpu_count
+        except (OSError, ValueError, IndexError):
+            return None
+
+    async def _worker(self):
+        while True:
+            try:
+                self.update(self.sample())
+            except Exception:
+                logger.error("Unable to sample runtime state", exc_info=True)
+
+            await asyncio.sleep(self._interval)
+
+
+if __name__ == "__main__":
+    import tempfile
+
+    # Walks governor through heating and cooling of fake device
+    with tempfile.TemporaryDirectory() as root:
+        zone = os.path.join(root, "sys/class/thermal/thermal_zone0")
+        os.makedirs(zone)
+        os.makedirs(os.path.join(root, "proc"))
+
+        def write_state(temperature: float, load: float):
+            with open(os.path.join(zone, "temp"), "w") as f:
+                f.write(f"{int(temperature * 1000)}\n")
+            with open(os.path.join(root, "proc/loadavg"), "w") as f:
+                f.write(f"{load:.2f} 0.50 0.40 1/123 4567\n")
+
+        governor = RuntimeGovernor(root=root, cpu_count=4)
+        governor.add_level_callback(lambda level: print(f"  -> {level.name}"))
+
+        for temperature, load in (
+            (50, 0.4),
+            (66, 1.0),
+            (64, 1.0),
+            (79, 2.0),
+            (74, 2.0),
+            (70, 11.0),
+            (70, 2.0),
+            (62, 2.0),
+            (55, 1.0),
+            (55, 1.0),
+        ):
+            write_state(temperature, load)
+            level = governor.update(governor.sample())
+            print(f"{temperature:>3} C, load {load:>5.2f}: {level.name}")
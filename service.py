@@ -1,16 +1,47 @@
 import asyncio
+import datetime
+import time
 import typing as tp
 import logging
 
 from tg_bot.bot import TelegramBot
-from multimedia.player import Player, PlayerState
-from multimedia.media import Media
-from multimedia.playlist import Playlist
-from database import Database
+from tg_bot.webhook_server import WebhookConfig
+from multimedia.player import Player, PlayerState, PlayerSnapshot
+from multimedia.media import Media, ParseState
+from multimedia.playlist_entry import PlaylistEntry
+from multimedia.mrl import normalize_mrl
+from multimedia.playlist import Playlist, DuplicatePolicy
+from multimedia.loudness import LoudnessAnalyzer
+from multimedia.prefetch_cache import PrefetchCache
+from multimedia.link_warmer import LinkWarmer
+from multimedia.search_index import SearchIndex, SearchDocument
+from multimedia.engine_profiles import EngineProfile, PROFILES
+from runtime_governor import RuntimeGovernor, RuntimeLevel
+from multiroom import MultiroomLeader
+from control_server import ControlServer
+import diagnostics
+from database import Database, ResolvedMedia
 from media_parser.yandex_music_parser import YandexMusicParser
 
+from telegram.request import BaseRequest
+
 logger = logging.getLogger(__name__)
 
+# Timed out medias are parsed again in background and returned to queue
+PARSE_RETRY_ATTEMPTS = 3
+PARSE_RETRY_DELAY = 30.0
+
+# Known tracks indexed at startup between returns to event loop
+SEARCH_INDEX_CHUNK = 1000
+
+# Hotter device refreshes info messages less often
+INFO_UPDATE_INTERVALS = {
+    RuntimeLevel.Normal: datetime.timedelta(seconds=5),
+    RuntimeLevel.Warm: datetime.timedelta(seconds=15),
+    RuntimeLevel.Hot: datetime.timedelta(seconds=30),
+    RuntimeLevel.Critical: datetime.timedelta(seconds=60),
+}
+
 
 def propg(obj, prop):
     def getter():
@@ -27,14 +58,76 @@ def props(obj, prop):
 
 
 class Service:
-    def __init__(self, telegram_bot_token: str, database_path: str):
+    def __init__(
+        self,
+        telegram_bot_token: str,
+        database_path: str,
+        prefetch_cache_path: str = "prefetch_cache",
+        prefetch_cache_bytes: int = 512 * 1024 * 1024,
+        prefetch_ahead: int = 3,
+        webhook_config: tp.Optional[WebhookConfig] = None,
+        telegram_request: tp.Optional[BaseRequest] = None,
+        engine_profile: EngineProfile = PROFILES["default"],
+        runtime_governor: tp.Optional[RuntimeGovernor] = None,
+        max_concurrent_updates: int = 8,
+        duplicate_policy: DuplicatePolicy = DuplicatePolicy.Skip,
+        link_warmup: bool = False,
+        multiroom_listen: tp.Optional[tp.Tuple[str, int]] = None,
+        control_listen: tp.Optional[tp.Tuple[str, int]] = None,
+        control_token: tp.Optional[str] = None,
+        debug_admins: tp.Iterable[int] = (),
+    ):
         self._database = Database(database_path)
         self._bot = TelegramBot(
             telegram_bot_token,
             self._database,
+            webhook_config=webhook_config,
+            request=telegram_request,
+            max_concurrent_updates=max_concurrent_updates,
+            debug_admins=debug_admins,
         )
         self._playlist = Playlist()
-        self._player = Player()
+        self._duplicate_policy = duplicate_policy
+        self._prefetch = PrefetchCache(
+            prefetch_cache_path,
+            byte_budget=prefetch_cache_bytes,
+            lookahead=prefetch_ahead,
+            stream_resolver=self._resolve_stream,
+        )
+        self._player = Player(
+            prefetch_cache=self._prefetch, stream_resolver=self._resolve_stream
+        )
+        self._loudness = LoudnessAnalyzer(self._database)
+        self._parse_retries: tp.Set[asyncio.Task] = set()
+        self._play_lock = asyncio.Lock()
+        self._playback_starts: tp.Set[asyncio.Task] = set()
+        self._notify_task: tp.Optional[asyncio.Task] = None
+
+        # Device is stepped down when it heats up or gets overloaded
+        self._engine_profile = engine_profile
+        self._governor = runtime_governor or RuntimeGovernor()
+        self._governor.add_level_callback(self._on_runtime_level)
+
+        # Links posted in chat are resolved before somebody plays them
+        self._link_warmer: tp.Optional[LinkWarmer] = None
+        if link_warmup:
+            self._link_warmer = LinkWarmer(self._resolve_medias)
+
+        # Followers in other rooms play the same tracks in sync
+        self._multiroom: tp.Optional[MultiroomLeader] = None
+        if multiroom_listen is not None:
+            self._multiroom = MultiroomLeader(self._player, *multiroom_listen)
+
+        # Inline queries search queue, played tracks and database
+        self._search = SearchIndex()
+        self._search_queue_version: tp.Optional[int] = None
+        self._search_loader: tp.Optional[asyncio.Task] = None
+        self._played_mrl: tp.Optional[str] = None
+        self._database.add_medias_callback(self._on_medias_saved)
+        self._player.add_snapshot_callback(self._on_player_snapshot)
+
+        # Downloaded tracks are analyzed from their local copies
+        self._prefetch.add_ready_callback(self._loudness.schedule)
 
         # Preparing extention parsers
         self._media_parsers = [
@@ -43,14 +136,18 @@ class Service:
 
         # Setting up bot
         self._bot.callbacks.add_to_playlist = self._on_add_content
+        self._bot.callbacks.add_resolved_to_playlist = self._on_add_resolved
+        self._bot.callbacks.resolve_for_playlist = self._resolve_entries
+        self._bot.callbacks.add_entries_to_playlist = self._on_add_entries
         self._bot.callbacks.list_playlist = propg(self._playlist, "items")
+        self._bot.callbacks.head_playlist = self._playlist.head
+        self._bot.callbacks.get_playlist_length = self._playlist.__len__
         self._bot.callbacks.current_media = propg(self._player, "current_media")
         self._bot.callbacks.current_player_state = propg(self._player, "state")
         self._bot.callbacks.pause = self._player.pause
         self._bot.callbacks.resume = self._player.resume
         self._bot.callbacks.skip = self.play_next
         self._bot.callbacks.skipall = self.clear_playlist
-        self._bot.callbacks.shuffle = self.shuffle
         self._bot.callbacks.get_seek = propg(self._player, "cursor")
         self._bot.callbacks.set_seek = props(self._player, "cursor")
         self._bot.callbacks.get_volume = propg(self._player, "volume")
@@ -58,10 +155,44 @@ class Service:
         self._bot.callbacks.get_cursor = propg(self._player, "cursor")
         self._bot.callbacks.set_cursor = props(self._player, "cursor")
         self._bot.callbacks.get_length = propg(self._player, "length")
+        self._bot.callbacks.get_player_snapshot = propg(self._player, "snapshot")
+        self._bot.callbacks.get_playlist_version = propg(self._playlist, "version")
+        self._bot.callbacks.get_fair_queue = propg(self._playlist, "is_fair")
+        self._bot.callbacks.set_fair_queue = self.set_fair_queue
+        self._bot.callbacks.get_shuffle_play = propg(self._playlist, "is_shuffled")
+        self._bot.callbacks.set_shuffle_play = self.set_shuffle_play
+        self._bot.callbacks.get_prefetch_stats = propg(self._prefetch, "stats")
+        self._bot.callbacks.search_tracks = self._search_tracks
+        self._bot.callbacks.get_search_result = self._search.get
+        if self._link_warmer is not None:
+            self._bot.callbacks.warm_up_links = self._on_links_posted
+
+        # Local clients control player with the same callbacks as bot
+        self._control: tp.Optional[ControlServer] = None
+        if control_listen is not None:
+            self._control = ControlServer(
+                self._bot.callbacks, *control_listen, token=control_token
+            )
+            self._player.add_snapshot_callback(self._control.notify_changed)
+            self._playlist.add_change_callback(self._control.notify_changed)
 
     async def run(self):
         # Initializing database
         await self._database.initialize()
+        self._search_loader = asyncio.create_task(self._load_search_index())
+
+        # Downloading queued remote tracks in background
+        self._prefetch.start()
+        if self._link_warmer is not None:
+            self._link_warmer.start()
+
+        # Watching temperature and load of device
+        self._governor.start()
+
+        if self._multiroom is not None:
+            await self._multiroom.start()
+        if self._control is not None:
+            await self._control.start()
 
         # Running bot coro
         await self._bot.run()
@@ -70,8 +201,109 @@ class Service:
         # todo: move to detached coroutine
         await self.autoplay()
 
-    async def _on_add_content(self, mri: str):
-        # Trying to preparse media
+    async def _load_search_index(self):
+        # Big library is indexed in chunks, so bot keeps answering.
+        # Oldest tracks go first, index evicts them first.
+        medias = await self._database.fetch_known_medias(self._search.max_documents)
+        medias.reverse()
+        for start in range(0, len(medias), SEARCH_INDEX_CHUNK):
+            self._on_medias_saved(medias[start : start + SEARCH_INDEX_CHUNK])
+            await asyncio.sleep(0)
+        logger.info("Indexed %d known tracks for search", len(medias))
+
+    def _on_medias_saved(self, medias: tp.List[ResolvedMedia]):
+        for media in medias:
+            self._search.add(
+                media.mrl, media.title, media.artist, media.duration, media.resolved_at
+            )
+
+    def _on_player_snapshot(self, snapshot: PlayerSnapshot):
+        # Played tracks are found even if they were never saved
+        if snapshot.media is None or snapshot.media.mrl == self._played_mrl:
+            return
+        self._played_mrl = snapshot.media.mrl
+        self._search.add(snapshot.media.mrl, *snapshot.media.known_metadata)
+
+    def _search_tracks(self, query: str, limit: int) -> tp.List[SearchDocument]:
+        started = time.perf_counter()
+
+        # Queue changes much more often than it's searched, so it's synced
+        # on demand
+        if self._playlist.version != self._search_queue_version:
+            self._search.set_queue(self._playlist.items)
+            self._search_queue_version = self._playlist.version
+
+        documents = self._search.search(query, limit)
+        diagnostics.record(
+            "search.query",
+            results=len(documents),
+            elapsed=round(time.perf_counter() - started, 4),
+        )
+        return documents
+
+    def _on_runtime_level(self, level: RuntimeLevel):
+        self._bot.set_info_update_interval(INFO_UPDATE_INTERVALS[level])
+
+        if level >= RuntimeLevel.Hot:
+            self._prefetch.pause()
+            self._loudness.pause()
+            if self._link_warmer is not None:
+                self._link_warmer.pause()
+        else:
+            self._prefetch.resume()
+            self._loudness.resume()
+            if self._link_warmer is not None:
+                self._link_warmer.resume()
+
+        self._player.set_media_options(
+            self._engine_profile.degraded_media_options()
+            if level >= RuntimeLevel.Critical
+            else []
+        )
+
+    async def _on_add_content(self, mri: str, requester: tp.Optional[int] = None):
+        return await self._on_add_entries(await self._resolve_entries(mri, requester))
+
+    async def _resolve_entries(
+        self, mri: str, requester: tp.Optional[int] = None
+    ) -> tp.List[PlaylistEntry]:
+        # Entries, which mri adds. Queue isn't changed, so slow resolution
+        # doesn't hold anybody, who changes queue meanwhile.
+        if self._duplicate_policy != DuplicatePolicy.Allow:
+            # Queued tracks and albums are found before any resolution
+            duplicates = self._playlist.find_duplicates(mri)
+            if duplicates:
+                return [entry.copy(requester) for entry in duplicates]
+
+        entries = await self._resolve_link(mri, requester)
+        # Entries remember link, so it's found as duplicate next time
+        for entry in entries:
+            entry.source = mri
+        return entries
+
+    async def _resolve_link(
+        self, mri: str, requester: tp.Optional[int]
+    ) -> tp.List[PlaylistEntry]:
+        # Link may be resolved already, when it was posted in chat
+        if self._link_warmer is not None:
+            medias = await self._link_warmer.take(mri)
+            if medias is not None:
+                logger.info("Adding %d warmed up medias of '%s'", len(medias), mri)
+                return [PlaylistEntry.from_media(m, requester) for m in medias]
+
+        parsed_medias = await self._preparse(mri)
+        if parsed_medias is not None:
+            result = []
+            for media in parsed_medias:
+                result += await self._resolve_entries(media, requester)
+            return result
+
+        logger.info("Resolving content with mri: '%s'", mri)
+        medias = await self._playlist.resolve_content(mri)
+        return [PlaylistEntry.from_media(m, requester) for m in medias]
+
+    async def _preparse(self, mri: str) -> tp.Optional[tp.List[str]]:
+        # Mris returned by first suitable parser, None if there is no one
         for parser in self._media_parsers:
             # Does parser is suitable for provided url
             if not await parser.is_suitable(mri):
@@ -80,7 +312,10 @@ class Service:
             # Trying to parse media with parser
             try:
                 parsed_media = await parser.parse_media(mri)
-            except Exception:
+            except Exception as e:
+                diagnostics.record(
+                    "parser.result", parser=str(parser), mri=mri, error=repr(e)
+                )
                 logger.warning(
                     "Preparsing '%s' with '%s' failed",
                     mri,
@@ -95,62 +330,253 @@ class Service:
                     str(parser),
                     type(parsed_media),
                 )
-                break
+                return None
+
+            diagnostics.record(
+                "parser.result", parser=str(parser), mri=mri, medias=len(parsed_media)
+            )
 
-            result = []
             logger.info(
                 "Adding %d medias parsed with '%s': %s",
                 len(parsed_media),
                 str(parser),
                 ", ".join(parsed_media),
             )
-            for media in parsed_media:
-                result += await self._on_add_content(media)
-            return result
+            return parsed_media
 
-        content = await self._playlist.add_content(mri)
+        return None
 
+    async def _resolve_medias(self, mri: str) -> tp.List[Media]:
+        # Same resolution as in _on_add_content, but queue isn't changed
+        parsed_medias = await self._preparse(mri)
+        if parsed_medias is None:
+            return await self._playlist.resolve_content(mri)
+
+        result = []
+        for media in parsed_medias:
+            result += await self._resolve_medias(media)
+        return result
+
+    async def _resolve_stream(self, mrl: str) -> tp.Optional[str]:
+        for parser in self._media_parsers:
+            stream = await parser.resolve_stream(mrl)
+            if stream is not None:
+                return stream
+        return None
+
+    async def _on_links_posted(self, urls: tp.List[str]):
+        # Only links, which parsers know, are worth resolving in advance
+        for url in urls:
+            if self._playlist.find_duplicate(url) is not None:
+                continue
+
+            for parser in self._media_parsers:
+                if await parser.is_suitable(url):
+                    self._link_warmer.schedule(url)
+                    break
+
+    async def _on_add_resolved(
+        self,
+        resolved: tp.List[ResolvedMedia],
+        requester: tp.Optional[int] = None,
+    ) -> tp.List[PlaylistEntry]:
+        return await self._on_add_entries(
+            [
+                PlaylistEntry(
+                    media.mrl,
+                    title=media.title,
+                    artist=media.artist,
+                    duration=media.duration,
+                    requester=requester,
+                    source=media.uri,
+                )
+                for media in resolved
+            ]
+        )
+
+    async def _on_add_entries(
+        self, entries: tp.List[PlaylistEntry]
+    ) -> tp.List[PlaylistEntry]:
+        # Policy is applied to resolved entries, queue may be changed while
+        # they were resolved
+        added = []
+        duplicates = []
+        added_keys = set()
+        # Backwards, so tracks of album moved to front keep their order
+        for entry in reversed(entries):
+            found = self._apply_duplicate_policy(entry.mrl)
+            if found is not None:
+                duplicates += found
+                continue
+
+            # Repeats within same batch are duplicates as well
+            key = normalize_mrl(entry.mrl)
+            if self._duplicate_policy != DuplicatePolicy.Allow and key in added_keys:
+                continue
+            added_keys.add(key)
+            added.append(entry)
+        added.reverse()
+        duplicates.reverse()
+
+        content = self._playlist.add_entries(added)
+        self._on_queue_extended(content)
+        return duplicates + content
+
+    def _apply_duplicate_policy(
+        self, mrl: str
+    ) -> tp.Optional[tp.List[PlaylistEntry]]:
+        # None, if mrl has to be added. Otherwise entries to report instead.
+        if self._duplicate_policy == DuplicatePolicy.Allow:
+            return None
+
+        duplicate = self._playlist.find_duplicate(mrl)
+        if duplicate is None:
+            return None
+
+        diagnostics.record(
+            "playlist.duplicate", mrl=mrl, policy=self._duplicate_policy.value
+        )
+        if self._duplicate_policy == DuplicatePolicy.Skip:
+            logger.info("'%s' is already queued, skipping it", mrl)
+            return []
+
+        logger.info("'%s' is already queued, moving it to front", mrl)
+        self._playlist.move_to_front(duplicate)
+        self._update_prefetch()
+        return [duplicate]
+
+    def _on_queue_extended(self, content: tp.List[PlaylistEntry]):
+        # Analyzing loudness in background, while track waits in queue
+        for media in content:
+            self._loudness.schedule(media.mrl)
+
+        # Next track is parsed in background, adding to queue doesn't wait
+        # for it
         if self._player.state == PlayerState.Stopped:
-            await self.play_next()
+            task = asyncio.create_task(self._start_playback())
+            self._playback_starts.add(task)
+            task.add_done_callback(self._playback_starts.discard)
+
+        self._update_prefetch()
 
-        return content
+    async def _start_playback(self):
+        try:
+            # Checked under lock, so concurrent additions start only one track
+            async with self._play_lock:
+                if self._player.state == PlayerState.Stopped:
+                    await self._play_next()
+        except Exception:
+            logger.error("Unable to start playback", exc_info=True)
 
-    async def shuffle(self):
-        self._playlist.shuffle()
+    def set_fair_queue(self, enabled: bool):
+        self._playlist.set_fair(enabled)
+        self._update_prefetch()
+
+    def set_shuffle_play(self, enabled: bool, seed: tp.Optional[int] = None):
+        self._playlist.set_shuffle(enabled, seed)
+        self._update_prefetch()
 
     async def clear_playlist(self) -> bool:
+        for task in list(self._parse_retries):
+            task.cancel()
+
         self._playlist.clear()
+        self._update_prefetch()
         return True
 
+    def _update_prefetch(self):
+        self._prefetch.update_queue(
+            entry.mrl for entry in self._playlist.head(self._prefetch.lookahead)
+        )
+
     async def play_next(self) -> bool:
-        if not self._playlist.items:
-            result = self._player.state in (PlayerState.Playing, PlayerState.Paused)
-            await self._player.stop()
-            return result
+        async with self._play_lock:
+            return await self._play_next()
+
+    async def _play_next(self) -> bool:
+        while len(self._playlist):
+            # Entry is in playback window, so its media is already created.
+            # Popping entry releases it, player keeps media while playing.
+            entry = self._playlist.last
+            media = entry.materialize()
+            self._playlist.pop_last()
+            self._update_prefetch()
+
+            # Dead or slow media must not block the queue
+            state = await media.load_metadata()
+            if state == ParseState.Failed:
+                logger.warning("Skipping '%s', it can't be parsed", media.mrl)
+                continue
+            if state == ParseState.Timeout:
+                logger.warning(
+                    "Parsing '%s' timed out, retrying it in background", media.mrl
+                )
+                self._retry_parse(media, entry.requester)
+                continue
 
-        last_media = self._playlist.last
-        self._playlist.pop_last()
+            logger.info(
+                "Playing '%s' next. There is %d medias left in playlist",
+                await media.media_title,
+                len(self._playlist),
+            )
 
-        logger.info(
-            "Playing '%s' next. There is %d medias left in playlist",
-            await last_media.media_title,
-            len(self._playlist.items),
-        )
+            if self._player.state in (PlayerState.Playing, PlayerState.Paused):
+                await self._player.stop()
 
-        await self._bot.notify_currently_playing(last_media)
+            await self._player.play(
+                media,
+                gain_db=await self._loudness.gain_for(media.mrl),
+            )
+            self._notify_playing(media)
+            return True
+
+        result = self._player.state in (PlayerState.Playing, PlayerState.Paused)
+        await self._player.stop()
+        return result
+
+    def _notify_playing(self, media: Media):
+        # Broadcast may wait for flood control, track doesn't wait for it.
+        # Announcement of skipped track is outdated, so it's cancelled.
+        if self._notify_task is not None:
+            self._notify_task.cancel()
+        self._notify_task = asyncio.create_task(self._notify_playing_task(media))
+
+    async def _notify_playing_task(self, media: Media):
+        try:
+            await self._bot.notify_currently_playing(media)
+        except Exception:
+            logger.error("Unable to notify about '%s'", media.mrl, exc_info=True)
+
+    def _retry_parse(self, media: Media, requester: tp.Optional[int]):
+        task = asyncio.create_task(self._retry_parse_task(media, requester))
+        self._parse_retries.add(task)
+        task.add_done_callback(self._parse_retries.discard)
+
+    async def _retry_parse_task(self, media: Media, requester: tp.Optional[int]):
+        for attempt in range(PARSE_RETRY_ATTEMPTS):
+            await asyncio.sleep(PARSE_RETRY_DELAY * 2**attempt)
+
+            state = await media.load_metadata(retry=True)
+            if state == ParseState.Done:
+                logger.info("'%s' is parsed on retry, returning it to queue", media.mrl)
+                self._on_queue_extended(
+                    self._playlist.add_entries(
+                        [PlaylistEntry.from_media(media, requester)]
+                    )
+                )
+                return
 
-        if self._player.state in (PlayerState.Playing, PlayerState.Paused):
-            await self._player.stop()
+            if state == ParseState.Failed:
+                break
 
-        await self._player.play(last_media)
-        return True
+        logger.warning("Giving up on '%s'", media.mrl)
 
     async def autoplay(self):
         while True:
             await self._player.wait_until_end_reached()
             logger.info("Track end has been reached. Autoplaying next.")
 
-            if not self._playlist.items:
+            if not len(self._playlist):
                 logger.info("Nothing to play next.")
                 continue
 
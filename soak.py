@@ -0,0 +1,558 @@
+# Soak test. Drives Service with fake libvlc and fake Bot API through
+# simulated days of chat traffic in compressed time and watches for
+# leaks: RSS, tracemalloc growth, live tasks, VLC event listeners, bot
+# handlers and live media objects. Exits with 1 when growth between the
+# first and the last simulated day exceeds thresholds.
+#
+#   python soak.py --days 3 --hour-seconds 2
+import argparse
+import asyncio
+import dataclasses
+import datetime
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+import typing as tp
+import weakref
+
+import vlc
+
+from telegram.request import BaseRequest
+
+from service import Service
+from multimedia.media import Media
+from tg_bot.module.info_updater_module import InfoUpdaterModule
+
+logger = logging.getLogger("soak")
+
+# Simulated seconds per real second, set from command line
+TIME_SCALE = 3600.0
+
+PARSE_DELAY = 0.005
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "soak", "username": "soak_bot"}
+
+live_medias: "weakref.WeakSet[FakeVlcMedia]" = weakref.WeakSet()
+
+
+class FakeEventManager:
+    def __init__(self):
+        self._callbacks: tp.Dict[int, tp.Callable] = {}
+
+    def event_attach(self, event_type, callback, *args, **kwargs):
+        self._callbacks[event_type.value] = callback
+
+    def event_detach(self, event_type):
+        self._callbacks.pop(event_type.value, None)
+
+    def emit(self, event_type, **payload):
+        callback = self._callbacks.get(event_type.value)
+        if callback is not None:
+            callback(
+                types.SimpleNamespace(
+                    type=event_type, u=types.SimpleNamespace(**payload)
+                )
+            )
+
+
+# Mrls understood by fake libvlc:
+#   soak://track/<id>?d=<seconds>
+#   soak://album/<id>?tracks=<count>
+#   soak://dead/<id>
+class FakeVlcMedia:
+    def __init__(self, mrl: str):
+        self._mrl = mrl
+        self._events = FakeEventManager()
+        self._status = None
+        self._subitems: tp.List[FakeVlcMedia] = []
+        self.options: tp.List[str] = []
+        live_medias.add(self)
+
+    @property
+    def kind(self) -> str:
+        return self._mrl.split("/")[2]
+
+    @property
+    def track_id(self) -> str:
+        return self._mrl.split("/")[3].split("?")[0]
+
+    @property
+    def duration(self) -> int:
+        if "?d=" in self._mrl:
+            return int(self._mrl.rsplit("=", 1)[1])
+        return 0
+
+    def get_mrl(self) -> str:
+        return self._mrl
+
+    def add_option(self, option: str):
+        self.options.append(option)
+
+    def duplicate(self) -> "FakeVlcMedia":
+        media = FakeVlcMedia(self._mrl)
+        media.options = list(self.options)
+        return media
+
+    def event_manager(self) -> FakeEventManager:
+        return self._events
+
+    def parse_with_options(self, flags, timeout):
+        asyncio.get_running_loop().call_later(PARSE_DELAY, self._parsed)
+        return 0
+
+    def _parsed(self):
+        if self.kind == "dead":
+            self._status = vlc.MediaParsedStatus.failed
+        else:
+            self._status = vlc.MediaParsedStatus.done
+
+        if self.kind == "album":
+            count = int(self._mrl.rsplit("=", 1)[1])
+            self._subitems = [
+                FakeVlcMedia(
+                    f"soak://track/{self.track_id}-{i}?d={random.randint(90, 400)}"
+                )
+                for i in range(count)
+            ]
+
+        self._events.emit(vlc.EventType.MediaParsedChanged)
+
+    def parse_stop(self):
+        pass
+
+    def get_parsed_status(self):
+        return self._status
+
+    def subitems(self):
+        return list(self._subitems)
+
+    def get_meta(self, meta):
+        if self._status is None:
+            return None
+        if meta == vlc.Meta.Title:
+            return f"Track {self.track_id}"
+        if meta == vlc.Meta.Artist:
+            return f"Artist {hash(self.track_id) % 50}"
+        return None
+
+    def get_duration(self) -> int:
+        if self._status is None:
+            return -1
+        return self.duration * 1000
+
+
+class FakeMediaPlayer:
+    def __init__(self):
+        self._events = FakeEventManager()
+        self._media: tp.Optional[FakeVlcMedia] = None
+        self._end_handle: tp.Optional[asyncio.TimerHandle] = None
+        self._left = 0.0
+        self._started = 0.0
+
+    def event_manager(self) -> FakeEventManager:
+        return self._events
+
+    def audio_set_volume(self, volume: int):
+        return 0
+
+    def set_media(self, media: FakeVlcMedia):
+        self._media = media
+
+    def set_time(self, time_ms: int):
+        pass
+
+    def play(self) -> int:
+        self._cancel_end()
+        self._events.emit(vlc.EventType.MediaPlayerOpening)
+        self._events.emit(vlc.EventType.MediaPlayerPlaying)
+
+        duration = self._media.duration if self._media is not None else 0
+        self._events.emit(
+            vlc.EventType.MediaPlayerLengthChanged, new_length=duration * 1000
+        )
+        self._schedule_end(duration / TIME_SCALE)
+        return 0
+
+    def set_pause(self, paused: bool):
+        if paused:
+            self._left -= time.monotonic() - self._started
+            self._cancel_end()
+            self._events.emit(vlc.EventType.MediaPlayerPaused)
+        else:
+            self._schedule_end(self._left)
+            self._events.emit(vlc.EventType.MediaPlayerPlaying)
+
+    def stop(self):
+        self._cancel_end()
+        self._events.emit(vlc.EventType.MediaPlayerStopped)
+
+    def _schedule_end(self, delay: float):
+        self._left = max(delay, 0.0)
+        self._started = time.monotonic()
+        self._end_handle = asyncio.get_running_loop().call_later(
+            self._left, self._end_reached
+        )
+
+    def _end_reached(self):
+        self._end_handle = None
+        self._events.emit(vlc.EventType.MediaPlayerEndReached)
+
+    def _cancel_end(self):
+        if self._end_handle is not None:
+            self._end_handle.cancel()
+            self._end_handle = None
+
+
+class FakeBotApi(BaseRequest):
+    def __init__(self):
+        self._updates: asyncio.Queue = asyncio.Queue()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._callback_ids = itertools.count(1)
+
+        # Last message with keyboard in every chat, users press its buttons
+        self.keyboards: tp.Dict[int, tp.Dict[str, tp.Any]] = {}
+        self.calls: tp.Dict[str, int] = {}
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def push_command(self, chat_id: int, user_id: int, text: str):
+        self._updates.put_nowait(
+            {
+                "update_id": next(self._update_ids),
+                "message": {
+                    "message_id": next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "group", "title": "soak"},
+                    "from": self._user(user_id),
+                    "text": text,
+                    "entities": [
+                        {
+                            "type": "bot_command",
+                            "offset": 0,
+                            "length": len(text.split(" ", 1)[0]),
+                        }
+                    ],
+                },
+            }
+        )
+
+    def push_button(self, chat_id: int, user_id: int) -> bool:
+        message = self.keyboards.get(chat_id)
+        if message is None:
+            return False
+
+        # Placeholder buttons have no processor
+        buttons = [
+            button
+            for row in message["reply_markup"]["inline_keyboard"]
+            for button in row
+            if json.loads(button["callback_data"])["type"] != "none"
+        ]
+        if not buttons:
+            return False
+
+        self._updates.put_nowait(
+            {
+                "update_id": next(self._update_ids),
+                "callback_query": {
+                    "id": str(next(self._callback_ids)),
+                    "from": self._user(user_id),
+                    "chat_instance": str(chat_id),
+                    "data": random.choice(buttons)["callback_data"],
+                    "message": message,
+                },
+            }
+        )
+        return True
+
+    async def do_request(
+        self,
+        url: str,
+        method: str,
+        request_data=None,
+        read_timeout=None,
+        write_timeout=None,
+        connect_timeout=None,
+        pool_timeout=None,
+    ) -> tp.Tuple[int, bytes]:
+        endpoint = url.rsplit("/", 1)[-1]
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        params = request_data.parameters if request_data is not None else {}
+
+        if endpoint == "getMe":
+            result = BOT_USER
+        elif endpoint == "getUpdates":
+            result = await self._get_updates()
+        elif endpoint in ("sendMessage", "editMessageText", "sendDocument"):
+            result = self._message(params)
+        else:
+            result = True
+
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+    async def _get_updates(self) -> tp.List[tp.Dict[str, tp.Any]]:
+        try:
+            updates = [await asyncio.wait_for(self._updates.get(), 1.0)]
+        except asyncio.TimeoutError:
+            return []
+
+        while not self._updates.empty():
+            updates.append(self._updates.get_nowait())
+        return updates
+
+    def _message(self, params: tp.Dict[str, tp.Any]) -> tp.Dict[str, tp.Any]:
+        chat_id = int(params["chat_id"])
+        message = {
+            "message_id": int(params.get("message_id") or next(self._message_ids)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "group", "title": "soak"},
+            "from": BOT_USER,
+            "text": params.get("text") or "",
+        }
+
+        reply_markup = params.get("reply_markup")
+        if reply_markup is not None:
+            if isinstance(reply_markup, str):
+                reply_markup = json.loads(reply_markup)
+            message["reply_markup"] = reply_markup
+            self.keyboards[chat_id] = message
+
+        return message
+
+    @staticmethod
+    def _user(user_id: int) -> tp.Dict[str, tp.Any]:
+        return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+
+@dataclasses.dataclass()
+class Sample:
+    hour: int
+    rss: int
+    traced: int
+    tasks: int
+    in_flight: int
+    listeners: int
+    handlers: int
+    medias: int
+    info_messages: int
+    queue: int
+
+
+def current_rss() -> int:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def take_sample(service, hour: int) -> Sample:
+    application = service._bot._application
+    info_updater = service._bot._modules.find_module(InfoUpdaterModule)
+
+    return Sample(
+        hour=hour,
+        rss=current_rss(),
+        traced=tracemalloc.get_traced_memory()[0],
+        tasks=len(asyncio.all_tasks()),
+        in_flight=service._bot._application.in_flight,
+        listeners=service._player.events.listeners_count,
+        handlers=sum(len(handlers) for handlers in application.handlers.values()),
+        medias=len(live_medias),
+        info_messages=len(info_updater._info_messages),
+        queue=len(service._playlist),
+    )
+
+
+def print_sample(sample: Sample):
+    print(
+        f"day {sample.hour // 24:>3} hour {sample.hour % 24:>2}  "
+        f"rss {sample.rss / 2**20:7.1f} MiB  "
+        f"traced {sample.traced / 2**20:6.2f} MiB  "
+        f"tasks {sample.tasks:>3} ({sample.in_flight:>2} updates)  "
+        f"listeners {sample.listeners:>3}  handlers {sample.handlers:>3}  "
+        f"medias {sample.medias:>5}  info {sample.info_messages:>2}  "
+        f"queue {sample.queue:>4}",
+        flush=True,
+    )
+
+
+async def simulate_hour(api: FakeBotApi, chats: tp.Dict[int, tp.List[int]], hour: int):
+    track_ids = itertools.count(hour * 100000)
+    actions_per_chat = 4 if 9 <= hour % 24 <= 23 else 1
+
+    for chat_id, users in chats.items():
+        for _ in range(actions_per_chat):
+            user_id = random.choice(users)
+            roll = random.random()
+            if roll < 0.25:
+                urls = [
+                    f"soak://track/{next(track_ids)}?d={random.randint(90, 400)}"
+                    for _ in range(random.randint(1, 3))
+                ]
+                api.push_command(chat_id, user_id, "/p " + " ".join(urls))
+            elif roll < 0.30:
+                api.push_command(
+                    chat_id,
+                    user_id,
+                    f"/p soak://album/{next(track_ids)}?tracks={random.randint(5, 20)}",
+                )
+            elif roll < 0.33:
+                api.push_command(chat_id, user_id, f"/p soak://dead/{next(track_ids)}")
+            elif roll < 0.45:
+                api.push_command(chat_id, user_id, "/info")
+            elif roll < 0.85:
+                api.push_button(chat_id, user_id)
+            elif roll < 0.88:
+                api.push_command(chat_id, user_id, "/stats")
+            elif roll < 0.90:
+                api.push_command(
+                    chat_id, user_id, random.choice(["/debug", "/debug 5m"])
+                )
+            elif roll < 0.95:
+                api.push_command(chat_id, user_id, f"/volume {random.randint(0, 100)}")
+            else:
+                api.push_command(chat_id, user_id, "/skip")
+
+
+async def soak(args) -> bool:
+    global TIME_SCALE
+    TIME_SCALE = 3600.0 / args.hour_seconds
+
+    # Fake libvlc is installed before any vlc object is created
+    vlc.Media = FakeVlcMedia
+    vlc.MediaPlayer = FakeMediaPlayer
+
+    Media.parse_timeout = 1.0
+
+    workdir = tempfile.mkdtemp(prefix="soak-")
+    api = FakeBotApi()
+    service = Service(
+        telegram_bot_token="123456:SOAK",
+        database_path=os.path.join(workdir, "db.sqlite3"),
+        prefetch_cache_path=os.path.join(workdir, "prefetch_cache"),
+        telegram_request=api,
+    )
+
+    service_task = asyncio.create_task(service.run())
+    while not api.calls.get("getUpdates"):
+        await asyncio.sleep(0.05)
+
+    # Info messages are refreshed every second, zero interval turns
+    # auto-update into busy loop starving the rest of the bot
+    service._bot._modules.find_module(
+        InfoUpdaterModule
+    )._update_interval = datetime.timedelta(seconds=1)
+
+    chats = {
+        -1000 - i: [i * 10 + j for j in range(1, 4)] for i in range(args.chats)
+    }
+
+    tracemalloc.start()
+    baseline: tp.Optional[tracemalloc.Snapshot] = None
+    day_samples: tp.List[Sample] = []
+
+    for hour in range(args.days * 24):
+        await simulate_hour(api, chats, hour)
+        await asyncio.sleep(args.hour_seconds)
+
+        # People clear the queue at night, so queue length doesn't look
+        # like leak when days are compared.
+        if hour % 24 == 23:
+            await service.clear_playlist()
+            await asyncio.sleep(args.hour_seconds / 4)
+
+        sample = take_sample(service, hour)
+        print_sample(sample)
+
+        if hour % 24 == 23:
+            day_samples.append(sample)
+            if baseline is None:
+                baseline = tracemalloc.take_snapshot()
+
+    final = tracemalloc.take_snapshot()
+
+    # Database threads aren't daemonic, process won't exit while they live
+    service_task.cancel()
+    application = service._bot._application
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    await service._database.close()
+
+    print("\nBot API calls:", json.dumps(api.calls, sort_keys=True))
+
+    print("\nLive tasks by coroutine:")
+    coroutines: tp.Dict[str, int] = {}
+    for task in asyncio.all_tasks():
+        name = task.get_coro().__qualname__
+        coroutines[name] = coroutines.get(name, 0) + 1
+    for name, count in sorted(coroutines.items(), key=lambda item: -item[1])[:10]:
+        print(f"  {count:>4} {name}")
+
+    print("\nTop tracemalloc growth since first day:")
+    for stat in final.compare_to(baseline, "lineno")[:10]:
+        print(f"  {stat}")
+
+    first, last = day_samples[0], day_samples[-1]
+    failures = []
+    if last.rss - first.rss > args.max_rss_growth * 2**20:
+        failures.append(f"RSS grew by {(last.rss - first.rss) / 2**20:.1f} MiB")
+    if last.traced - first.traced > args.max_traced_growth * 2**20:
+        failures.append(
+            f"traced memory grew by {(last.traced - first.traced) / 2**20:.2f} MiB"
+        )
+    if last.tasks - first.tasks > args.max_tasks_growth:
+        failures.append(f"live tasks grew from {first.tasks} to {last.tasks}")
+    if last.listeners - first.listeners > args.max_listeners_growth:
+        failures.append(
+            f"VLC event listeners grew from {first.listeners} to {last.listeners}"
+        )
+    if last.handlers > first.handlers:
+        failures.append(f"bot handlers grew from {first.handlers} to {last.handlers}")
+    if last.medias - first.medias > args.max_medias_growth:
+        failures.append(f"live medias grew from {first.medias} to {last.medias}")
+
+    print()
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print(f"OK: no growth over {len(day_samples)} simulated days")
+
+    return not failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--hour-seconds", type=float, default=2.0)
+    parser.add_argument("--chats", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-rss-growth", type=float, default=16.0, help="MiB")
+    parser.add_argument("--max-traced-growth", type=float, default=4.0, help="MiB")
+    parser.add_argument("--max-tasks-growth", type=int, default=8)
+    parser.add_argument("--max-medias-growth", type=int, default=50)
+    # Autoplay subscribes to end of track only while waiting for it
+    parser.add_argument("--max-listeners-growth", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.days < 2:
+        parser.error("at least 2 days are required to compare growth")
+
+    random.seed(args.seed)
+    logging.basicConfig(level=logging.ERROR)
+
+    sys.exit(0 if asyncio.run(soak(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
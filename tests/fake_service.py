@@ -0,0 +1,44 @@
+import asyncio
+import contextlib
+import typing as tp
+
+import vlc
+
+import soak
+from service import Service
+
+
+async def wait_for(predicate: tp.Callable[[], bool], timeout: float = 5.0):
+    async def poll():
+        while not predicate():
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+@contextlib.asynccontextmanager
+async def run_service(tmp_path, **kwargs):
+    # Service with fake libvlc and Bot API of soak test, polling updates
+    media_class, player_class = vlc.Media, vlc.MediaPlayer
+    vlc.Media, vlc.MediaPlayer = soak.FakeVlcMedia, soak.FakeMediaPlayer
+
+    api = soak.FakeBotApi()
+    service = Service(
+        telegram_bot_token="123456:TEST",
+        database_path=str(tmp_path / "db.sqlite3"),
+        prefetch_cache_path=str(tmp_path / "prefetch_cache"),
+        telegram_request=api,
+        **kwargs,
+    )
+    service_task = asyncio.create_task(service.run())
+    try:
+        await wait_for(lambda: api.calls.get("getUpdates"))
+        yield service, api
+    finally:
+        service_task.cancel()
+        application = service._bot._application
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+        await service._database.close()
+        vlc.Media, vlc.MediaPlayer = media_class, player_class
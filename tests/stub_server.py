@@ -0,0 +1,15 @@
+import contextlib
+import typing as tp
+
+from http_server import HttpServer, HttpHandler
+
+
+@contextlib.asynccontextmanager
+async def serve(handler: HttpHandler) -> tp.AsyncIterator[str]:
+    # Local server on random port, yields its base url
+    server = HttpServer(handler)
+    await server.start()
+    try:
+        yield f"http://127.0.0.1:{server.port}"
+    finally:
+        await server.stop()
@@ -0,0 +1,42 @@
+import asyncio
+
+from fake_service import run_service, wait_for
+
+CHAT_ID = -1001
+USER_ID = 7
+
+SLOW_TRACK = "soak://track/1?d=360000"
+FAST_TRACK = "soak://track/2?d=360000"
+
+
+def test_slow_link_holds_neither_chat_nor_queue_order(tmp_path):
+    async def main():
+        async with run_service(tmp_path) as (service, api):
+            callbacks = service._bot.callbacks
+            resolve = callbacks.resolve_for_playlist
+            resolved = asyncio.Event()
+
+            async def slow_resolve(mri, requester=None):
+                if mri == SLOW_TRACK:
+                    await resolved.wait()
+                return await resolve(mri, requester)
+
+            callbacks.resolve_for_playlist = slow_resolve
+
+            api.push_command(CHAT_ID, USER_ID, f"/p {SLOW_TRACK}")
+            api.push_command(CHAT_ID, USER_ID, f"/p {FAST_TRACK}")
+            api.push_command(CHAT_ID, USER_ID, "/volume 30")
+
+            # Chat is answered while link is resolved
+            await wait_for(lambda: callbacks.get_volume() == 30)
+            await asyncio.sleep(0.1)
+            assert not len(service._playlist)
+
+            # Later request waits for earlier one
+            resolved.set()
+            await wait_for(lambda: service._player.current_media is not None)
+            assert service._player.current_media.mrl == SLOW_TRACK
+            await wait_for(lambda: len(service._playlist) == 1)
+            assert service._playlist.head(1)[0].mrl == FAST_TRACK
+
+    asyncio.run(main())
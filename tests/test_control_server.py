@@ -0,0 +1,269 @@
+import asyncio
+import dataclasses
+import json
+import os
+import typing as tp
+
+import httpx
+import pytest
+
+from control_server import PUSH_INTERVAL, ControlServer
+from fake_service import run_service
+from http_websocket import WebSocket, _unmask
+from multimedia.player import PlayerSnapshot, PlayerState
+from multimedia.playlist_entry import PlaylistEntry
+from tg_bot.callbacks import Callbacks
+
+
+class WebSocketClient:
+    # Client side of websocket, frames are masked as RFC wants
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._writer = writer
+        self._socket = WebSocket(reader, writer)
+
+    @classmethod
+    async def connect(
+        cls,
+        port: int,
+        origin: tp.Optional[str] = None,
+        token: tp.Optional[str] = None,
+    ):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        headers = f"Origin: {origin}\r\n" if origin is not None else ""
+        query = f"?token={token}" if token is not None else ""
+        writer.write(
+            (
+                f"GET /ws{query} HTTP/1.1\r\n"
+                f"Host: 127.0.0.1:{port}\r\n{headers}"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                "Sec-WebSocket-Key: dGhlIHNhbXBsZSBub25jZQ==\r\n"
+                "Sec-WebSocket-Version: 13\r\n"
+                "\r\n"
+            ).encode("latin-1")
+        )
+        status = (await reader.readuntil(b"\r\n\r\n")).split(b"\r\n")[0].decode()
+        return cls(reader, writer), status
+
+    def send(self, message: tp.Dict[str, tp.Any]):
+        mask = os.urandom(4)
+        payload = json.dumps(message).encode("utf-8")
+        head = bytes((0x81, 0x80 | len(payload)))
+        self._writer.write(head + mask + _unmask(payload, mask))
+
+    async def receive(self, kind: str) -> tp.Dict[str, tp.Any]:
+        while True:
+            message = json.loads(await self._socket.receive())
+            if message["type"] == kind:
+                return message
+
+    def close(self):
+        self._writer.close()
+
+
+class FakePlayer:
+    # Player and queue, changed by the same callbacks as real ones
+    def __init__(self):
+        self.snapshot = PlayerSnapshot(1, PlayerState.Playing, None, 0, 240, 50)
+        self.queue = [
+            PlaylistEntry(f"https://example.com/{i}.mp3", f"Track {i}", "Artist", 180)
+            for i in range(200)
+        ]
+        self.playlist_version = 1
+        self.server: tp.Optional[ControlServer] = None
+
+    def change(self, **fields):
+        version = self.snapshot.version + 1
+        self.snapshot = dataclasses.replace(self.snapshot, version=version, **fields)
+        self.server.notify_changed()
+
+    async def add(self, uri: str, requester: tp.Optional[int]):
+        entry = PlaylistEntry(uri, requester=requester)
+        self.queue.append(entry)
+        self.playlist_version += 1
+        self.server.notify_changed()
+        return [entry]
+
+    async def skip(self):
+        self.queue.pop(0)
+        self.playlist_version += 1
+        self.server.notify_changed()
+        return True
+
+    async def pause(self):
+        self.change(state=PlayerState.Paused)
+
+    async def resume(self):
+        self.change(state=PlayerState.Playing)
+
+    def callbacks(self) -> Callbacks:
+        return Callbacks(
+            add_to_playlist=self.add,
+            head_playlist=lambda count: self.queue[:count],
+            pause=self.pause,
+            resume=self.resume,
+            skip=self.skip,
+            get_volume=lambda: self.snapshot.volume,
+            set_volume=lambda v: self.change(volume=v),
+            get_length=lambda: self.snapshot.length,
+            get_seek=lambda: self.snapshot.cursor,
+            set_seek=lambda v: self.change(cursor=int(v)),
+            get_player_snapshot=lambda: self.snapshot,
+            get_playlist_version=lambda: self.playlist_version,
+            get_fair_queue=lambda: False,
+            get_shuffle_play=lambda: False,
+        )
+
+
+def run_with_server(scenario):
+    async def main():
+        player = FakePlayer()
+        player.server = ControlServer(player.callbacks(), port=0, token="secret")
+        await player.server.start()
+        try:
+            await scenario(player, player.server.port)
+        finally:
+            await player.server.stop()
+
+    asyncio.run(main())
+
+
+def test_http_api_needs_token_and_checks_arguments():
+    async def scenario(player, port):
+        base = f"http://127.0.0.1:{port}/api"
+        headers = {"Authorization": "Bearer secret"}
+        async with httpx.AsyncClient(headers=headers) as client:
+            response = await client.get(f"{base}/state", headers={"Authorization": ""})
+            assert response.status_code == 401
+
+            response = await client.post(f"{base}/volume", json={"volume": 150})
+            assert response.json() == {"result": 100}
+            assert player.snapshot.volume == 100
+
+            response = await client.post(f"{base}/seek", json={"position": "end"})
+            assert response.status_code == 400
+            assert "error" in response.json()
+
+            response = await client.get(f"{base}/queue", params={"limit": 2})
+            assert [e["title"] for e in response.json()["result"]] == [
+                "Track 0",
+                "Track 1",
+            ]
+
+    run_with_server(scenario)
+
+
+def test_websocket_gets_results_and_pushed_changes():
+    async def scenario(player, port):
+        socket, status = await WebSocketClient.connect(port)
+        socket.close()
+        assert "401" in status
+
+        socket, status = await WebSocketClient.connect(port, token="secret")
+        try:
+            assert "101" in status
+            state = await asyncio.wait_for(socket.receive("state"), 2.0)
+            assert state["player"]["state"] == "Playing"
+            assert state["player"]["volume"] == 50
+
+            for position in (30, 300, -5):
+                args = {"position": position}
+                socket.send({"id": position, "op": "seek", "args": args})
+                result = await asyncio.wait_for(socket.receive("result"), 2.0)
+                assert result == {
+                    "type": "result",
+                    "id": position,
+                    "result": sorted((0, position, 240))[1],
+                }
+
+            async def pushed_player_state() -> str:
+                state = await asyncio.wait_for(socket.receive("state"), 2.0)
+                return state["player"]["state"]
+
+            # Changes made elsewhere, e.g. by bot, reach client without polling
+            await player.pause()
+            while await pushed_player_state() != "Paused":
+                pass
+            await asyncio.sleep(PUSH_INTERVAL * 1.5)
+            await player.resume()
+            assert await pushed_player_state() == "Playing"
+
+            socket.send({"id": "skip", "op": "skip"})
+            result = await asyncio.wait_for(socket.receive("result"), 2.0)
+            assert result["result"] is True
+            state = await asyncio.wait_for(socket.receive("state"), 2.0)
+            assert state["queue"][0]["title"] == "Track 1"
+        finally:
+            socket.close()
+
+    run_with_server(scenario)
+
+
+@pytest.mark.parametrize("host", ["0.0.0.0", "192.168.1.10", "::"])
+def test_network_listen_needs_token(host):
+    with pytest.raises(ValueError, match="token"):
+        ControlServer(FakePlayer().callbacks(), host=host, port=0)
+
+
+def test_pages_of_other_sites_are_rejected_without_token(tmp_path):
+    async def main():
+        async with run_service(tmp_path, control_listen=("127.0.0.1", 0)) as (
+            service,
+            api,
+        ):
+            port = service._control.port
+            base = f"http://127.0.0.1:{port}/api"
+            async with httpx.AsyncClient() as client:
+                response = await client.post(
+                    f"{base}/volume",
+                    json={"volume": 10},
+                    headers={"Origin": "https://evil.example"},
+                )
+                assert response.status_code == 401
+
+                for headers in ({}, {"Origin": "http://localhost:3000"}):
+                    response = await client.post(
+                        f"{base}/volume", json={"volume": 20}, headers=headers
+                    )
+                    assert response.json() == {"result": 20}
+
+            origin = f"http://127.0.0.1:{port}"
+            socket, status = await WebSocketClient.connect(port, origin)
+            socket.close()
+            assert "101" in status
+            socket, status = await WebSocketClient.connect(port, "http://evil.example")
+            socket.close()
+            assert "401" in status
+
+    asyncio.run(main())
+
+
+def test_slow_operation_does_not_hold_websocket(tmp_path):
+    async def main():
+        async with run_service(tmp_path, control_listen=("127.0.0.1", 0)) as (
+            service,
+            api,
+        ):
+            callbacks = service._bot.callbacks
+            added = asyncio.Event()
+
+            async def slow_add(uri, requester):
+                await added.wait()
+                return []
+
+            callbacks.add_to_playlist = slow_add
+
+            socket, _ = await WebSocketClient.connect(service._control.port)
+            try:
+                socket.send({"id": "add", "op": "add", "args": {"uri": "slow"}})
+                socket.send({"id": "volume", "op": "volume", "args": {"volume": 30}})
+                result = await asyncio.wait_for(socket.receive("result"), 2.0)
+                assert result["id"] == "volume"
+
+                added.set()
+                result = await asyncio.wait_for(socket.receive("result"), 2.0)
+                assert result["id"] == "add"
+            finally:
+                socket.close()
+
+    asyncio.run(main())
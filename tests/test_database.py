@@ -0,0 +1,68 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from database import Database, ResolvedMedia
+
+
+def run_with_database(scenario, tmp_path, **kwargs):
+    async def main():
+        db = Database(str(tmp_path / "db.sqlite3"), **kwargs)
+        await db.initialize()
+        try:
+            await scenario(db)
+        finally:
+            await db.close()
+
+    asyncio.run(main())
+
+
+def test_every_reader_sees_committed_writes(tmp_path):
+    async def scenario(db):
+        async with db._reader() as reader:
+            [(journal_mode,)] = await reader.execute_fetchall("PRAGMA journal_mode;")
+        assert journal_mode == "wal"
+
+        message_id = await db.add_play_message(["https://example.com/a"])
+        # Pool hands readers out in turn, so each of them is checked
+        for _ in range(3):
+            uris = await db.fetch_uris_from_play_message(message_id)
+            assert uris == ["https://example.com/a"]
+
+        medias = [ResolvedMedia("https://example.com/a", "https://cdn/1.mp3")]
+        await db.set_play_message_medias(message_id, medias[0].uri, medias)
+        for _ in range(3):
+            fetched = await db.fetch_play_message_medias(message_id)
+            assert [media.mrl for media in fetched] == ["https://cdn/1.mp3"]
+
+        await db.set_track_loudness("https://cdn/1.mp3", -12.5)
+        for _ in range(3):
+            assert await db.fetch_track_loudness("https://cdn/1.mp3") == -12.5
+
+    run_with_database(scenario, tmp_path, readers=3)
+
+
+def test_reads_run_alongside_writes(tmp_path):
+    async def scenario(db):
+        async def write(i: int) -> int:
+            uris = [f"https://example.com/{i}/{j}" for j in range(5)]
+            return await db.add_play_message(uris)
+
+        async def read_back(i: int):
+            message_id = await write(i)
+            uris = await db.fetch_uris_from_play_message(message_id)
+            assert uris == [f"https://example.com/{i}/{j}" for j in range(5)]
+
+        await asyncio.gather(*(read_back(i) for i in range(50)))
+
+    run_with_database(scenario, tmp_path, readers=3)
+
+
+def test_readers_are_read_only(tmp_path):
+    async def scenario(db):
+        async with db._reader() as reader:
+            with pytest.raises(sqlite3.OperationalError):
+                await reader.execute("INSERT INTO play_messages DEFAULT VALUES;")
+
+    run_with_database(scenario, tmp_path, readers=1)
@@ -0,0 +1,35 @@
+import asyncio
+
+from fake_service import run_service, wait_for
+
+CHAT_ID = -1001
+ADMIN_ID = 7
+
+
+def test_debug_dump_is_sent_to_admins_only(tmp_path):
+    async def main():
+        async with run_service(tmp_path, debug_admins=[ADMIN_ID]) as (_, api):
+            api.push_command(CHAT_ID, ADMIN_ID + 1, "/debug")
+            await wait_for(lambda: api.calls.get("sendMessage"))
+            assert not api.calls.get("sendDocument")
+
+            api.push_command(CHAT_ID, ADMIN_ID, "/debug")
+            await wait_for(lambda: api.calls.get("sendDocument"))
+
+    asyncio.run(main())
+
+
+def test_reload_is_allowed_to_admins_only(tmp_path):
+    async def main():
+        async with run_service(tmp_path, debug_admins=[ADMIN_ID]) as (service, api):
+            reloads = []
+            service._bot.reload_modules = lambda: reloads.append(True) or True
+
+            api.push_command(CHAT_ID, ADMIN_ID + 1, "/reload")
+            await wait_for(lambda: api.calls.get("sendMessage"))
+            assert not reloads
+
+            api.push_command(CHAT_ID, ADMIN_ID, "/reload")
+            await wait_for(lambda: reloads)
+
+    asyncio.run(main())
@@ -0,0 +1,36 @@
+import asyncio
+
+from fake_service import run_service
+from multimedia.playlist import DuplicatePolicy
+
+ALBUM = "soak://album/1?tracks=3"
+
+
+def test_album_link_is_found_in_queue_before_resolution(tmp_path):
+    async def main():
+        async with run_service(
+            tmp_path, duplicate_policy=DuplicatePolicy.Skip
+        ) as (service, _):
+            await service._on_add_content(ALBUM)
+            queued = service._playlist.items
+
+            # Tracks of album get new durations, when it's resolved again
+            assert await service._on_add_content(ALBUM) == []
+            assert service._playlist.items == queued
+
+    asyncio.run(main())
+
+
+def test_album_moved_to_front_keeps_its_order(tmp_path):
+    async def main():
+        async with run_service(
+            tmp_path, duplicate_policy=DuplicatePolicy.MoveToFront
+        ) as (service, _):
+            await service._on_add_content(ALBUM)
+            await service._on_add_content("soak://track/2?d=360000")
+            album = [e.mrl for e in service._playlist.items if e.source == ALBUM]
+
+            await service._on_add_content(ALBUM)
+            assert [e.mrl for e in service._playlist.head(len(album))] == album
+
+    asyncio.run(main())
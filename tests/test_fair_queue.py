@@ -0,0 +1,53 @@
+import pytest
+
+from multimedia.fair_queue import FairQueue
+
+
+def drain(queue: FairQueue) -> list:
+    items = []
+    while queue:
+        items.append(queue.pop())
+    return items
+
+
+def test_requesters_take_turns_behind_big_album():
+    queue: FairQueue[str] = FairQueue()
+    queue.push("album", (f"album-{i}" for i in range(1000)))
+    queue.push("alice", ["alice-1", "alice-2"])
+    queue.push("bob", ["bob-1"])
+
+    expected = ["album-0", "alice-1", "bob-1", "album-1", "alice-2", "album-2"]
+    assert queue.ordered(limit=6) == expected
+    # Ordering doesn't change queue
+    assert len(queue) == 1003
+    assert drain(queue)[:6] == expected
+
+
+def test_idle_requester_does_not_save_up_turns():
+    queue: FairQueue[str] = FairQueue()
+    queue.push("album", [f"album-{i}" for i in range(10)])
+    queue.push("alice", ["alice-1"])
+    assert [queue.pop() for _ in range(6)][-2:] == ["album-3", "album-4"]
+
+    # Alice was away, she gets her turn, not four saved up ones
+    queue.push("alice", ["alice-2", "alice-3"])
+    assert queue.ordered(limit=4) == ["album-5", "alice-2", "album-6", "alice-3"]
+
+
+def test_weights_and_move_to_front():
+    queue: FairQueue[str] = FairQueue()
+    queue.set_weight("dj", 2.0)
+    queue.push("dj", [f"dj-{i}" for i in range(6)])
+    queue.push("guest", [f"guest-{i}" for i in range(3)])
+
+    queue.move_to_front("guest", "guest-2")
+    assert queue.peek() == queue.ordered(limit=1)[0]
+    # Twice the weight is twice the turns
+    assert drain(queue) == [
+        *("dj-0", "dj-1", "guest-2"),
+        *("dj-2", "dj-3", "guest-0"),
+        *("dj-4", "dj-5", "guest-1"),
+    ]
+
+    with pytest.raises(ValueError):
+        queue.set_weight("dj", 0)
@@ -0,0 +1,83 @@
+import asyncio
+import typing as tp
+
+from tg_bot.input_coalescer import InputCoalescer, apply_clamped
+
+
+def test_apply_clamped_matches_sequential_presses():
+    # Volume at the top: +10 is lost, -10 still applies
+    assert apply_clamped(95, [10, -10], 0, 100) == 90
+    assert apply_clamped(5, [-10, -10, 10], 0, 100) == 10
+    # Seek is clamped by track length
+    assert apply_clamped(170, [15, 15], 0, 180) == 180
+    assert apply_clamped(10, [-15, 15], 0, 180) == 15
+    assert apply_clamped(50, [], 0, 100) == 50
+
+
+class Recorder:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.flushes: tp.List[tp.Dict[str, tp.List[int]]] = []
+        self.running = 0
+        self.max_running = 0
+
+    async def __call__(self, deltas: tp.Dict[str, tp.List[int]]):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(self.delay)
+        self.flushes.append(deltas)
+        self.running -= 1
+
+
+def test_presses_within_window_are_flushed_together():
+    async def main():
+        recorder = Recorder()
+        coalescer = InputCoalescer(recorder, window=0.3)
+
+        coalescer.push("volume", 10)
+        await asyncio.sleep(0.1)
+        coalescer.push("volume", -5)
+        coalescer.push("seek", 15)
+        await asyncio.sleep(0.1)
+        assert not recorder.flushes
+
+        await asyncio.sleep(0.2)
+        assert recorder.flushes == [{"volume": [10, -5], "seek": [15]}]
+
+        # Next press opens new window
+        coalescer.push("volume", 1)
+        await asyncio.sleep(0.35)
+        assert recorder.flushes[1:] == [{"volume": [1]}]
+
+    asyncio.run(main())
+
+
+def test_presses_during_flush_go_to_next_window():
+    async def main():
+        recorder = Recorder(delay=0.2)
+        coalescer = InputCoalescer(recorder, window=0.05)
+
+        coalescer.push("volume", 10)
+        await asyncio.sleep(0.1)
+        # First window is being applied now
+        coalescer.push("volume", 20)
+        coalescer.push("volume", 30)
+        await asyncio.sleep(0.5)
+
+        assert recorder.flushes == [{"volume": [10]}, {"volume": [20, 30]}]
+        assert recorder.max_running == 1
+
+    asyncio.run(main())
+
+
+def test_cancel_drops_pending_presses():
+    async def main():
+        recorder = Recorder()
+        coalescer = InputCoalescer(recorder, window=0.05)
+
+        coalescer.push("volume", 10)
+        coalescer.cancel()
+        await asyncio.sleep(0.1)
+        assert not recorder.flushes
+
+    asyncio.run(main())
@@ -0,0 +1,111 @@
+import asyncio
+import subprocess
+import typing as tp
+from concurrent.futures import ThreadPoolExecutor
+
+from multimedia import loudness
+from multimedia.loudness import (
+    MAX_GAIN_DB,
+    MIN_GAIN_DB,
+    LoudnessAnalyzer,
+    measure_integrated_loudness,
+)
+
+# Tail of `ffmpeg -af ebur128` stderr, progress lines precede summary
+EBUR128_OUTPUT = """\
+[Parsed_ebur128_0 @ 0x55d0] t: 0.4  TARGET:-23 LUFS  M: -25.1 S:-120.7 \
+I: -25.1 LUFS  LRA:   0.0 LU
+[Parsed_ebur128_0 @ 0x55d0] t: 0.8  TARGET:-23 LUFS  M: -19.8 S:-120.7 \
+I: -21.3 LUFS  LRA:   0.0 LU
+[Parsed_ebur128_0 @ 0x55d0] Summary:
+
+  Integrated loudness:
+    I:         -16.5 LUFS
+    Threshold: -26.8 LUFS
+
+  Loudness range:
+    LRA:         6.1 LU
+"""
+
+
+class FakeFfmpeg:
+    def __init__(self, stderr: str = EBUR128_OUTPUT):
+        self.stderr = stderr
+        self.paths: tp.List[str] = []
+
+    def __call__(self, args, **kwargs) -> subprocess.CompletedProcess:
+        self.paths.append(args[args.index("-i") + 1])
+        return subprocess.CompletedProcess(args, 0, None, self.stderr.encode())
+
+
+class FakeDatabase:
+    def __init__(self, loudness: tp.Optional[tp.Dict[str, float]] = None):
+        self.loudness = dict(loudness or {})
+        self.fetches = 0
+
+    async def fetch_track_loudness(self, mrl: str) -> tp.Optional[float]:
+        self.fetches += 1
+        return self.loudness.get(mrl)
+
+    async def set_track_loudness(self, mrl: str, value: float):
+        self.loudness[mrl] = value
+
+
+def make_analyzer(monkeypatch, ffmpeg: FakeFfmpeg, database: FakeDatabase):
+    monkeypatch.setattr(loudness.subprocess, "run", ffmpeg)
+    analyzer = LoudnessAnalyzer(database)
+    # Threads share patched subprocess, worker processes wouldn't
+    analyzer._executor = ThreadPoolExecutor(max_workers=1)
+    return analyzer
+
+
+def test_summary_loudness_is_parsed(monkeypatch):
+    monkeypatch.setattr(loudness.subprocess, "run", FakeFfmpeg())
+    assert measure_integrated_loudness("/music/a.mp3") == -16.5
+
+    monkeypatch.setattr(loudness.subprocess, "run", FakeFfmpeg("Invalid data\n"))
+    assert measure_integrated_loudness("/music/a.mp3") is None
+
+
+def test_gain_is_clamped(monkeypatch):
+    async def main():
+        database = FakeDatabase(
+            {"/quiet.mp3": -40.0, "/loud.mp3": 10.0, "/normal.mp3": -20.0}
+        )
+        analyzer = make_analyzer(monkeypatch, FakeFfmpeg(), database)
+
+        assert await analyzer.gain_for("/quiet.mp3") == MAX_GAIN_DB
+        assert await analyzer.gain_for("/loud.mp3") == MIN_GAIN_DB
+        assert await analyzer.gain_for("/normal.mp3") == 6.0
+        # Unknown track is played as is
+        assert await analyzer.gain_for("/unknown.mp3") == 0.0
+
+    asyncio.run(main())
+
+
+def test_loudness_is_measured_once_per_mrl(monkeypatch):
+    async def main():
+        ffmpeg, database = FakeFfmpeg(), FakeDatabase()
+        analyzer = make_analyzer(monkeypatch, ffmpeg, database)
+
+        mrl = "file:///music/some%20track.mp3"
+        analyzer.schedule(mrl)
+        analyzer.schedule(mrl)
+        await asyncio.gather(*analyzer._pending.values())
+
+        assert ffmpeg.paths == ["/music/some track.mp3"]
+        assert database.loudness == {mrl: -16.5}
+
+        # Later lookups and schedules are served from memory
+        fetches = database.fetches
+        analyzer.schedule(mrl)
+        assert not analyzer._pending
+        assert await analyzer.gain_for(mrl) == 2.5
+        assert database.fetches == fetches
+
+        # Remote mrl without local copy isn't analyzed
+        analyzer.schedule("https://example.com/a.mp3")
+        assert not analyzer._pending
+        analyzer.shutdown()
+
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+import asyncio
+import gc
+
+import vlc
+
+import soak
+from multimedia.media import Media, ParseState
+from multimedia.utils import VlcEventHub
+
+
+def test_hub_detaches_when_last_listener_leaves():
+    async def main():
+        manager = soak.FakeEventManager()
+        hub = VlcEventHub(manager)
+        event = vlc.EventType.MediaParsedChanged
+
+        first, second = (lambda _: None), (lambda _: None)
+        hub.subscribe(event, first)
+        hub.subscribe(event, second)
+        hub.unsubscribe(event, first)
+        assert manager._callbacks
+
+        hub.unsubscribe(event, second)
+        assert not manager._callbacks
+
+        # Fired and cancelled waits leave nothing attached too
+        fired = hub.wait(event)
+        manager.emit(event)
+        await fired
+        hub.wait(event).cancel()
+        await asyncio.sleep(0)
+        assert not manager._callbacks and not hub.listeners_count
+
+    asyncio.run(main())
+
+
+def test_parsed_medias_leave_no_callbacks_in_libvlc(monkeypatch):
+    async def main():
+        monkeypatch.setattr(vlc, "Media", soak.FakeVlcMedia)
+        monkeypatch.setattr(Media, "parse_timeout", 0.01)
+        monkeypatch.setattr("multimedia.media.PARSE_EVENT_GRACE", 0.0)
+
+        managers = []
+        for i in range(200):
+            # Never parsed ones time out, dead ones fail
+            kind = ("track", "dead", "album")[i % 3]
+            media = Media(f"soak://{kind}/{i}?tracks=2")
+            if i % 10 == 0:
+                media.vlc_media.parse_with_options = lambda *args, **kwargs: 0
+            await media.load_metadata()
+            managers.append(media.vlc_media.event_manager())
+            del media
+
+        gc.collect()
+        # Nothing is left attached for libvlc to call after hub is freed
+        assert not any(manager._callbacks for manager in managers)
+
+        media = Media("soak://track/1?d=100")
+        assert await media.load_metadata() == ParseState.Done
+
+    asyncio.run(main())
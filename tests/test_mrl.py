@@ -0,0 +1,42 @@
+import pytest
+
+from multimedia.mrl import normalize_mrl
+
+TRACK = "https://music.yandex.ru/album/21370360/track/101378847"
+
+
+@pytest.mark.parametrize(
+    "mrl, key",
+    [
+        ("https://music.yandex.com/album/21370360/track/101378847/", TRACK),
+        (f"{TRACK}?access_token=abc", TRACK),
+        ("  HTTP://Music.Yandex.RU/album/21370360/track/101378847  ", TRACK),
+        (
+            "http://www.youtube.com/watch?v=dQw4w9WgXcQ&si=share",
+            "https://youtube.com/watch?v=dQw4w9WgXcQ",
+        ),
+        # Order of meaningful parameters doesn't matter, fragment is dropped
+        ("https://example.com/a?b=2&a=1#t=10", "https://example.com/a?a=1&b=2"),
+        ("https://example.com/a?flag=", "https://example.com/a?flag="),
+        ("/home/user/music/", "/home/user/music"),
+        ("/", "/"),
+    ],
+)
+def test_same_content_gets_same_key(mrl, key):
+    assert normalize_mrl(mrl) == key
+
+
+def test_different_content_keeps_different_keys():
+    keys = {
+        normalize_mrl(mrl)
+        for mrl in (
+            TRACK,
+            "https://music.yandex.ru/album/21370360/track/101378848",
+            "https://youtube.com/watch?v=dQw4w9WgXcQ",
+            "https://youtube.com/watch?v=other",
+            # Path case is meaningful, only host is case insensitive
+            "https://example.com/Track.mp3",
+            "https://example.com/track.mp3",
+        )
+    }
+    assert len(keys) == 6
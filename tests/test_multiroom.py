@@ -0,0 +1,79 @@
+import asyncio
+import types
+
+import vlc
+
+import soak
+from multimedia.media import Media
+from multimedia.player import Player, PlayerState
+from multiroom import MultiroomFollower
+
+
+def test_position_runs_between_libvlc_reports(monkeypatch):
+    async def main():
+        monkeypatch.setattr(vlc, "Media", soak.FakeVlcMedia)
+        monkeypatch.setattr(vlc, "MediaPlayer", soak.FakeMediaPlayer)
+        player = Player()
+        player._player.get_time = lambda: 1000
+
+        await player.play(Media("soak://track/1?d=360000"))
+        await player.wait_until_playing()
+        player._player.event_manager().emit(
+            vlc.EventType.MediaPlayerTimeChanged, new_time=1000
+        )
+        await asyncio.sleep(0.1)
+        assert 1.05 < player.playback_time < 1.3
+
+        # Stalled playback isn't extrapolated
+        await asyncio.sleep(0.5)
+        assert player.playback_time == 1.0
+
+    asyncio.run(main())
+
+
+class StartingPlayer:
+    # libvlc player, which reaches Playing state only when told to
+    def __init__(self):
+        self.state = PlayerState.Stopped
+        self.started = asyncio.Event()
+        self.seeks = []
+
+    async def play(self, media):
+        self.state = PlayerState.Playing
+        return True
+
+    async def wait_until_playing(self):
+        await self.started.wait()
+
+    @property
+    def cursor(self):
+        return 0
+
+    @cursor.setter
+    def cursor(self, position: float):
+        self.seeks.append((position, self.started.is_set()))
+
+
+def test_follower_seeks_once_playback_started():
+    async def main():
+        player = StartingPlayer()
+        follower = MultiroomFollower(
+            player,
+            "127.0.0.1",
+            media_factory=lambda mrl: types.SimpleNamespace(
+                mrl=mrl, load_metadata=lambda: asyncio.sleep(0)
+            ),
+        )
+        follower._start(
+            {"mrl": "soak://track/1", "at": follower.leader_time(), "offset": 10.0}
+        )
+
+        await asyncio.sleep(0.1)
+        assert not player.seeks
+
+        player.started.set()
+        await asyncio.sleep(0.01)
+        [(position, started)] = player.seeks
+        assert started and 10.0 < position < 10.2
+
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+import asyncio
+
+import vlc
+
+import soak
+from multimedia import player as player_module
+from multimedia.media import Media
+from multimedia.player import Player
+
+
+def make_player(monkeypatch) -> Player:
+    monkeypatch.setattr(vlc, "MediaPlayer", soak.FakeMediaPlayer)
+    return Player()
+
+
+def test_echo_of_clamped_volume_keeps_user_volume(monkeypatch):
+    async def main():
+        player = make_player(monkeypatch)
+        player._gain_db = 9.0
+        player._apply_volume()
+
+        # 100% with +9 dB is clamped to 200%, libvlc reports it back
+        player._on_audio_volume(2.0)
+        assert player.volume == 100
+
+    asyncio.run(main())
+
+
+def test_outside_change_reverts_gain(monkeypatch):
+    async def main():
+        player = make_player(monkeypatch)
+        player._gain_db = 6.0
+        player._apply_volume()
+
+        # Mixer halved effective volume of 200%
+        player._on_audio_volume(1.0)
+        assert player.volume == 50
+
+    asyncio.run(main())
+
+
+def test_hung_stream_resolver_falls_back_to_page(monkeypatch):
+    async def main():
+        async def hung_resolver(mrl):
+            await asyncio.Event().wait()
+
+        monkeypatch.setattr(vlc, "Media", soak.FakeVlcMedia)
+        monkeypatch.setattr(player_module, "STREAM_RESOLVE_TIMEOUT", 0.05)
+        player = make_player(monkeypatch)
+        player._stream_resolver = hung_resolver
+
+        media = Media("soak://track/1?d=360000")
+        assert await asyncio.wait_for(player.play(media), 1.0)
+        assert player._player._media is media.vlc_media
+
+    asyncio.run(main())
+
+
+def test_failing_stream_resolver_falls_back_to_page(monkeypatch):
+    async def main():
+        async def failing_resolver(mrl):
+            raise RuntimeError("resolver is broken")
+
+        monkeypatch.setattr(vlc, "Media", soak.FakeVlcMedia)
+        player = make_player(monkeypatch)
+        player._stream_resolver = failing_resolver
+
+        media = Media("soak://track/1?d=360000")
+        assert await player.play(media)
+        assert player._player._media is media.vlc_media
+
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+import pytest
+import vlc
+
+import soak
+from multimedia.playlist import Playlist
+from multimedia.playlist_entry import PlaylistEntry
+
+
+def make_playlist(mode: str) -> Playlist:
+    # Window is disabled, so entries never create libvlc media
+    playlist = Playlist(window=0)
+    playlist.add_entries(
+        [
+            PlaylistEntry(f"https://example.com/{i}.mp3", requester=i % 3)
+            for i in range(30)
+        ]
+    )
+    if mode == "fair":
+        playlist.set_fair(True)
+    elif mode == "shuffle":
+        playlist.set_shuffle(True, seed=1)
+    return playlist
+
+
+@pytest.mark.parametrize("mode", ["plain", "fair", "shuffle"])
+def test_head_and_length_follow_play_order(mode):
+    playlist = make_playlist(mode)
+
+    while len(playlist):
+        assert len(playlist) == len(playlist.items)
+        assert playlist.head(4) == playlist.items[:4]
+        assert playlist.head(1) == [playlist.last]
+        playlist.pop_last()
+
+    assert playlist.head(4) == []
+
+
+def test_entries_are_found_by_link_they_were_resolved_from():
+    playlist = Playlist(window=0)
+    album = "https://example.com/album/1"
+    tracks = [
+        PlaylistEntry(f"https://example.com/{i}.mp3", source=album) for i in range(3)
+    ]
+    playlist.add_entries(tracks)
+
+    assert playlist.find_duplicates(album) == tracks
+    assert playlist.find_duplicate(tracks[1].mrl) is tracks[1]
+
+    # Played tracks aren't duplicates anymore
+    playlist.pop_last()
+    assert playlist.find_duplicates(album) == tracks[1:]
+    playlist.clear()
+    assert playlist.find_duplicates(album) == []
+
+
+@pytest.mark.parametrize("mode", ["plain", "fair", "shuffle"])
+def test_moved_entry_is_played_next(mode):
+    playlist = make_playlist(mode)
+    # In fair mode entry leads queue of its requester, whose turn is first
+    entry = [e for e in playlist.items if e.requester == playlist.last.requester][-1]
+
+    playlist.move_to_front(entry)
+    assert playlist.last is entry
+    assert len(playlist) == 30
+
+
+def test_modes_keep_entries_and_restore_order():
+    playlist = make_playlist("plain")
+    added = list(playlist.items)
+
+    playlist.set_fair(True)
+    # Requesters take turns
+    assert [e.requester for e in playlist.head(6)] == [0, 1, 2, 0, 1, 2]
+    playlist.set_shuffle(True, seed=1)
+    assert not playlist.is_fair
+    assert sorted(playlist.items, key=added.index) == added
+
+    # Not played entries are back in order they were added
+    playlist.set_shuffle(False)
+    assert playlist.items == added
+
+
+def test_version_and_callbacks_follow_changes():
+    playlist = make_playlist("plain")
+    changes = []
+    playlist.add_change_callback(lambda: changes.append(playlist.version))
+
+    version = playlist.version
+    playlist.pop_last()
+    playlist.set_fair(True)
+    playlist.clear()
+    assert changes == [version + 1, version + 2, version + 3]
+
+
+def test_only_head_of_queue_keeps_libvlc_media(monkeypatch):
+    monkeypatch.setattr(vlc, "Media", soak.FakeVlcMedia)
+    playlist = Playlist(window=2)
+    entries = [PlaylistEntry(f"soak://track/{i}?d=100") for i in range(5)]
+    playlist.add_entries(entries)
+
+    assert [e.is_materialized for e in entries] == [True, True, False, False, False]
+
+    playlist.pop_last()
+    assert [e.is_materialized for e in entries[1:]] == [True, True, False, False]
+    playlist.clear()
+    assert not any(e.is_materialized for e in entries)
@@ -0,0 +1,105 @@
+import asyncio
+import zlib
+
+import pytest
+
+from fake_service import run_service
+from multimedia.playlist_codec import (
+    FORMAT_VERSION,
+    MAGIC,
+    MAX_DECODED_SIZE,
+    PlaylistCodecError,
+    PlaylistDecoder,
+    PlaylistRecord,
+    decode_playlist,
+    encode_playlist,
+)
+from tg_bot.module.playlist_transfer_module import PlaylistTransferModule
+
+RECORDS = [
+    PlaylistRecord(
+        f"https://music.yandex.ru/album/{1000 + i // 12}/track/{100000 + i}",
+        f"Трек {i}",
+        f"Artist {i % 7}",
+        120 + i,
+    )
+    for i in range(1000)
+] + [
+    PlaylistRecord("/music/bare.mp3"),
+    PlaylistRecord("/music/zero.mp3", title="", duration=0),
+]
+
+
+def decode(data: bytes, chunk_size: int = 64 * 1024):
+    return [record for batch in decode_playlist(data, chunk_size) for record in batch]
+
+
+def test_records_survive_round_trip():
+    data = encode_playlist(RECORDS)
+    assert data.startswith(MAGIC)
+    assert decode(data) == RECORDS
+    # Records split between chunks come out whole
+    assert decode(data, chunk_size=7) == RECORDS
+    assert decode(encode_playlist([])) == []
+
+
+@pytest.mark.parametrize(
+    "data, error",
+    [
+        (b"PLS1" + encode_playlist(RECORDS)[4:], "Not a playlist"),
+        (MAGIC + bytes((FORMAT_VERSION + 1,)) + zlib.compress(b""), "version"),
+        (encode_playlist(RECORDS)[:-10], "truncated"),
+        (MAGIC + bytes((FORMAT_VERSION,)) + b"garbage", "Corrupted"),
+        (MAGIC + bytes((FORMAT_VERSION,)) + zlib.compress(b"\x05ab"), "incomplete"),
+    ],
+)
+def test_broken_files_are_rejected(data, error):
+    with pytest.raises(PlaylistCodecError, match=error):
+        decode(data)
+
+
+def test_compression_bomb_is_stopped():
+    record = encode_playlist([RECORDS[0]])
+    payload = zlib.decompress(record[len(MAGIC) + 1 :])
+    bomb = zlib.compress(payload * (MAX_DECODED_SIZE // len(payload) + 1), 9)
+    assert len(bomb) < MAX_DECODED_SIZE // 100
+
+    decoder = PlaylistDecoder()
+    with pytest.raises(PlaylistCodecError, match="too big"):
+        decoder.feed(MAGIC + bytes((FORMAT_VERSION,)) + bomb)
+    # Decoded records are consumed by steps, not kept as whole payload
+    assert len(decoder._buffer) < len(payload)
+
+
+def run_import(tmp_path, scenario, **kwargs):
+    async def main():
+        async with run_service(tmp_path, **kwargs) as (service, api):
+            module = service._bot._modules.find_module(PlaylistTransferModule)
+            await scenario(service, module)
+
+    asyncio.run(main())
+
+
+def test_import_counts_only_queued_entries(tmp_path):
+    async def scenario(service, module):
+        records = [PlaylistRecord(f"soak://track/{i}?d=360000") for i in range(3)]
+        assert await module.import_playlist(encode_playlist(records)) == 3
+
+        # Queued tracks are skipped by duplicate policy
+        records.append(PlaylistRecord("soak://track/3?d=360000"))
+        assert await module.import_playlist(encode_playlist(records[1:])) == 1
+
+    run_import(tmp_path, scenario)
+
+
+def test_broken_import_queues_nothing(tmp_path):
+    async def scenario(service, module):
+        records = [PlaylistRecord(f"soak://track/{i}?d=360000") for i in range(2000)]
+        data = encode_playlist(records)
+        with pytest.raises(PlaylistCodecError):
+            await module.import_playlist(data[: len(data) // 2])
+
+        assert service._player.current_media is None
+        assert not len(service._playlist)
+
+    run_import(tmp_path, scenario)
@@ -0,0 +1,153 @@
+import asyncio
+import collections
+import os
+import typing as tp
+
+from http import HTTPStatus
+
+from http_server import HttpRequest, HttpResponse
+from multimedia.prefetch_cache import PrefetchCache
+from stub_server import serve
+
+TRACK_SIZE = 10 * 1024
+
+
+class AudioStub:
+    # Every /<name>.mp3 is audio of TRACK_SIZE bytes, /page is html
+    def __init__(self):
+        self.requests: tp.Counter[str] = collections.Counter()
+
+    async def __call__(self, request: HttpRequest) -> HttpResponse:
+        self.requests[request.path] += 1
+        if request.path.endswith(".mp3"):
+            body = request.path.encode("utf-8").ljust(TRACK_SIZE, b"\0")
+            return HttpResponse(body=body, content_type="audio/mpeg")
+        if request.path == "/page":
+            return HttpResponse(body=b"<html></html>", content_type="text/html")
+        return HttpResponse(status=HTTPStatus.NOT_FOUND)
+
+
+async def wait_for(predicate: tp.Callable[[], bool], timeout: float = 5.0):
+    async def poll():
+        while not predicate():
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+def run_with_cache(scenario, tmp_path, **kwargs):
+    async def main():
+        stub = AudioStub()
+        async with serve(stub) as base:
+            cache = PrefetchCache(str(tmp_path / "cache"), **kwargs)
+            ready = []
+            cache.add_ready_callback(lambda mrl, path: ready.append(mrl))
+            cache.start()
+            try:
+                await scenario(cache, stub, base, ready)
+            finally:
+                cache._worker_task.cancel()
+
+    asyncio.run(main())
+
+
+def test_prefetches_lookahead_and_serves_local_copy(tmp_path):
+    async def scenario(cache, stub, base, ready):
+        mrls = [f"{base}/{i}.mp3" for i in range(5)]
+        cache.update_queue(mrls)
+        await wait_for(lambda: len(ready) == 2)
+        await asyncio.sleep(0.05)
+
+        # Only lookahead tracks are downloaded
+        assert ready == mrls[:2]
+        assert set(stub.requests) == {"/0.mp3", "/1.mp3"}
+
+        local = cache.lookup(mrls[0])
+        assert local is not None and local.startswith("file://")
+        with open(local[len("file://") :], "rb") as f:
+            assert f.read().startswith(b"/0.mp3")
+
+        assert cache.lookup(mrls[4]) is None
+        stats = cache.stats
+        assert (stats.hits, stats.misses) == (1, 1)
+        assert stats.bytes_saved == TRACK_SIZE
+        assert stats.used_bytes == 2 * TRACK_SIZE
+
+    run_with_cache(scenario, tmp_path, byte_budget=10 * TRACK_SIZE, lookahead=2)
+
+
+def test_least_recently_used_tracks_are_evicted(tmp_path):
+    async def scenario(cache, stub, base, ready):
+        cache.update_queue([f"{base}/0.mp3", f"{base}/1.mp3"])
+        await wait_for(lambda: len(ready) == 2)
+
+        # Track 0 is played, so track 1 is least recently used
+        assert cache.lookup(f"{base}/0.mp3") is not None
+        cache.update_queue([f"{base}/2.mp3"])
+        await wait_for(lambda: len(ready) == 3)
+
+        assert cache.lookup(f"{base}/1.mp3") is None
+        assert cache.lookup(f"{base}/0.mp3") is not None
+        assert cache.lookup(f"{base}/2.mp3") is not None
+        assert cache.stats.used_bytes <= 2 * TRACK_SIZE
+        assert len(os.listdir(tmp_path / "cache")) == 2
+
+    run_with_cache(scenario, tmp_path, byte_budget=2 * TRACK_SIZE, lookahead=2)
+
+
+def test_pages_and_local_files_are_not_cached(tmp_path):
+    async def scenario(cache, stub, base, ready):
+        cache.update_queue(["/music/local.mp3", f"{base}/page", f"{base}/0.mp3"])
+        await wait_for(lambda: len(ready) == 1)
+
+        assert ready == [f"{base}/0.mp3"]
+        assert stub.requests["/page"] == 1
+        assert cache.lookup(f"{base}/page") is None
+        assert cache.lookup("/music/local.mp3") is None
+        assert cache.stats.entries == 1
+
+    run_with_cache(scenario, tmp_path, byte_budget=10 * TRACK_SIZE, lookahead=3)
+
+
+def test_failed_download_is_not_retried_while_queued(tmp_path):
+    async def scenario(cache, stub, base, ready):
+        cache.update_queue([f"{base}/missing", f"{base}/0.mp3"])
+        await wait_for(lambda: len(ready) == 1)
+
+        cache.update_queue([f"{base}/missing", f"{base}/0.mp3"])
+        await asyncio.sleep(0.05)
+        assert stub.requests["/missing"] == 1
+
+    run_with_cache(scenario, tmp_path, byte_budget=10 * TRACK_SIZE, lookahead=2)
+
+
+def test_audio_is_downloaded_from_resolved_stream(tmp_path):
+    async def scenario(cache, stub, base, ready):
+        cache._stream_resolver = resolve
+        cache.update_queue([f"{base}/page"])
+        await wait_for(lambda: len(ready) == 1)
+
+        # Cache is keyed by mrl, audio comes from stream
+        assert stub.requests == {"/stream.mp3": 1}
+        assert cache.lookup(f"{base}/page") is not None
+
+    async def resolve(mrl: str) -> tp.Optional[str]:
+        return mrl.replace("/page", "/stream.mp3")
+
+    run_with_cache(scenario, tmp_path, byte_budget=10 * TRACK_SIZE)
+
+
+def test_cache_is_restored_after_restart(tmp_path):
+    async def scenario(cache, stub, base, ready):
+        cache.update_queue([f"{base}/0.mp3"])
+        await wait_for(lambda: len(ready) == 1)
+
+        # Unfinished download of previous run is dropped
+        (tmp_path / "cache" / "unfinished.part").write_bytes(b"\0")
+
+        restarted = PrefetchCache(str(tmp_path / "cache"), TRACK_SIZE)
+        restarted._load_existing()
+        assert restarted.lookup(f"{base}/0.mp3") is not None
+        assert not (tmp_path / "cache" / "unfinished.part").exists()
+
+    run_with_cache(scenario, tmp_path, byte_budget=10 * TRACK_SIZE)
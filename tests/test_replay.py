@@ -0,0 +1,93 @@
+import asyncio
+import json
+import time
+
+from fake_service import run_service, wait_for
+
+CHAT_ID = -1001
+USER_ID = 7
+
+ALBUM = "soak://album/1?tracks=3"
+
+
+def replay_keyboard(api) -> bool:
+    message = api.keyboards.get(CHAT_ID)
+    if message is None:
+        return False
+    [[button]] = message["reply_markup"]["inline_keyboard"]
+    return json.loads(button["callback_data"])["type"] == "replay"
+
+
+def queued_mrls(service):
+    current = service._player.current_media
+    mrls = [current.mrl] if current is not None else []
+    entries = service._playlist.head(len(service._playlist))
+    return mrls + [entry.mrl for entry in entries]
+
+
+async def queue_and_clear(service, api):
+    # Album is requested once, then queue is emptied for replay
+    callbacks = service._bot.callbacks
+    resolved = []
+    resolve = callbacks.resolve_for_playlist
+
+    async def counting_resolve(mri, requester=None):
+        resolved.append(mri)
+        return await resolve(mri, requester)
+
+    callbacks.resolve_for_playlist = counting_resolve
+
+    api.push_command(CHAT_ID, USER_ID, f"/p {ALBUM}")
+    await wait_for(lambda: replay_keyboard(api))
+    mrls = queued_mrls(service)
+    assert len(mrls) == 3 and resolved == [ALBUM]
+
+    await callbacks.skipall()
+    await wait_for(lambda: not queued_mrls(service))
+    return mrls, resolved
+
+
+def test_replay_queues_stored_medias_without_resolving(tmp_path):
+    async def main():
+        async with run_service(tmp_path) as (service, api):
+            mrls, resolved = await queue_and_clear(service, api)
+
+            assert api.push_button(CHAT_ID, USER_ID)
+            await wait_for(lambda: len(queued_mrls(service)) == 3)
+
+            assert queued_mrls(service) == mrls
+            assert resolved == [ALBUM]
+
+    asyncio.run(main())
+
+
+def test_expired_medias_are_resolved_again(tmp_path):
+    async def main():
+        async with run_service(tmp_path) as (service, api):
+            mrls, resolved = await queue_and_clear(service, api)
+
+            # Stored resolution is older than TTL
+            db = service._database._db
+            await db.execute("UPDATE play_messages_medias SET resolved_at = 0;")
+            await db.commit()
+
+            assert api.push_button(CHAT_ID, USER_ID)
+            await wait_for(lambda: len(queued_mrls(service)) == 3)
+            assert resolved == [ALBUM, ALBUM]
+
+            # Fresh resolution replaces expired one
+            async def resolved_at():
+                rows = await db.execute_fetchall(
+                    "SELECT resolved_at FROM play_messages_medias;"
+                )
+                return [row[0] for row in rows]
+
+            for _ in range(100):
+                if all(at > 0 for at in await resolved_at()):
+                    break
+                await asyncio.sleep(0.01)
+            timestamps = await resolved_at()
+            assert len(timestamps) == 3
+            assert all(at > time.time() - 60 for at in timestamps)
+
+    asyncio.run(main())
@@ -0,0 +1,163 @@
+import asyncio
+import datetime
+import os
+
+import vlc
+
+import soak
+from multimedia.engine_profiles import PROFILES
+from multimedia.media import Media
+from runtime_governor import (
+    LOAD_HYSTERESIS,
+    LOAD_THRESHOLDS,
+    TEMPERATURE_HYSTERESIS,
+    TEMPERATURE_THRESHOLDS,
+    RuntimeGovernor,
+    RuntimeLevel,
+    RuntimeSample,
+    _metric_level,
+)
+from service import INFO_UPDATE_INTERVALS, Service
+from tg_bot.module.info_updater_module import InfoUpdaterModule
+
+
+class FakeDevice:
+    # Tree of sysfs and procfs files, which governor reads
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root / "proc")
+
+    def write(self, temperatures, load: float):
+        for zone, temperature in enumerate(temperatures):
+            path = self.root / f"sys/class/thermal/thermal_zone{zone}"
+            os.makedirs(path, exist_ok=True)
+            (path / "temp").write_text(f"{int(temperature * 1000)}\n")
+        (self.root / "proc/loadavg").write_text(f"{load:.2f} 0.50 0.40 1/123 4567\n")
+
+
+def temperature_level(value, current):
+    return _metric_level(
+        value, TEMPERATURE_THRESHOLDS, TEMPERATURE_HYSTERESIS, RuntimeLevel(current)
+    )
+
+
+def test_metric_level_heats_at_once_and_cools_by_one():
+    assert temperature_level(None, RuntimeLevel.Critical) == RuntimeLevel.Normal
+    assert temperature_level(50, RuntimeLevel.Normal) == RuntimeLevel.Normal
+    assert temperature_level(66, RuntimeLevel.Normal) == RuntimeLevel.Warm
+    # Sudden heat skips levels
+    assert temperature_level(80, RuntimeLevel.Normal) == RuntimeLevel.Critical
+    # Cold device steps down one level per sample
+    assert temperature_level(40, RuntimeLevel.Critical) == RuntimeLevel.Hot
+    assert temperature_level(40, RuntimeLevel.Hot) == RuntimeLevel.Warm
+
+
+def test_metric_level_hysteresis():
+    warm, hot, _ = TEMPERATURE_THRESHOLDS
+    # Just below threshold level is kept
+    assert temperature_level(hot - 1, RuntimeLevel.Hot) == RuntimeLevel.Hot
+    assert (
+        temperature_level(hot - TEMPERATURE_HYSTERESIS - 0.1, RuntimeLevel.Hot)
+        == RuntimeLevel.Warm
+    )
+    assert temperature_level(warm - 1, RuntimeLevel.Warm) == RuntimeLevel.Warm
+
+    load = LOAD_THRESHOLDS[0] - LOAD_HYSTERESIS / 2
+    assert _metric_level(load, LOAD_THRESHOLDS, LOAD_HYSTERESIS, RuntimeLevel.Warm) == 1
+
+
+def test_sample_reads_hottest_zone_and_load_per_cpu(tmp_path):
+    device = FakeDevice(tmp_path)
+    governor = RuntimeGovernor(root=str(tmp_path), cpu_count=4)
+    assert governor.sample() == RuntimeSample(None, None)
+
+    device.write([45.5, 71.0], load=6.0)
+    assert governor.sample() == RuntimeSample(71.0, 1.5)
+
+    # Broken zone is skipped
+    (tmp_path / "sys/class/thermal/thermal_zone1/temp").write_text("garbage")
+    assert governor.sample().temperature == 45.5
+
+
+def test_level_callbacks_are_called_on_change_only(tmp_path):
+    device = FakeDevice(tmp_path)
+    governor = RuntimeGovernor(root=str(tmp_path), cpu_count=4)
+    levels = []
+    # Failed callback doesn't break others
+    governor.add_level_callback(lambda level: 1 / 0)
+    governor.add_level_callback(levels.append)
+
+    for temperature, load in (
+        (50, 0.4),
+        (66, 1.0),
+        (64, 1.0),
+        (79, 2.0),
+        (74, 2.0),
+        # Load alone keeps device hot
+        (70, 11.0),
+        (62, 2.0),
+        (55, 1.0),
+        (55, 1.0),
+    ):
+        device.write([temperature], load)
+        governor.update(governor.sample())
+
+    assert levels == [
+        RuntimeLevel.Warm,
+        RuntimeLevel.Critical,
+        RuntimeLevel.Hot,
+        RuntimeLevel.Warm,
+        RuntimeLevel.Normal,
+    ]
+
+
+def test_service_pauses_background_work_and_degrades_next_track(
+    tmp_path, monkeypatch
+):
+    monkeypatch.setattr(vlc, "Media", soak.FakeVlcMedia)
+    monkeypatch.setattr(vlc, "MediaPlayer", soak.FakeMediaPlayer)
+
+    async def main():
+        device = FakeDevice(tmp_path)
+        governor = RuntimeGovernor(root=str(tmp_path), cpu_count=1)
+        service = Service(
+            telegram_bot_token="123456:TEST",
+            database_path=str(tmp_path / "db.sqlite3"),
+            prefetch_cache_path=str(tmp_path / "prefetch_cache"),
+            telegram_request=soak.FakeBotApi(),
+            runtime_governor=governor,
+            link_warmup=True,
+        )
+        info = service._bot._modules.find_module(InfoUpdaterModule)
+
+        def heat(temperature: float):
+            device.write([temperature], load=0.1)
+            return governor.update(governor.sample())
+
+        assert heat(73) == RuntimeLevel.Hot
+        assert info._update_interval == INFO_UPDATE_INTERVALS[RuntimeLevel.Hot]
+        assert service._prefetch.paused
+        assert service._loudness._paused
+        assert service._link_warmer.paused
+
+        assert heat(80) == RuntimeLevel.Critical
+        media = Media("soak://track/1?d=100")
+        await service._player.play(media)
+        played = service._player._player._media
+        assert played.options == PROFILES["default"].degraded_media_options()
+        # Cached media isn't changed, it's played normally after cooling
+        assert media.vlc_media.options == []
+
+        for _ in range(3):
+            heat(40)
+        assert governor.level == RuntimeLevel.Normal
+        assert info._update_interval == datetime.timedelta(seconds=5)
+        assert not service._prefetch.paused
+        assert not service._loudness._paused
+        assert not service._link_warmer.paused
+
+        await service._player.play(media)
+        assert service._player._player._media is media.vlc_media
+        await service._player.stop()
+
+    asyncio.run(main())
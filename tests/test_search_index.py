@@ -0,0 +1,114 @@
+import pytest
+
+from multimedia.playlist_entry import PlaylistEntry
+from multimedia.search_index import RANKED_FACTOR, SearchIndex
+
+
+def titles(documents):
+    return [document.display_title for document in documents]
+
+
+def test_words_are_matched_by_prefixes():
+    index = SearchIndex()
+    index.add("https://example.com/1.mp3", "Karo Mine", "Lovatu", seen_at=1)
+    index.add("https://example.com/2.mp3", "Dekaro", "Ёлка", seen_at=2)
+    index.add("https://example.com/3.mp3", "Stanemi", "Ber", seen_at=3)
+
+    # Short tokens match starts of words only
+    assert titles(index.search("k")) == ["Karo Mine"]
+    assert titles(index.search("ka")) == ["Karo Mine"]
+    # Longer ones match anywhere, word prefixes are ranked higher
+    assert titles(index.search("karo")) == ["Karo Mine", "Dekaro"]
+    assert titles(index.search("KARO, mi")) == ["Karo Mine"]
+    assert titles(index.search("елк")) == ["Dekaro"]
+    assert titles(index.search("nemi ber")) == ["Stanemi"]
+    # Trigrams of different words don't make a match
+    assert index.search("arom") == []
+    assert index.search("zzz") == []
+
+
+@pytest.mark.parametrize("count", [100, 10_000])
+def test_most_recent_matches_are_found(count):
+    # Small libraries are ranked by heap, big ones are walked by recency
+    index = SearchIndex()
+    for i in range(count):
+        title = "Common" if i % 2 else f"Rare {i}"
+        index.add(f"https://example.com/{i}.mp3", title, seen_at=i)
+
+    found = index.search("co", limit=3)
+    assert [document.seen_at for document in found] == [
+        count - 1,
+        count - 3,
+        count - 5,
+    ]
+    assert [d.seen_at for d in index.search("common", limit=2)] == [
+        count - 1,
+        count - 3,
+    ]
+    assert [d.seen_at for d in index.search("rare", limit=2)] == [
+        count - 2,
+        count - 4,
+    ]
+
+
+def test_queued_tracks_are_found_first():
+    index = SearchIndex()
+    for i in range(1000):
+        index.add(f"https://example.com/{i}.mp3", f"Song {i}", seen_at=i)
+
+    # Old queued track isn't among recent matches, but still wins
+    queue = [PlaylistEntry("https://example.com/5.mp3")]
+    queue += [PlaylistEntry("https://example.com/new.mp3", "Song new")]
+    index.set_queue(queue)
+    assert len(index) == 1001
+
+    found = titles(index.search("song", limit=RANKED_FACTOR))
+    assert found[:2] in (["Song 5", "Song new"], ["Song new", "Song 5"])
+    assert found[2] == "Song 999"
+
+    # Without query queue goes in play order
+    assert titles(index.search("", limit=3)) == ["Song 5", "Song new", "Song 999"]
+
+    index.set_queue([])
+    assert "Song 5" not in titles(index.search("song", limit=RANKED_FACTOR))
+
+
+def test_metadata_is_reindexed():
+    index = SearchIndex()
+    # Track without file name is known by whole mrl
+    document = index.add("https://radio.example.com/?station=1&utm_source=chat")
+    assert titles(index.search("radio chat")) == [document.mrl]
+
+    # Same track by other link
+    index.add("https://radio.example.com/?station=1")
+    assert document.mrl == "https://radio.example.com/?station=1"
+    assert index.search("chat") == []
+    assert titles(index.search("radio station")) == [document.mrl]
+
+    index.add(document.mrl, "Real Title", "Band")
+    assert titles(index.search("real band")) == ["Real Title"]
+    assert index.search("radio") == []
+
+    # Unknown metadata doesn't erase known one
+    index.add("https://radio.example.com/?station=1&utm_source=chat")
+    assert titles(index.search("real")) == ["Real Title"]
+
+
+def test_least_recently_seen_tracks_are_evicted():
+    index = SearchIndex(max_documents=3)
+    first = index.add("https://example.com/1.mp3", "Karo", seen_at=1)
+    second = index.add("https://example.com/2.mp3", "Mine", seen_at=2)
+    index.add("https://example.com/3.mp3", "Lovatu", seen_at=3)
+
+    # Seen again, so next one is evicted, even if it's queued
+    index.add("https://example.com/1.mp3", seen_at=4)
+    index.set_queue([PlaylistEntry("https://example.com/2.mp3")])
+    index.add("https://example.com/4.mp3", "Karo Mine", seen_at=5)
+
+    assert len(index) == 3
+    assert index.get(second.id) is None and index.get(first.id) is first
+    assert titles(index.search("")) == ["Karo Mine", "Karo", "Lovatu"]
+    assert titles(index.search("mine")) == ["Karo Mine"]
+    assert titles(index.search("karo")) == ["Karo Mine", "Karo"]
+    # Evicted documents leave no postings behind
+    assert not any(second.id in posting for posting in index._postings.values())
@@ -0,0 +1,57 @@
+import collections
+
+from multimedia.shuffle_queue import ShuffleQueue
+
+
+def drain(queue: ShuffleQueue) -> list:
+    items = []
+    while queue:
+        items.append(queue.pop())
+    return items
+
+
+def test_same_seed_gives_same_sequence():
+    first = drain(ShuffleQueue(range(100), seed=42))
+    assert first == drain(ShuffleQueue(range(100), seed=42))
+    assert first != drain(ShuffleQueue(range(100), seed=43))
+    assert sorted(first) == list(range(100))
+
+
+def test_drawn_items_keep_their_place_when_queue_grows():
+    queue = ShuffleQueue(range(10), seed=1)
+    head = queue.head(3)
+
+    queue.push(range(10, 1000))
+    assert queue.head(3) == head
+    assert queue.ordered(limit=3) == head
+    assert [queue.pop() for _ in range(3)] == head
+
+    # Not drawn items stay in order of addition
+    assert queue.remaining() == [i for i in range(1000) if i not in head]
+
+
+def test_popped_items_are_compacted_away():
+    queue = ShuffleQueue(range(1000), seed=2)
+    popped = [queue.pop() for _ in range(900)]
+    assert len(queue._items) < 300
+    assert sorted(popped + drain(queue)) == list(range(1000))
+
+
+def test_move_to_front_of_drawn_and_pooled_items():
+    items = [f"track-{i}" for i in range(20)]
+    queue = ShuffleQueue(items, seed=3)
+    drawn, pooled = queue.head(2)[1], next(i for i in items if i not in queue.head(2))
+
+    queue.move_to_front(pooled)
+    assert queue.peek() is pooled
+    queue.move_to_front(drawn)
+    assert queue.head(2) == [drawn, pooled]
+    assert sorted(drain(queue)) == sorted(items)
+
+
+def test_draws_are_uniform():
+    # Every item is equally likely to be played first
+    firsts = collections.Counter(
+        ShuffleQueue(range(4), seed=seed).pop() for seed in range(4000)
+    )
+    assert all(800 < count < 1200 for count in firsts.values())
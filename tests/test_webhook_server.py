@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+import httpx
+
+from telegram.ext import ApplicationBuilder
+
+from tg_bot.webhook_server import SECRET_TOKEN_HEADER, WebhookServer
+
+SECRET = "secret"
+
+
+def command_update(update_id: int, text: str):
+    # Update with bot command, as Telegram sends it
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": -1001, "type": "group", "title": "test"},
+            "from": {"id": 7, "is_bot": False, "first_name": "test"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+        },
+    }
+
+
+def run_with_webhook(scenario, **kwargs):
+    async def main():
+        application = ApplicationBuilder().token("123456:TEST").build()
+        webhook = WebhookServer(application, "127.0.0.1", 0, "/hook", **kwargs)
+        await webhook.start()
+        try:
+            async with httpx.AsyncClient(
+                base_url=f"http://127.0.0.1:{webhook.port}"
+            ) as client:
+                await scenario(client, application.update_queue, webhook)
+        finally:
+            await webhook.stop()
+
+    asyncio.run(main())
+
+
+def test_update_is_dispatched_to_application():
+    async def scenario(client, update_queue, webhook):
+        response = await client.post(
+            "/hook",
+            json=command_update(1, "/ping"),
+            headers={SECRET_TOKEN_HEADER: SECRET},
+        )
+        assert response.status_code == 200
+
+        update = await asyncio.wait_for(update_queue.get(), 2.0)
+        assert update.update_id == 1
+        assert update.effective_message.text == "/ping"
+        assert update.effective_chat.id == -1001
+
+        # Broken update is answered, so Telegram doesn't resend it forever
+        response = await client.post(
+            "/hook", content=b"{", headers={SECRET_TOKEN_HEADER: SECRET}
+        )
+        assert response.status_code == 200
+
+    run_with_webhook(scenario, secret_token=SECRET)
+
+
+def test_foreign_requests_are_rejected():
+    async def scenario(client, update_queue, webhook):
+        update = command_update(1, "/ping")
+        response = await client.post("/hook", json=update)
+        assert response.status_code == 403
+        response = await client.post(
+            "/hook", json=update, headers={SECRET_TOKEN_HEADER: "guess"}
+        )
+        assert response.status_code == 403
+
+        response = await client.post(
+            "/other", json=update, headers={SECRET_TOKEN_HEADER: SECRET}
+        )
+        assert response.status_code == 404
+        response = await client.get("/hook", headers={SECRET_TOKEN_HEADER: SECRET})
+        assert response.status_code == 405
+
+        await asyncio.sleep(0.05)
+        assert update_queue.empty()
+
+    run_with_webhook(scenario, secret_token=SECRET)
+
+
+def test_full_intake_queue_asks_telegram_to_retry():
+    async def scenario(client, update_queue, webhook):
+        # Worker is busy, e.g. with long update
+        webhook._worker_task.cancel()
+
+        statuses = [
+            (await client.post("/hook", json=command_update(i, "/ping"))).status_code
+            for i in range(2)
+        ]
+        assert statuses == [200, 503]
+
+    run_with_webhook(scenario, queue_size=1)
@@ -0,0 +1,142 @@
+import asyncio
+import collections
+import gc
+import hashlib
+import json
+import typing as tp
+
+from http import HTTPStatus
+
+from http_server import HttpRequest, HttpResponse
+from media_parser.yandex_music_parser import SIGN_SALT, YandexMusicParser
+from stub_server import serve
+
+TRACK_URL = "https://music.yandex.com/album/21370360/track/101378847"
+MRL = f"{TRACK_URL}?access_token=token"
+
+
+class ApiStub:
+    # download-info of api and storage, answering with latency of real ones
+    def __init__(self):
+        self.base = ""
+        self.requests: tp.Counter[str] = collections.Counter()
+
+    async def __call__(self, request: HttpRequest) -> HttpResponse:
+        self.requests[request.path.split("/")[1]] += 1
+        await asyncio.sleep(0.05)
+
+        if request.path == "/tracks/404/download-info":
+            return HttpResponse(status=HTTPStatus.NOT_FOUND)
+        if request.path == "/tracks/503/download-info":
+            await asyncio.sleep(0.2)
+            return HttpResponse(status=HTTPStatus.SERVICE_UNAVAILABLE)
+        if request.path.endswith("/download-info"):
+            result = [
+                {
+                    "codec": codec,
+                    "bitrateInKbps": bitrate,
+                    "downloadInfoUrl": f"{self.base}/info/{codec}/{bitrate}",
+                }
+                for codec, bitrate in (("mp3", 128), ("mp3", 320), ("aac", 512))
+            ]
+            body = json.dumps({"result": result}).encode("utf-8")
+            return HttpResponse(body=body, content_type="application/json")
+        if request.path.startswith("/info/"):
+            body = (
+                f"<download-info><host>storage</host>"
+                f"<path>/music{request.path}.mp3</path><ts>0005f7e1</ts>"
+                "<s>secret</s></download-info>"
+            )
+            return HttpResponse(body=body.encode("utf-8"))
+        return HttpResponse(status=HTTPStatus.NOT_FOUND)
+
+
+def run_with_parser(scenario, **kwargs):
+    async def main():
+        stub = ApiStub()
+        async with serve(stub) as base:
+            stub.base = base
+            parser = YandexMusicParser(api_url=base, **kwargs)
+            try:
+                await scenario(parser, stub)
+            finally:
+                if parser._client is not None:
+                    await parser._client.aclose()
+
+    asyncio.run(main())
+
+
+def test_best_mp3_is_resolved_to_signed_url():
+    async def scenario(parser, stub):
+        path = "/music/info/mp3/320.mp3"
+        sign = hashlib.md5(f"{SIGN_SALT}{path[1:]}secret".encode("utf-8")).hexdigest()
+
+        assert await parser.resolve_stream(MRL) == (
+            f"http://storage/get-mp3/{sign}/0005f7e1{path}"
+        )
+        assert stub.requests == {"tracks": 1, "info": 1}
+
+    run_with_parser(scenario)
+
+
+def test_resolved_url_is_cached_until_expiry():
+    async def scenario(parser, stub):
+        url = await parser.resolve_stream(MRL)
+        assert await parser.resolve_stream(MRL) == url
+        assert stub.requests["tracks"] == 1
+
+        # Other link of same track shares cached url
+        assert await parser.resolve_stream(f"{TRACK_URL}?from=chat") == url
+        assert stub.requests["tracks"] == 1
+
+        parser._stream_ttl = 0
+        await parser.resolve_stream(f"{TRACK_URL[:-3]}001")
+        await parser.resolve_stream(f"{TRACK_URL[:-3]}001")
+        assert stub.requests["tracks"] == 3
+
+    run_with_parser(scenario)
+
+
+def test_concurrent_resolutions_share_requests():
+    async def scenario(parser, stub):
+        urls = await asyncio.gather(*(parser.resolve_stream(MRL) for _ in range(10)))
+
+        assert len(set(urls)) == 1
+        assert stub.requests == {"tracks": 1, "info": 1}
+
+    run_with_parser(scenario)
+
+
+def test_unknown_and_failed_tracks_are_not_resolved():
+    async def scenario(parser, stub):
+        assert await parser.resolve_stream("https://example.com/track/1.mp3") is None
+        assert await parser.resolve_stream("https://music.yandex.ru/album/1") is None
+        assert not stub.requests
+
+        assert await parser.resolve_stream(f"{TRACK_URL[:-9]}404") is None
+        # Failure isn't cached
+        assert await parser.resolve_stream(f"{TRACK_URL[:-9]}404") is None
+        assert stub.requests["tracks"] == 2
+
+    run_with_parser(scenario)
+
+
+def test_failure_after_waiters_timed_out_is_retrieved():
+    async def scenario(parser, stub):
+        errors = []
+        asyncio.get_running_loop().set_exception_handler(
+            lambda loop, context: errors.append(context)
+        )
+
+        mrl = f"{TRACK_URL[:-9]}503"
+        try:
+            await asyncio.wait_for(parser.resolve_stream(mrl), 0.05)
+        except asyncio.TimeoutError:
+            pass
+        while parser._resolving:
+            await asyncio.sleep(0.01)
+
+        gc.collect()
+        assert not errors
+
+    run_with_parser(scenario)
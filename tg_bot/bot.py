@@ -1,6 +1,12 @@
+import asyncio
+import datetime
 import logging
+import signal
+import typing as tp
 
 from tg_bot.callbacks import Callbacks
+from tg_bot.broadcaster import Broadcaster
+from tg_bot.chat_ordered_application import ChatOrderedApplication
 from tg_bot.module.context import ModuleContext
 from tg_bot.module.container import ModuleContainer
 from tg_bot.module.hi_module import HiModule
@@ -8,30 +14,71 @@ from tg_bot.module.info_updater_module import InfoUpdaterModule
 from tg_bot.module.keyboard_callback_module import KeyboardCallbackModule
 from tg_bot.module.whereami_module import WhereAmIModule
 from tg_bot.module.player_module import PlayerModule
+from tg_bot.module.stats_module import StatsModule
+from tg_bot.module.playlist_transfer_module import PlaylistTransferModule
+from tg_bot.module.debug_module import DebugModule
+from tg_bot.module.link_warmup_module import LinkWarmupModule
+from tg_bot.module.inline_search_module import InlineSearchModule
 from multimedia.media import Media
 from database import Database
 from telegram.constants import ParseMode
 
+from telegram import Update
+from telegram.request import BaseRequest
 from telegram._utils.defaultvalue import DEFAULT_NONE
-from telegram.ext import Application
+from telegram.ext import Application, CommandHandler, CallbackContext
 
 from tg_bot.utils import shorten_to_message
+from tg_bot.webhook_server import WebhookConfig, WebhookServer
 
 MESSAGE_NOTIFY_AUTOPLAY = "🔔 Сейчас будет играть: `{}`"
+MESSAGE_RELOAD_SUCCESS = "🔄 Модули перезагружены\\."
+MESSAGE_RELOAD_FAIL = "😔 Не получилось перезагрузить модули, работают старые\\."
+MESSAGE_RELOAD_FORBIDDEN = "🤔 Перезагрузка доступна только администраторам\\."
 
 
 logger = logging.getLogger(__name__)
 
 
 class TelegramBot:
-    def __init__(self, token: str, database: Database):
+    def __init__(
+        self,
+        token: str,
+        database: Database,
+        webhook_config: tp.Optional[WebhookConfig] = None,
+        request: tp.Optional[BaseRequest] = None,
+        max_concurrent_updates: int = 8,
+        debug_admins: tp.Iterable[int] = (),
+    ):
         self._debug_mode = True
+        self._debug_admins = frozenset(debug_admins)
+        self._webhook_config = webhook_config
+        self._webhook_server: tp.Optional[WebhookServer] = None
 
         self._database: Database = database
 
         self._cb: Callbacks = Callbacks()
 
-        self._application = Application.builder().token(token).build()
+        # Every update gets own task, application keeps them ordered per chat
+        builder = (
+            Application.builder()
+            .token(token)
+            .application_class(
+                ChatOrderedApplication,
+                kwargs={"max_concurrent_updates": max_concurrent_updates},
+            )
+            .concurrent_updates(True)
+        )
+
+        # Custom request replaces Bot API connection (e.g. in soak test)
+        if request is not None:
+            builder = builder.request(request).get_updates_request(request)
+        self._application = builder.build()
+
+        self._broadcaster = Broadcaster(
+            self._application.bot,
+            prune_callback=self._forget_chat,
+        )
 
         self._modules = ModuleContainer()
 
@@ -40,6 +87,7 @@ class TelegramBot:
             bot=self._application,
             callbacks=self._cb,
             database=self._database,
+            debug_admins=self._debug_admins,
         )
 
         self._modules.add_module(HiModule(module_ctx))
@@ -47,15 +95,32 @@ class TelegramBot:
         self._modules.add_module(KeyboardCallbackModule(module_ctx))
         self._modules.add_module(WhereAmIModule(module_ctx))
         self._modules.add_module(PlayerModule(module_ctx))
+        self._modules.add_module(StatsModule(module_ctx))
+        self._modules.add_module(PlaylistTransferModule(module_ctx))
+        self._modules.add_module(DebugModule(module_ctx))
+        self._modules.add_module(LinkWarmupModule(module_ctx))
+        self._modules.add_module(InlineSearchModule(module_ctx))
 
     @property
     def callbacks(self) -> Callbacks:
         return self._cb
 
+    def reload_modules(self) -> bool:
+        return self._modules.reload()
+
     async def run(self):
         # Initialize modules
         self._modules.initialize()
 
+        # Reload is handled by bot itself, not by module being reloaded.
+        # It also keeps default handlers group alive during reload.
+        self._application.add_handler(
+            CommandHandler("reload", self._on_reload_command)
+        )
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGHUP, self.reload_modules
+        )
+
         def error_callback(exc) -> None:
             self._application.create_task(
                 self._application.process_error(error=exc, update=None)
@@ -63,6 +128,12 @@ class TelegramBot:
 
         # Running bot wtf?!
         await self._application.initialize()
+
+        if self._webhook_config is not None:
+            await self._start_webhook()
+            await self._application.start()
+            return
+
         await self._application.updater.start_polling(
             poll_interval=0.0,
             timeout=10,
@@ -77,6 +148,55 @@ class TelegramBot:
         )
         await self._application.start()
 
+    async def _on_reload_command(
+        self,
+        update: Update,
+        context: CallbackContext.DEFAULT_TYPE,
+    ):
+        try:
+            # Reload resets state of every module, so chat users can't do it
+            if update.effective_user.id not in self._debug_admins:
+                await update.message.reply_text(
+                    MESSAGE_RELOAD_FORBIDDEN, parse_mode=ParseMode.MARKDOWN_V2
+                )
+                return
+
+            if self.reload_modules():
+                await update.message.reply_text(
+                    MESSAGE_RELOAD_SUCCESS, parse_mode=ParseMode.MARKDOWN_V2
+                )
+            else:
+                await update.message.reply_text(
+                    MESSAGE_RELOAD_FAIL, parse_mode=ParseMode.MARKDOWN_V2
+                )
+        except Exception:
+            logger.error("Unable to reload modules.", exc_info=True)
+
+    async def _start_webhook(self):
+        config = self._webhook_config
+
+        self._webhook_server = WebhookServer(
+            self._application,
+            listen=config.listen,
+            port=config.port,
+            url_path=config.url_path,
+            secret_token=config.secret_token,
+        )
+        await self._webhook_server.start()
+
+        api_kwargs = None
+        if config.secret_token is not None:
+            api_kwargs = {"secret_token": config.secret_token}
+
+        await self._application.bot.set_webhook(
+            url=config.url,
+            api_kwargs=api_kwargs,
+        )
+        logger.info("Receiving updates with webhook '%s'", config.url)
+
+    def set_info_update_interval(self, interval: datetime.timedelta):
+        self._modules.find_module(InfoUpdaterModule).set_update_interval(interval)
+
     async def notify_currently_playing(self, media: Media):
         await self._notify(
             MESSAGE_NOTIFY_AUTOPLAY.format(
@@ -85,12 +205,13 @@ class TelegramBot:
         )
 
     async def _notify(self, text):
-        for chat_id in self._application.chat_data:
-            try:
-                await self._application.bot.send_message(
-                    chat_id=chat_id,
-                    text=text,
-                    parse_mode=ParseMode.MARKDOWN_V2,
-                )
-            except Exception:
-                logger.error("Unable to notify %s chat", str(chat_id))
+        await self._broadcaster.broadcast(
+            self._application.chat_data.keys(),
+            text=text,
+            parse_mode=ParseMode.MARKDOWN_V2,
+        )
+
+    def _forget_chat(self, chat_id):
+        self._application.drop_chat_data(chat_id)
+        self._application.forget_chat_stats(chat_id)
+        self._modules.find_module(InfoUpdaterModule).forget_chat(chat_id)
@@ -0,0 +1,118 @@
+import asyncio
+import dataclasses
+import typing as tp
+import logging
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Errors meaning that chat is gone for good
+GONE_CHAT_MESSAGES = (
+    "chat not found",
+    "bot was blocked",
+    "bot was kicked",
+    "user is deactivated",
+    "group chat was deactivated",
+)
+
+PruneCallback = tp.Callable[[tp.Union[int, str]], None]
+
+
+@dataclasses.dataclass()
+class BroadcastResult:
+    sent: tp.List[tp.Union[int, str]] = dataclasses.field(default_factory=list)
+    failed: tp.List[tp.Union[int, str]] = dataclasses.field(default_factory=list)
+    pruned: tp.List[tp.Union[int, str]] = dataclasses.field(default_factory=list)
+
+
+def is_chat_gone(error: Exception) -> bool:
+    if isinstance(error, Forbidden):
+        return True
+
+    if isinstance(error, BadRequest):
+        message = str(error).lower()
+        return any(gone in message for gone in GONE_CHAT_MESSAGES)
+
+    return False
+
+
+class Broadcaster:
+    def __init__(
+        self,
+        bot: Bot,
+        prune_callback: tp.Optional[PruneCallback] = None,
+        max_concurrency: int = 30,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+    ):
+        self._bot = bot
+        self._prune_callback = prune_callback
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._max_attempts = max_attempts
+        self._base_delay = base_delay
+
+    async def broadcast(
+        self,
+        chat_ids: tp.Iterable[tp.Union[int, str]],
+        **send_message_kwargs,
+    ) -> BroadcastResult:
+        result = BroadcastResult()
+
+        await asyncio.gather(
+            *[
+                self._send(chat_id, result, send_message_kwargs)
+                for chat_id in list(chat_ids)
+            ]
+        )
+
+        logger.info(
+            "Broadcast sent to %d chats, %d failed, %d pruned",
+            len(result.sent),
+            len(result.failed),
+            len(result.pruned),
+        )
+
+        return result
+
+    async def _send(
+        self,
+        chat_id: tp.Union[int, str],
+        result: BroadcastResult,
+        send_message_kwargs: tp.Dict[str, tp.Any],
+    ):
+        for attempt in range(self._max_attempts):
+            try:
+                async with self._semaphore:
+                    await self._bot.send_message(chat_id=chat_id, **send_message_kwargs)
+                result.sent.append(chat_id)
+                return
+            except RetryAfter as e:
+                # Flood control, waiting exactly as long as Telegram asked
+                delay = e.retry_after
+            except Exception as e:
+                if is_chat_gone(e):
+                    logger.info("Chat %s is gone (%s), pruning it", chat_id, str(e))
+                    result.pruned.append(chat_id)
+                    if self._prune_callback is not None:
+                        self._prune_callback(chat_id)
+                    return
+
+                if not isinstance(e, NetworkError) or isinstance(e, BadRequest):
+                    logger.error("Unable to notify %s chat", str(chat_id), exc_info=True)
+                    break
+
+                delay = self._base_delay * 2**attempt
+
+            if attempt + 1 == self._max_attempts:
+                break
+
+            logger.warning(
+                "Unable to notify %s chat, retrying in %.1f seconds",
+                str(chat_id),
+                delay,
+            )
+            await asyncio.sleep(delay)
+
+        result.failed.append(chat_id)
@@ -2,18 +2,36 @@ import dataclasses
 import typing as tp
 
 from multimedia.media import Media
-from multimedia.player import PlayerState
+from multimedia.playlist_entry import PlaylistEntry
+from multimedia.player import PlayerState, PlayerSnapshot
+from multimedia.prefetch_cache import PrefetchStats
+from multimedia.search_index import SearchDocument
+from database import ResolvedMedia
 
 
-AddToPlaylistCallback = tp.Callable[[str], tp.Awaitable[tp.List[Media]]]
-ListPlaylistCallback = tp.Callable[[], tp.List[Media]]
+# Second argument is id of requesting Telegram user
+AddToPlaylistCallback = tp.Callable[
+    [str, tp.Optional[int]], tp.Awaitable[tp.List[PlaylistEntry]]
+]
+AddResolvedToPlaylistCallback = tp.Callable[
+    [tp.List[ResolvedMedia], tp.Optional[int]], tp.Awaitable[tp.List[PlaylistEntry]]
+]
+# Entries aren't queued, so resolution may run outside of chat order
+ResolveForPlaylistCallback = tp.Callable[
+    [str, tp.Optional[int]], tp.Awaitable[tp.List[PlaylistEntry]]
+]
+AddEntriesToPlaylistCallback = tp.Callable[
+    [tp.List[PlaylistEntry]], tp.Awaitable[tp.List[PlaylistEntry]]
+]
+ListPlaylistCallback = tp.Callable[[], tp.List[PlaylistEntry]]
+HeadPlaylistCallback = tp.Callable[[int], tp.List[PlaylistEntry]]
+GetPlaylistLengthCallback = tp.Callable[[], int]
 CurrentMediaCallback = tp.Callable[[], tp.Optional[Media]]
 CurrentPlayerStateCallback = tp.Callable[[], PlayerState]
 PauseCallback = tp.Callable[[], None]
 ResumeCallback = tp.Callable[[], None]
 SkipCallback = tp.Callable[[], tp.Awaitable[None]]
 SkipAllCallback = tp.Callable[[], tp.Awaitable[None]]
-ShuffleCallback = tp.Callable[[], tp.Awaitable[None]]
 GetVolumeCallback = tp.Callable[[], int]
 SetVolumeCallback = tp.Callable[[int], None]
 GetCursorCallback = tp.Callable[[], int]
@@ -21,19 +39,33 @@ SetCursorCallback = tp.Callable[[int], None]
 GetLengthCallback = tp.Callable[[int], None]
 GetSeekCallback = tp.Callable[[], int]
 SetSeekCallback = tp.Callable[[int], None]
+GetPlayerSnapshotCallback = tp.Callable[[], PlayerSnapshot]
+GetPlaylistVersionCallback = tp.Callable[[], int]
+GetPrefetchStatsCallback = tp.Callable[[], PrefetchStats]
+GetFairQueueCallback = tp.Callable[[], bool]
+SetFairQueueCallback = tp.Callable[[bool], None]
+WarmUpLinksCallback = tp.Callable[[tp.List[str]], tp.Awaitable[None]]
+GetShufflePlayCallback = tp.Callable[[], bool]
+SetShufflePlayCallback = tp.Callable[[bool, tp.Optional[int]], None]
+SearchTracksCallback = tp.Callable[[str, int], tp.List[SearchDocument]]
+GetSearchResultCallback = tp.Callable[[int], tp.Optional[SearchDocument]]
 
 
 @dataclasses.dataclass()
 class Callbacks:
     add_to_playlist: tp.Optional[AddToPlaylistCallback] = None
+    add_resolved_to_playlist: tp.Optional[AddResolvedToPlaylistCallback] = None
+    resolve_for_playlist: tp.Optional[ResolveForPlaylistCallback] = None
+    add_entries_to_playlist: tp.Optional[AddEntriesToPlaylistCallback] = None
     list_playlist: tp.Optional[ListPlaylistCallback] = None
+    head_playlist: tp.Optional[HeadPlaylistCallback] = None
+    get_playlist_length: tp.Optional[GetPlaylistLengthCallback] = None
     current_media: tp.Optional[CurrentMediaCallback] = None
     current_player_state: tp.Optional[CurrentPlayerStateCallback] = None
     pause: tp.Optional[PauseCallback] = None
     resume: tp.Optional[ResumeCallback] = None
     skip: tp.Optional[SkipCallback] = None
     skipall: tp.Optional[SkipAllCallback] = None
-    shuffle: tp.Optional[ShuffleCallback] = None
     get_volume: tp.Optional[GetVolumeCallback] = None
     set_volume: tp.Optional[SetVolumeCallback] = None
     get_cursor: tp.Optional[GetCursorCallback] = None
@@ -41,3 +73,13 @@ class Callbacks:
     get_length: tp.Optional[GetLengthCallback] = None
     get_seek: tp.Optional[GetSeekCallback] = None
     set_seek: tp.Optional[SetSeekCallback] = None
+    get_player_snapshot: tp.Optional[GetPlayerSnapshotCallback] = None
+    get_playlist_version: tp.Optional[GetPlaylistVersionCallback] = None
+    get_prefetch_stats: tp.Optional[GetPrefetchStatsCallback] = None
+    get_fair_queue: tp.Optional[GetFairQueueCallback] = None
+    set_fair_queue: tp.Optional[SetFairQueueCallback] = None
+    get_shuffle_play: tp.Optional[GetShufflePlayCallback] = None
+    set_shuffle_play: tp.Optional[SetShufflePlayCallback] = None
+    warm_up_links: tp.Optional[WarmUpLinksCallback] = None
+    search_tracks: tp.Optional[SearchTracksCallback] = None
+    get_search_result: tp.Optional[GetSearchResultCallback] = None
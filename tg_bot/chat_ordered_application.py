@@ -0,0 +1,126 @@
+import asyncio
+import contextlib
+import dataclasses
+import time
+import typing as tp
+
+from telegram import Update
+from telegram.ext import Application
+
+# Updates without chat and user are not ordered
+OrderingKey = tp.Optional[tp.Union[int, tp.Tuple[str, int]]]
+
+
+@dataclasses.dataclass()
+class ChatDispatchStats:
+    processed: int = 0
+    # Updates received, but not finished yet
+    depth: int = 0
+    max_depth: int = 0
+    # Seconds from receiving update to start of its handling
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    @property
+    def average_wait(self) -> float:
+        return self.total_wait / self.processed if self.processed else 0.0
+
+
+def _ordering_key(update: object) -> OrderingKey:
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    if update.effective_user is not None:
+        return ("user", update.effective_user.id)
+    return None
+
+
+class ChatOrderedApplication(Application):
+    # Updates of one chat are handled one by one in order of arrival,
+    # different chats are handled concurrently. Application has to be
+    # built with concurrent_updates, so every update gets its own task;
+    # this class limits them itself. Chat lock is taken before global
+    # semaphore, so updates waiting for their chat never hold a slot.
+    def __init__(self, *, max_concurrent_updates: int = 8, **kwargs):
+        super().__init__(**kwargs)
+
+        self._max_concurrent_updates = max_concurrent_updates
+        self._dispatch_semaphore = asyncio.Semaphore(max_concurrent_updates)
+        self._chat_locks: tp.Dict[OrderingKey, asyncio.Lock] = {}
+        # Updates and sections holding or waiting for chat lock
+        self._lock_users: tp.Dict[OrderingKey, int] = {}
+        self._dispatch_stats: tp.Dict[OrderingKey, ChatDispatchStats] = {}
+        self._in_flight = 0
+
+    @property
+    def max_concurrent_updates(self) -> int:
+        return self._max_concurrent_updates
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def dispatch_stats(self) -> tp.Dict[OrderingKey, ChatDispatchStats]:
+        return self._dispatch_stats
+
+    def forget_chat_stats(self, chat_id: int):
+        self._dispatch_stats.pop(chat_id, None)
+
+    async def process_update(self, update: object) -> None:
+        key = _ordering_key(update)
+        if key is None:
+            async with self._dispatch_semaphore:
+                await self._process_counted(update)
+            return
+
+        stats = self._dispatch_stats.get(key)
+        if stats is None:
+            stats = self._dispatch_stats[key] = ChatDispatchStats()
+
+        received = time.monotonic()
+        stats.depth += 1
+        stats.max_depth = max(stats.max_depth, stats.depth)
+        try:
+            async with self._chat_lock(key):
+                async with self._dispatch_semaphore:
+                    wait = time.monotonic() - received
+                    stats.total_wait += wait
+                    stats.max_wait = max(stats.max_wait, wait)
+
+                    await self._process_counted(update)
+                    stats.processed += 1
+        finally:
+            stats.depth -= 1
+
+    def ordered(self, chat_id: int) -> tp.AsyncContextManager[None]:
+        # Section of work, which update started in background (e.g. after
+        # slow resolution), is run between updates of the chat. It must not
+        # be entered by handler of that chat, handler holds the lock.
+        return self._chat_lock(chat_id)
+
+    @contextlib.asynccontextmanager
+    async def _chat_lock(self, key: OrderingKey):
+        # Lock acquisition is FIFO, tasks start in order of arrival
+        lock = self._chat_locks.get(key)
+        if lock is None:
+            lock = self._chat_locks[key] = asyncio.Lock()
+
+        self._lock_users[key] = self._lock_users.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._lock_users[key] -= 1
+            if not self._lock_users[key]:
+                # Idle chats don't keep their locks
+                del self._lock_users[key]
+                self._chat_locks.pop(key, None)
+
+    async def _process_counted(self, update: object):
+        self._in_flight += 1
+        try:
+            await super().process_update(update)
+        finally:
+            self._in_flight -= 1
@@ -0,0 +1,54 @@
+import asyncio
+import typing as tp
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+FlushCallback = tp.Callable[[tp.Dict[str, tp.List[int]]], tp.Awaitable[None]]
+
+
+# Collects relative changes (volume, seek, ...) pushed during `window`
+# seconds and hands all of them to `flush_callback` at once. Deltas are
+# kept in push order, so they can be clamped exactly like sequential
+# presses would be.
+class InputCoalescer:
+    def __init__(self, flush_callback: FlushCallback, window: float = 0.3):
+        self._flush_callback = flush_callback
+        self._window = window
+
+        self._deltas: tp.Dict[str, tp.List[int]] = {}
+        self._flush_task: tp.Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    def push(self, name: str, delta: int):
+        self._deltas.setdefault(name, []).append(delta)
+
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    def cancel(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self._deltas.clear()
+
+    async def _flush_later(self):
+        await asyncio.sleep(self._window)
+
+        # Presses arriving from now on are going to the next window
+        deltas, self._deltas = self._deltas, {}
+        self._flush_task = None
+
+        # Windows are applied one after another, never concurrently
+        async with self._flush_lock:
+            try:
+                await self._flush_callback(deltas)
+            except Exception:
+                logger.error("Unable to apply coalesced input", exc_info=True)
+
+
+def apply_clamped(value: int, deltas: tp.Iterable[int], low: int, high: int) -> int:
+    for delta in deltas:
+        value = sorted((low, value + delta, high))[1]
+    return value
@@ -1,21 +1,50 @@
 import abc
+import asyncio
 import typing as tp
 
 from tg_bot.module.context import ModuleContext
 from tg_bot.callbacks import Callbacks
 from database import Database
 
-from telegram.ext import Application
+from telegram.ext import Application, Handler
 
 
 class BasicModule(abc.ABC):
     def __init__(self, context: ModuleContext):
         self._ctx: ModuleContext = context
+        self._handlers: tp.List[tp.Tuple[Handler, int]] = []
 
     @abc.abstractmethod
     def _initialize(self):
         pass
 
+    def _shutdown(self):
+        # Module is going to be unloaded, it must not receive updates anymore
+        for handler, group in self._handlers:
+            self.application.remove_handler(handler, group)
+        self._handlers.clear()
+
+    def _export_state(self) -> tp.Dict[str, tp.Any]:
+        # State, that is carried over to reloaded instance of module
+        return {}
+
+    def _import_state(self, state: tp.Dict[str, tp.Any]):
+        pass
+
+    def add_handler(self, handler: Handler, group: int = 0):
+        self.application.add_handler(handler, group)
+        self._handlers.append((handler, group))
+
+    def run_in_background(self, coro: tp.Coroutine) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._ctx.background_tasks.add(task)
+        task.add_done_callback(self._ctx.background_tasks.discard)
+        return task
+
+    @property
+    def context(self) -> ModuleContext:
+        return self._ctx
+
     def find_module(self, cls: type) -> tp.Optional[tp.Any]:
         return self._ctx.container.find_module(cls)
 
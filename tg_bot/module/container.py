@@ -1,8 +1,18 @@
 import typing as tp
 import logging
+import importlib
+import sys
+import time
 
 logger = logging.getLogger(__name__)
 
+# Base classes are reloaded before concrete modules, so they inherit
+# from fresh code.
+BASE_PYTHON_MODULES = [
+    "tg_bot.module.basic_module",
+    "tg_bot.module.basic_utility_module",
+]
+
 
 class ModuleContainer:
     def __init__(self):
@@ -23,3 +33,55 @@ class ModuleContainer:
     def initialize(self):
         for module in self._modules.values():
             module._initialize()
+
+    def reload(self):
+        # Everything is done synchronously, so no update is processed with
+        # half of modules unloaded. Player, playlist and service are not
+        # touched at all.
+        started = time.perf_counter()
+
+        old_modules = self._modules
+        states = {name: module._export_state() for name, module in old_modules.items()}
+
+        for module in old_modules.values():
+            module._shutdown()
+
+        try:
+            new_modules = self._reimport_modules(old_modules)
+        except Exception:
+            logger.error("Unable to reload modules, restoring old ones", exc_info=True)
+            new_modules = old_modules
+
+        self._modules = new_modules
+        for name, module in new_modules.items():
+            module._import_state(states[name])
+
+        self.initialize()
+
+        logger.info(
+            "Reloaded %d modules in %.1f ms",
+            len(new_modules),
+            (time.perf_counter() - started) * 1000,
+        )
+
+        return new_modules is not old_modules
+
+    def _reimport_modules(self, modules: tp.Dict[str, "BasicModule"]):
+        reloaded = set()
+
+        def reload_python_module(name: str):
+            if name not in reloaded:
+                importlib.reload(sys.modules[name])
+                reloaded.add(name)
+            return sys.modules[name]
+
+        for name in BASE_PYTHON_MODULES:
+            reload_python_module(name)
+
+        new_modules = {}
+        for name, module in modules.items():
+            python_module = reload_python_module(type(module).__module__)
+            cls = getattr(python_module, type(module).__name__)
+            new_modules[name] = cls(module.context)
+
+        return new_modules
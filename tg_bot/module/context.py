@@ -1,4 +1,6 @@
+import asyncio
 import dataclasses
+import typing as tp
 
 from tg_bot.module.container import ModuleContainer
 from tg_bot.callbacks import Callbacks
@@ -13,3 +15,9 @@ class ModuleContext:
     bot: Application
     callbacks: Callbacks
     database: Database
+    # Telegram users allowed to dump diagnostics of all chats
+    debug_admins: tp.FrozenSet[int] = frozenset()
+
+    # Tasks started by modules. Kept here, so they are referenced until
+    # finished, even if module that started them was reloaded.
+    background_tasks: tp.Set[asyncio.Task] = dataclasses.field(default_factory=set)
@@ -0,0 +1,123 @@
+import logging
+import re
+import time
+import typing as tp
+
+from tg_bot.module.basic_utility_module import BasicUtilityModule
+import diagnostics
+
+from telegram.ext import CommandHandler, TypeHandler, CallbackContext
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_DEBUG_EMPTY = "🤔 Ничего не записано\\."
+MESSAGE_DEBUG_USAGE = (
+    "🤔 Использование: `/debug [N]` или `/debug 30s|10m|1h`, "
+    "последние N событий или события за период\\."
+)
+MESSAGE_DEBUG_CAPTION = "🐞 Событий: {}"
+MESSAGE_DEBUG_DISABLED = "🤔 Отладка выключена\\."
+MESSAGE_DEBUG_FORBIDDEN = "🤔 Отладка доступна только администраторам\\."
+
+DEBUG_FILENAME = "debug-{}.jsonl"
+DEFAULT_DEBUG_EVENTS = 200
+
+WINDOW_RE = re.compile(r"^(\d+)([smh])$")
+WINDOW_UNITS = {"s": 1, "m": 60, "h": 3600}
+
+
+def _describe_update(update: Update) -> tp.Dict[str, tp.Any]:
+    # Only things, that help to restore order of actions, are recorded
+    fields = {
+        "update_id": update.update_id,
+        "chat": update.effective_chat.id if update.effective_chat else None,
+        "user": update.effective_user.id if update.effective_user else None,
+    }
+
+    message = update.effective_message
+    if update.callback_query is not None:
+        fields["callback"] = update.callback_query.data
+    elif message is not None and message.text and message.text.startswith("/"):
+        fields["command"] = message.text
+    elif message is not None and message.document is not None:
+        fields["document"] = message.document.file_name
+    return fields
+
+
+class DebugModule(BasicUtilityModule):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    def _initialize(self):
+        # Group is before all others, so update is recorded before handling
+        self.add_handler(TypeHandler(Update, self.__record_update), group=-1)
+        self.add_handler(CommandHandler("debug", self.__on_debug_command))
+        self.application.add_error_handler(self.__on_error)
+
+    def _shutdown(self):
+        super()._shutdown()
+
+        self.application.remove_error_handler(self.__on_error)
+
+    async def __record_update(
+        self,
+        update: Update,
+        context: CallbackContext.DEFAULT_TYPE,
+    ):
+        diagnostics.record("telegram.update", **_describe_update(update))
+
+    async def __on_error(
+        self,
+        update: tp.Optional[object],
+        context: CallbackContext.DEFAULT_TYPE,
+    ):
+        diagnostics.record(
+            "telegram.error",
+            error=repr(context.error),
+            update_id=update.update_id if isinstance(update, Update) else None,
+        )
+        logger.error("Unhandled telegram error", exc_info=context.error)
+
+    async def __on_debug_command(
+        self,
+        update: Update,
+        context: CallbackContext.DEFAULT_TYPE,
+    ):
+        try:
+            if not self.is_debug:
+                await self._reply(update, MESSAGE_DEBUG_DISABLED)
+                return
+
+            # Events of all chats are dumped: their users, commands and links
+            if update.effective_user.id not in self.context.debug_admins:
+                await self._reply(update, MESSAGE_DEBUG_FORBIDDEN)
+                return
+
+            last, window = DEFAULT_DEBUG_EVENTS, None
+            if context.args:
+                argument = context.args[0]
+                match = WINDOW_RE.match(argument)
+                if match is not None:
+                    last = None
+                    window = int(match[1]) * WINDOW_UNITS[match[2]]
+                elif argument.isdigit():
+                    last = int(argument)
+                else:
+                    await self._reply(update, MESSAGE_DEBUG_USAGE)
+                    return
+
+            events = diagnostics.recorder.events(last=last, window=window)
+            if not events:
+                await self._reply(update, MESSAGE_DEBUG_EMPTY)
+                return
+
+            await self.application.bot.send_document(
+                chat_id=update.effective_chat.id,
+                document=diagnostics.dump_events(events),
+                filename=DEBUG_FILENAME.format(time.strftime("%Y%m%d-%H%M%S")),
+                caption=MESSAGE_DEBUG_CAPTION.format(len(events)),
+            )
+        except Exception:
+            logger.error("Unable to dump debug events.", exc_info=True)
+            await self._exception_notify(update)
@@ -15,13 +15,13 @@ class HiModule(BasicUtilityModule):
         super().__init__(*args, **kwargs)
 
     def _initialize(self):
-        self.application.add_handler(
+        self.add_handler(
             MessageHandler(
                 filters.Regex(r"^((\\o|o\/|\\o\/) *)+$"),
                 self.__on_hi,
             )
         )
-        self.application.add_handler(
+        self.add_handler(
             MessageHandler(
                 filters.Regex(r"^(☀️|🌤|🌥|⛅️|🌦|🌞|🌅)$"),
                 self.__on_emoji_hi,
@@ -10,7 +10,8 @@ from tg_bot.module.basic_utility_module import BasicUtilityModule
 from tg_bot.module.keyboard_callback_module import KeyboardCallbackModule
 from tg_bot.module.player_module import PlayerModule
 from tg_bot.utils import shorten_to_message, choose_multiplication
-from multimedia.player import PlayerState
+from tg_bot.input_coalescer import InputCoalescer, apply_clamped
+from multimedia.player import PlayerState, PlayerSnapshot
 
 from telegram import (
     User,
@@ -48,6 +49,7 @@ KEYBOARD_BUTTON_RESUME = "▶️"
 KEYBOARD_BUTTON_SKIP = "⏭️"
 KEYBOARD_BUTTON_SKIPALL = "⏏️"
 KEYBOARD_BUTTON_SHUFFLE = "🔀"
+KEYBOARD_BUTTON_UNSHUFFLE = "➡️"
 KEYBOARD_BUTTON_FF = "⏩"
 KEYBOARD_BUTTON_FR = "⏪"
 
@@ -66,14 +68,18 @@ class InfoUpdaterModule(BasicUtilityModule):
 
         self._info_messages: tp.Dict[tp.Union[int, str], tp.Tuple[Message, User]] = {}
         self._last_update = datetime.datetime.now()
+        self._last_rendered_versions: tp.Optional[tp.Tuple[int, int]] = None
 
         self._update_interval = datetime.timedelta(seconds=5)
         self._auto_update_task: asyncio.Task = None
         self._kb_module: KeyboardCallbackModule = None
         self._player_module: PlayerModule = None
 
+        # Fast taps on seek/volume buttons are applied once per window
+        self._input_coalescer = InputCoalescer(self._apply_coalesced_input)
+
     def _initialize(self):
-        self.application.add_handler(CommandHandler("info", self.__on_info_command))
+        self.add_handler(CommandHandler("info", self.__on_info_command))
 
         self._kb_module = self.find_module(KeyboardCallbackModule)
         self._player_module = self.find_module(PlayerModule)
@@ -88,6 +94,27 @@ class InfoUpdaterModule(BasicUtilityModule):
 
         self._auto_update_task = asyncio.create_task(self._auto_update_job())
 
+    def _shutdown(self):
+        super()._shutdown()
+
+        self._auto_update_task.cancel()
+        self._input_coalescer.cancel()
+
+    def _export_state(self) -> tp.Dict[str, tp.Any]:
+        return {
+            "info_messages": self._info_messages,
+            "last_update": self._last_update,
+            "update_interval": self._update_interval,
+        }
+
+    def _import_state(self, state: tp.Dict[str, tp.Any]):
+        self._info_messages = state["info_messages"]
+        self._last_update = state["last_update"]
+        self._update_interval = state["update_interval"]
+
+    def set_update_interval(self, interval: datetime.timedelta):
+        self._update_interval = interval
+
     async def __on_info_command(
         self,
         update: Update,
@@ -97,7 +124,7 @@ class InfoUpdaterModule(BasicUtilityModule):
             prev_message = self._info_messages.get(update.effective_chat.id)
             if prev_message is not None:
                 try:
-                    await prev_message.delete()
+                    await prev_message[0].delete()
                 except Exception:
                     logger.warning("Unable to delete message", exc_info=True)
 
@@ -113,21 +140,29 @@ class InfoUpdaterModule(BasicUtilityModule):
             logger.error("Unable to perform info/playlist command.", exc_info=True)
             await self._exception_notify(update)
 
-    async def build_info_message(self):
+    def forget_chat(self, chat_id: tp.Union[int, str]):
+        self._info_messages.pop(chat_id, None)
+
+    async def build_info_message(self, snapshot: tp.Optional[PlayerSnapshot] = None):
         max_medias_per_info = 16
 
-        medias = self.callbacks.list_playlist()
+        if snapshot is None:
+            snapshot = self.callbacks.get_player_snapshot()
+
+        # Only shown part of queue is built, it's rendered on every change
+        medias = self.callbacks.head_playlist(max_medias_per_info)
+        medias_count = self.callbacks.get_playlist_length()
 
         titles = "\n".join(
             [
                 f"\\- `{escape_markdown(shorten_to_message(str(await media.media_title)), 2)}`"
-                for media in medias[:max_medias_per_info]
+                for media in medias
             ]
         )
 
-        if len(medias) > max_medias_per_info:
+        if medias_count > max_medias_per_info:
             titles += "\n"
-            tracks_left = len(medias) - max_medias_per_info
+            tracks_left = medias_count - max_medias_per_info
             titles += MESSAGE_TOO_MANY_TRACKS.format(
                 tracks_left,
                 choose_multiplication(
@@ -139,16 +174,23 @@ class InfoUpdaterModule(BasicUtilityModule):
             )
 
         return MESSAGE_LIST_PLAYLIST.format(
-            await self._player_module.status_fmt(),
-            self._player_module.volume_fmt(),
-            len(medias),
+            await self._player_module.status_fmt(snapshot),
+            self._player_module.volume_fmt(snapshot),
+            medias_count,
             titles,
         )
 
+    def _current_versions(self, snapshot: PlayerSnapshot) -> tp.Tuple[int, int]:
+        return snapshot.version, self.callbacks.get_playlist_version()
+
     async def update_info_messages(self):
-        text = await self.build_info_message()
+        # Single snapshot, so every chat sees the same consistent state
+        snapshot = self.callbacks.get_player_snapshot()
+        text = await self.build_info_message(snapshot)
+        buttons = self.generate_info_buttons(snapshot)
 
         self._last_update = datetime.datetime.now()
+        self._last_rendered_versions = self._current_versions(snapshot)
         await asyncio.gather(
             *[
                 self._update_info_message(
@@ -156,15 +198,19 @@ class InfoUpdaterModule(BasicUtilityModule):
                     message=message_user_tuple[0],
                     user_from=message_user_tuple[1],
                     text=text,
+                    buttons=buttons,
                 )
-                for chat_id, message_user_tuple in self._info_messages.items()
+                for chat_id, message_user_tuple in list(self._info_messages.items())
             ]
         )
 
-    def generate_info_buttons(self):
-        state = self.callbacks.current_player_state()
-        current_media = self.callbacks.current_media()
-        medias = self.callbacks.list_playlist()
+    def generate_info_buttons(self, snapshot: tp.Optional[PlayerSnapshot] = None):
+        if snapshot is None:
+            snapshot = self.callbacks.get_player_snapshot()
+
+        state = snapshot.state
+        current_media = snapshot.media
+        medias_count = self.callbacks.get_playlist_length()
 
         none_button = InlineKeyboardButton(
             KEYBOARD_BUTTON_EMPTY,
@@ -189,20 +235,23 @@ class InfoUpdaterModule(BasicUtilityModule):
         skipall_button = none_button
         shuffle_button = none_button
 
-        if current_media or medias:
+        if current_media or medias_count:
             skip_button = InlineKeyboardButton(
                 KEYBOARD_BUTTON_SKIP,
                 callback_data=self._kb_module.build_data(CB_SKIP_NAME),
             )
 
-        if medias:
+        if medias_count:
             skipall_button = InlineKeyboardButton(
                 KEYBOARD_BUTTON_SKIPALL,
                 callback_data=self._kb_module.build_data(CB_SKIPALL_NAME),
             )
 
+            # Toggles shuffle play, queue itself isn't reordered
             shuffle_button = InlineKeyboardButton(
-                KEYBOARD_BUTTON_SHUFFLE,
+                KEYBOARD_BUTTON_UNSHUFFLE
+                if self.callbacks.get_shuffle_play()
+                else KEYBOARD_BUTTON_SHUFFLE,
                 callback_data=self._kb_module.build_data(CB_SHUFFLE_NAME),
             )
 
@@ -249,11 +298,10 @@ class InfoUpdaterModule(BasicUtilityModule):
         message: Message,
         user_from: User,
         text: str,
+        buttons: InlineKeyboardMarkup,
     ):
         real_text = self._build_reply_text(user_from.name, text)
 
-        buttons = self.generate_info_buttons()
-
         if all(
             (
                 message.reply_markup == buttons,
@@ -305,6 +353,12 @@ class InfoUpdaterModule(BasicUtilityModule):
                     logger.info("Trying to autoupdate too early, waiting again.")
                     continue
 
+                versions = self._current_versions(self.callbacks.get_player_snapshot())
+                if versions == self._last_rendered_versions:
+                    # Nothing changed since last render, skipping edits
+                    self._last_update = datetime.datetime.now()
+                    continue
+
                 await self.update_info_messages()
             except Exception:
                 logger.error(
@@ -338,7 +392,7 @@ class InfoUpdaterModule(BasicUtilityModule):
         query: CallbackQuery,
         data: tp.Any,
     ):
-        await self.callbacks.shuffle()
+        self.callbacks.set_shuffle_play(not self.callbacks.get_shuffle_play())
         await self.update_info_messages()
 
     async def __callback_seek(
@@ -347,14 +401,7 @@ class InfoUpdaterModule(BasicUtilityModule):
         query: CallbackQuery,
         data: tp.Any,
     ):
-        value = data["seconds"]
-
-        current_cursor = self.callbacks.get_cursor()
-        current_cursor += value
-        current_cursor = sorted((0, current_cursor, self.callbacks.get_length()))[1]
-        self.callbacks.set_cursor(current_cursor)
-
-        await self.update_info_messages()
+        self._input_coalescer.push(CB_SEEK_NAME, data["seconds"])
 
     async def __callback_volume(
         self,
@@ -362,13 +409,24 @@ class InfoUpdaterModule(BasicUtilityModule):
         query: CallbackQuery,
         data: tp.Any,
     ):
-        value = data["value"]
-
-        old_volume = self.callbacks.get_volume()
+        self._input_coalescer.push(CB_VOLUME_NAME, data["value"])
+
+    async def _apply_coalesced_input(self, deltas: tp.Dict[str, tp.List[int]]):
+        if CB_SEEK_NAME in deltas:
+            self.callbacks.set_cursor(
+                apply_clamped(
+                    self.callbacks.get_cursor(),
+                    deltas[CB_SEEK_NAME],
+                    0,
+                    self.callbacks.get_length(),
+                )
+            )
 
-        new_volume = sorted((0, old_volume + value, 100))[1]
+        if CB_VOLUME_NAME in deltas:
+            self.callbacks.set_volume(
+                apply_clamped(self.callbacks.get_volume(), deltas[CB_VOLUME_NAME], 0, 100)
+            )
 
-        self.callbacks.set_volume(new_volume)
         await self.update_info_messages()
 
     async def __callback_pause(
@@ -0,0 +1,107 @@
+import logging
+
+from tg_bot.module.basic_utility_module import BasicUtilityModule
+from tg_bot.utils import seconds_to_time, shorten_to_message
+from multimedia.search_index import SearchDocument
+from database import ResolvedMedia
+
+from telegram.constants import ParseMode
+from telegram.helpers import escape_markdown
+from telegram.ext import (
+    InlineQueryHandler,
+    ChosenInlineResultHandler,
+    CallbackContext,
+)
+from telegram import (
+    Update,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
+)
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_INLINE_CHOSEN = "🎶 Добавляю из поиска:\n`{}`"
+
+# Telegram accepts at most 50 results per answer
+MAX_RESULTS = 50
+# Queue changes often, so answers are cached briefly
+RESULTS_CACHE_TIME = 5
+
+
+# `@bot query` finds tracks in queue, history and database. Picked
+# result is queued from known mrl without resolving link again.
+# Inline feedback must be enabled in @BotFather, otherwise Telegram
+# doesn't report picked results.
+class InlineSearchModule(BasicUtilityModule):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    def _initialize(self):
+        self.add_handler(InlineQueryHandler(self.__on_inline_query))
+        self.add_handler(ChosenInlineResultHandler(self.__on_chosen_result))
+
+    @staticmethod
+    def _build_result(document: SearchDocument) -> InlineQueryResultArticle:
+        title = document.display_title
+        description = " · ".join(
+            part
+            for part in (
+                document.artist,
+                seconds_to_time(document.duration) if document.duration else None,
+            )
+            if part
+        )
+        return InlineQueryResultArticle(
+            id=str(document.id),
+            title=title,
+            description=description or None,
+            input_message_content=InputTextMessageContent(
+                MESSAGE_INLINE_CHOSEN.format(
+                    escape_markdown(shorten_to_message(title), 2)
+                ),
+                parse_mode=ParseMode.MARKDOWN_V2,
+            ),
+        )
+
+    async def __on_inline_query(
+        self,
+        update: Update,
+        context: CallbackContext.DEFAULT_TYPE,
+    ):
+        query = update.inline_query
+        try:
+            documents = self.callbacks.search_tracks(query.query, MAX_RESULTS)
+            await query.answer(
+                [self._build_result(document) for document in documents],
+                cache_time=RESULTS_CACHE_TIME,
+            )
+        except Exception:
+            # There is no chat to notify, user just sees no results
+            logger.error("Unable to answer inline query.", exc_info=True)
+
+    async def __on_chosen_result(
+        self,
+        update: Update,
+        context: CallbackContext.DEFAULT_TYPE,
+    ):
+        result = update.chosen_inline_result
+        try:
+            document = self.callbacks.get_search_result(int(result.result_id))
+            if document is None:
+                logger.warning("Chosen track %s is gone from index", result.result_id)
+                return
+
+            await self.callbacks.add_resolved_to_playlist(
+                [
+                    ResolvedMedia(
+                        uri=document.mrl,
+                        mrl=document.mrl,
+                        title=document.title,
+                        artist=document.artist,
+                        duration=document.duration,
+                    )
+                ],
+                result.from_user.id,
+            )
+        except Exception:
+            logger.error("Unable to queue chosen inline result.", exc_info=True)
@@ -1,6 +1,5 @@
 import logging
 import json
-import asyncio
 
 from tg_bot.module.basic_utility_module import BasicUtilityModule
 
@@ -29,7 +28,7 @@ class KeyboardCallbackModule(BasicUtilityModule):
         return json.dumps(result)
 
     def _initialize(self):
-        self.application.add_handler(CallbackQueryHandler(self.__handler))
+        self.add_handler(CallbackQueryHandler(self.__handler))
 
     async def __handler(
         self,
@@ -49,7 +48,7 @@ class KeyboardCallbackModule(BasicUtilityModule):
                     f"No processor for keyboard callback '{processor_name}'"
                 )
 
-            asyncio.create_task(processor(update, query, data))
+            await processor(update, query, data)
         except Exception:
             logger.error("Unable to perform callback", exc_info=True)
             await self._exception_notify(update)
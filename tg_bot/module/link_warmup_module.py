@@ -0,0 +1,47 @@
+import logging
+import re
+
+from tg_bot.module.basic_utility_module import BasicUtilityModule
+
+from telegram.ext import MessageHandler, filters, CallbackContext
+from telegram import (
+    Update,
+)
+
+logger = logging.getLogger(__name__)
+
+URL_RE = re.compile(r"https?://\S+")
+
+# Links in one message, that are resolved in advance
+MAX_LINKS_PER_MESSAGE = 5
+
+
+class LinkWarmupModule(BasicUtilityModule):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    def _initialize(self):
+        # Separate group, so plain messages are still seen by other modules
+        self.add_handler(
+            MessageHandler(
+                filters.TEXT & ~filters.COMMAND & filters.Regex(URL_RE),
+                self.__on_links,
+            ),
+            group=1,
+        )
+
+    async def __on_links(
+        self,
+        update: Update,
+        context: CallbackContext.DEFAULT_TYPE,
+    ):
+        # Warm up is opt-in, service sets callback only when it's enabled
+        if self.callbacks.warm_up_links is None:
+            return
+
+        try:
+            urls = URL_RE.findall(update.effective_message.text)
+            await self.callbacks.warm_up_links(urls[:MAX_LINKS_PER_MESSAGE])
+        except Exception:
+            # Nobody asked for it, so chat isn't bothered with errors
+            logger.error("Unable to warm up links.", exc_info=True)
@@ -1,17 +1,28 @@
-import logging
 import asyncio
+import contextlib
+import functools
+import logging
+import time
 import typing as tp
 
 from tg_bot.module.keyboard_callback_module import KeyboardCallbackModule
 from tg_bot.module.basic_utility_module import BasicUtilityModule
 from tg_bot.utils import time_to_seconds, seconds_to_time, shorten_to_message
-from multimedia.player import PlayerState
-from multimedia.media import Media
+from multimedia.player import PlayerState, PlayerSnapshot
+from multimedia.mrl import normalize_mrl
+from multimedia.playlist_entry import PlaylistEntry
+from database import ResolvedMedia
 
 from telegram.constants import ParseMode
 from telegram.helpers import escape_markdown
 from telegram.ext import CommandHandler, CallbackContext
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, CallbackQuery
+from telegram import (
+    Update,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    CallbackQuery,
+    Message,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -41,26 +52,40 @@ MESSAGE_PLAYER_SEEK_STATUS = "Текущая позиция: `{}/{}`"
 
 MESSAGE_PAUSE_SUCCESS = "⏸️ Музыка успешно поставлена на паузу"
 MESSAGE_RESUME_SUCCESS = "▶️ Музыка успешно продолжена"
+MESSAGE_FAIR_QUEUE_ON = "⚖️ Очередь по кругу: каждый получает свою очередь треков\\."
+MESSAGE_FAIR_QUEUE_OFF = "➡️ Обычная очередь: треки играют в порядке добавления\\."
+MESSAGE_SHUFFLE_ON = "🔀 Случайный порядок: следующий трек выбирается случайно\\."
+MESSAGE_SHUFFLE_ON_SEED = "🔀 Случайный порядок с зерном `{}`\\."
+MESSAGE_SHUFFLE_OFF = "➡️ Обычный порядок: треки играют в порядке добавления\\."
+
 MESSAGE_UNABLE_TO_PLAY_EMPTY = (
     "⚠️ Невозможно поставить на паузу или продолжить\\. Плеер ничего не играет\\."
 )
 
 CB_REPLAY_NAME = "replay"
 
+# Resolved media links may die eventually (removed files, changed tokens)
+RESOLVED_MEDIA_TTL = 30 * 24 * 60 * 60
+
 
 class PlayerModule(BasicUtilityModule):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self._kb_module: KeyboardCallbackModule = None
+        # Set when last request of every chat is queued, next request
+        # of chat is queued after it
+        self._queued: tp.Dict[int, asyncio.Future] = {}
 
     def _initialize(self):
         self._kb_module = self.find_module(KeyboardCallbackModule)
 
-        self.application.add_handler(CommandHandler("p", self.__on_play_command))
-        self.application.add_handler(CommandHandler("skip", self.__on_skip_command))
-        self.application.add_handler(CommandHandler("seek", self.__on_seek_command))
-        self.application.add_handler(CommandHandler("volume", self.__on_volume_command))
+        self.add_handler(CommandHandler("p", self.__on_play_command))
+        self.add_handler(CommandHandler("skip", self.__on_skip_command))
+        self.add_handler(CommandHandler("seek", self.__on_seek_command))
+        self.add_handler(CommandHandler("volume", self.__on_volume_command))
+        self.add_handler(CommandHandler("fair", self.__on_fair_command))
+        self.add_handler(CommandHandler("shuffle", self.__on_shuffle_command))
 
         self._kb_module.register_processor(CB_REPLAY_NAME, self.__on_replay_callback)
 
@@ -83,7 +108,7 @@ class PlayerModule(BasicUtilityModule):
                     await self._reply(update, MESSAGE_UNABLE_TO_PLAY_EMPTY)
                 return
 
-            asyncio.create_task(self.add_medias(update, context.args))
+            await self.add_medias(update, context.args)
 
         except Exception:
             logger.error("Unable to perform play command.", exc_info=True)
@@ -154,6 +179,56 @@ class PlayerModule(BasicUtilityModule):
             logger.error("Unable to perform skip command.", exc_info=True)
             await self._exception_notify(update)
 
+    async def __on_fair_command(
+        self,
+        update: Update,
+        context: CallbackContext.DEFAULT_TYPE,
+    ):
+        try:
+            # `/fair on`, `/fair off` or just `/fair` to toggle
+            if context.args and context.args[0] in ("on", "off"):
+                enabled = context.args[0] == "on"
+            else:
+                enabled = not self.callbacks.get_fair_queue()
+
+            self.callbacks.set_fair_queue(enabled)
+
+            await self._reply(
+                update, MESSAGE_FAIR_QUEUE_ON if enabled else MESSAGE_FAIR_QUEUE_OFF
+            )
+        except Exception:
+            logger.error("Unable to perform fair command.", exc_info=True)
+            await self._exception_notify(update)
+
+    async def __on_shuffle_command(
+        self,
+        update: Update,
+        context: CallbackContext.DEFAULT_TYPE,
+    ):
+        try:
+            # `/shuffle on`, `/shuffle off`, `/shuffle <seed>` or just
+            # `/shuffle` to toggle. Same seed gives same order of tracks.
+            seed = None
+            if context.args and context.args[0] in ("on", "off"):
+                enabled = context.args[0] == "on"
+            elif context.args and context.args[0].lstrip("-").isdigit():
+                enabled, seed = True, int(context.args[0])
+            else:
+                enabled = not self.callbacks.get_shuffle_play()
+
+            self.callbacks.set_shuffle_play(enabled, seed)
+
+            if not enabled:
+                message = MESSAGE_SHUFFLE_OFF
+            elif seed is not None:
+                message = MESSAGE_SHUFFLE_ON_SEED.format(seed)
+            else:
+                message = MESSAGE_SHUFFLE_ON
+            await self._reply(update, message)
+        except Exception:
+            logger.error("Unable to perform shuffle command.", exc_info=True)
+            await self._exception_notify(update)
+
     async def __on_replay_callback(
         self,
         update: Update,
@@ -175,38 +250,79 @@ class PlayerModule(BasicUtilityModule):
             ),
         )
 
-        # Trying to fetch medias from playlist
-        medias: tp.List[tp.Tuple[str, Media]] = []
-        url_to_medias = {}
-        for url in uris:
-            new_medias = await self.callbacks.add_to_playlist(url)
-            medias += [(url, media) for media in new_medias]
-            await status_message.edit_text(
-                self._build_reply_text(
-                    query.from_user.name,
-                    MESSAGE_MEDIA_READDED.format(
-                        len(medias),
-                        "\n".join(
-                            [
-                                f"\\- [{escape_markdown(shorten_to_message(f'{await media.media_title}'), 2)}]({escape_markdown(url, 2)})"
-                                for url in uris
-                                if url in url_to_medias
-                                for media in url_to_medias[url]
-                            ]
-                            + [
-                                f"\\- `{escape_markdown(url, 2)}`"
-                                for url in uris
-                                if url not in url_to_medias
-                            ]
-                        ),
-                    ),
-                ),
-                parse_mode=ParseMode.MARKDOWN_V2,
-            )
+        self._run_queueing(
+            update.effective_chat.id,
+            functools.partial(
+                self._requeue_medias, update, message_id, uris, status_message
+            ),
+        )
+
+    async def _requeue_medias(
+        self,
+        update: Update,
+        message_id: int,
+        uris: tp.List[str],
+        status_message: Message,
+        previous: tp.Optional[asyncio.Future],
+        queued: asyncio.Future,
+    ):
+        query = update.callback_query
+        try:
+            # Medias, resolved when message was sent, are added without
+            # resolution. Only expired ones are resolved again.
+            expire_before = time.time() - RESOLVED_MEDIA_TTL
+            resolved: tp.Dict[str, tp.List[ResolvedMedia]] = {}
+            for media in await self.database.fetch_play_message_medias(message_id):
+                resolved.setdefault(media.uri, []).append(media)
+
+            entries: tp.List[tp.Tuple[str, PlaylistEntry]] = []
+            resolved_again: tp.Dict[str, tp.List[PlaylistEntry]] = {}
+            for url in uris:
+                url_medias = resolved.get(url)
+                if url_medias and all(
+                    m.resolved_at >= expire_before for m in url_medias
+                ):
+                    entries += [
+                        (
+                            url,
+                            PlaylistEntry(
+                                m.mrl,
+                                title=m.title,
+                                artist=m.artist,
+                                duration=m.duration,
+                                requester=query.from_user.id,
+                                source=url,
+                            ),
+                        )
+                        for m in url_medias
+                    ]
+                    continue
+
+                new_entries = await self.callbacks.resolve_for_playlist(
+                    url, query.from_user.id
+                )
+                entries += [(url, entry) for entry in new_entries]
+                resolved_again[url] = new_entries
+
+            # Whole request is queued at once
+            async with self._queue_section(update.effective_chat.id, previous):
+                added = await self.callbacks.add_entries_to_playlist(
+                    [entry for _, entry in entries]
+                )
+            queued.set_result(None)
 
-        # Notifying people, that we was successfull about it.
-        await status_message.edit_text(
-            self._build_reply_text(
+            # Duplicates may be skipped, so entries are matched by mrl
+            entry_uris = {normalize_mrl(entry.mrl): url for url, entry in entries}
+            medias = [
+                (entry_uris.get(normalize_mrl(media.mrl), media.mrl), media)
+                for media in added
+            ]
+
+            for url, new_entries in resolved_again.items():
+                await self._save_resolved(message_id, url, new_entries)
+
+            # Notifying people, that we was successfull about it.
+            text = self._build_reply_text(
                 query.from_user.name,
                 MESSAGE_MEDIA_READDED.format(
                     len(medias),
@@ -217,21 +333,16 @@ class PlayerModule(BasicUtilityModule):
                         ]
                     ),
                 ),
-            ),
-            parse_mode=ParseMode.MARKDOWN_V2,
-            reply_markup=InlineKeyboardMarkup(
-                [
-                    [
-                        InlineKeyboardButton(
-                            KEYBOARD_BUTTON_REPEAT,
-                            callback_data=self._kb_module.build_data(
-                                CB_REPLAY_NAME, {"play_message_id": message_id}
-                            ),
-                        )
-                    ],
-                ]
-            ),
-        )
+            )
+            async with self.application.ordered(update.effective_chat.id):
+                await status_message.edit_text(
+                    text,
+                    parse_mode=ParseMode.MARKDOWN_V2,
+                    reply_markup=self._build_replay_markup(message_id),
+                )
+        except Exception:
+            logger.error("Unable to replay medias.", exc_info=True)
+            await self._exception_notify(update)
 
     async def __on_volume_command(
         self,
@@ -272,28 +383,50 @@ class PlayerModule(BasicUtilityModule):
             logger.error("Unable to perform volume command.", exc_info=True)
             await self._exception_notify(update)
 
-    def volume_fmt(self):
-        return MESSAGE_VOLUME_STATUS.format(self.callbacks.get_volume())
+    def volume_fmt(self, snapshot: tp.Optional[PlayerSnapshot] = None):
+        if snapshot is None:
+            snapshot = self.callbacks.get_player_snapshot()
+        return MESSAGE_VOLUME_STATUS.format(snapshot.volume)
+
+    async def status_fmt(self, snapshot: tp.Optional[PlayerSnapshot] = None):
+        if snapshot is None:
+            snapshot = self.callbacks.get_player_snapshot()
 
-    async def status_fmt(self):
-        state = self.callbacks.current_player_state()
-        if state == PlayerState.Playing:
-            current_media = self.callbacks.current_media()
+        if snapshot.state == PlayerState.Playing:
             return MESSAGE_PLAYER_PLAYING.format(
-                f"{await current_media.media_title}",
-                seconds_to_time(self.callbacks.get_cursor()),
-                seconds_to_time(self.callbacks.get_length()),
+                f"{await snapshot.media.media_title}",
+                seconds_to_time(snapshot.cursor),
+                seconds_to_time(snapshot.length),
             )
-        elif state == PlayerState.Paused:
-            current_media = self.callbacks.current_media()
+        elif snapshot.state == PlayerState.Paused:
             return MESSAGE_PLAYER_PAUSED.format(
-                f"{await current_media.media_title}",
-                seconds_to_time(self.callbacks.get_cursor()),
-                seconds_to_time(self.callbacks.get_length()),
+                f"{await snapshot.media.media_title}",
+                seconds_to_time(snapshot.cursor),
+                seconds_to_time(snapshot.length),
             )
-        elif state == PlayerState.Stopped:
+        elif snapshot.state == PlayerState.Stopped:
             return MESSAGE_PLAYER_STOPPED
 
+    async def _save_resolved(self, message_id: int, url: str, medias: tp.List[PlaylistEntry]):
+        await self.database.set_play_message_medias(
+            message_id, url, await self._resolved_medias(url, medias)
+        )
+
+    @staticmethod
+    async def _resolved_medias(
+        url: str, medias: tp.List[PlaylistEntry]
+    ) -> tp.List[ResolvedMedia]:
+        return [
+            ResolvedMedia(
+                uri=url,
+                mrl=media.mrl,
+                title=await media.media_title,
+                artist=await media.media_artist,
+                duration=await media.media_duration,
+            )
+            for media in medias
+        ]
+
     async def add_medias(self, update: Update, uris: tp.List[str]):
         # Notifying people, that we are trying our best
         status_message = await self._reply(
@@ -303,45 +436,74 @@ class PlayerModule(BasicUtilityModule):
             ),
         )
 
-        # Saving request to database.
-        play_message_id = await self.database.add_play_message(uris)
-
-        # Trying to fetch medias from playlist
-        medias: tp.List[tp.Tuple[str, Media]] = []
-        url_to_medias = {}
-        for url in uris:
-            new_medias = await self.callbacks.add_to_playlist(url)
-
-            url_to_medias[url] = new_medias
-            medias += [(url, media) for media in new_medias]
-
-            # Notifying people, about process
-            await status_message.edit_text(
-                self._build_reply_text(
-                    update.message.from_user.name,
-                    MESSAGE_MEDIA_ADDED.format(
-                        len(medias),
-                        "\n".join(
-                            [
-                                f"\\- [{escape_markdown(shorten_to_message('{await media.media_title}'), 2)}]({escape_markdown(url, 2)})"
-                                for url in uris
-                                if url in url_to_medias
-                                for media in url_to_medias[url]
-                            ]
-                            + [
-                                f"\\- `{escape_markdown(url, 2)}`"
-                                for url in uris
-                                if url not in url_to_medias
-                            ]
+        self._run_queueing(
+            update.effective_chat.id,
+            functools.partial(self._queue_medias, update, uris, status_message),
+        )
+
+    async def _queue_medias(
+        self,
+        update: Update,
+        uris: tp.List[str],
+        status_message: Message,
+        previous: tp.Optional[asyncio.Future],
+        queued: asyncio.Future,
+    ):
+        chat_id = update.effective_chat.id
+        try:
+            # Trying to fetch medias from playlist
+            medias: tp.List[tp.Tuple[str, PlaylistEntry]] = []
+            url_to_medias = {}
+            for url in uris:
+                # Resolution doesn't hold other updates of chat
+                entries = await self.callbacks.resolve_for_playlist(
+                    url, update.effective_user.id
+                )
+
+                async with self._queue_section(chat_id, previous):
+                    new_medias = await self.callbacks.add_entries_to_playlist(entries)
+
+                url_to_medias[url] = new_medias
+                medias += [(url, media) for media in new_medias]
+
+                # Notifying people, about process
+                await status_message.edit_text(
+                    self._build_reply_text(
+                        update.message.from_user.name,
+                        MESSAGE_MEDIA_ADDED.format(
+                            len(medias),
+                            "\n".join(
+                                [
+                                    f"\\- [{escape_markdown(shorten_to_message('{await media.media_title}'), 2)}]({escape_markdown(url, 2)})"
+                                    for url in uris
+                                    if url in url_to_medias
+                                    for media in url_to_medias[url]
+                                ]
+                                + [
+                                    f"\\- `{escape_markdown(url, 2)}`"
+                                    for url in uris
+                                    if url not in url_to_medias
+                                ]
+                            ),
                         ),
                     ),
-                ),
-                parse_mode=ParseMode.MARKDOWN_V2,
+                    parse_mode=ParseMode.MARKDOWN_V2,
+                )
+            queued.set_result(None)
+
+            # Saving request to database with resolution result, so it's
+            # replayed instantly. One write per request keeps writer free.
+            play_message_id = await self.database.add_play_message(
+                uris,
+                [
+                    resolved
+                    for url, new_medias in url_to_medias.items()
+                    for resolved in await self._resolved_medias(url, new_medias)
+                ],
             )
 
-        # Notifying people, that we was successfull about it.
-        await status_message.edit_text(
-            self._build_reply_text(
+            # Notifying people, that we was successfull about it.
+            text = self._build_reply_text(
                 update.message.from_user.name,
                 MESSAGE_MEDIA_ADDED.format(
                     len(medias),
@@ -352,18 +514,60 @@ class PlayerModule(BasicUtilityModule):
                         ]
                     ),
                 ),
-            ),
-            parse_mode=ParseMode.MARKDOWN_V2,
-            reply_markup=InlineKeyboardMarkup(
+            )
+            async with self.application.ordered(chat_id):
+                await status_message.edit_text(
+                    text,
+                    parse_mode=ParseMode.MARKDOWN_V2,
+                    reply_markup=self._build_replay_markup(play_message_id),
+                )
+        except Exception:
+            logger.error("Unable to add medias.", exc_info=True)
+            await self._exception_notify(update)
+
+    def _build_replay_markup(self, play_message_id: int) -> InlineKeyboardMarkup:
+        return InlineKeyboardMarkup(
+            [
                 [
-                    [
-                        InlineKeyboardButton(
-                            KEYBOARD_BUTTON_REPEAT,
-                            callback_data=self._kb_module.build_data(
-                                CB_REPLAY_NAME, {"play_message_id": play_message_id}
-                            ),
-                        )
-                    ],
-                ]
-            ),
+                    InlineKeyboardButton(
+                        KEYBOARD_BUTTON_REPEAT,
+                        callback_data=self._kb_module.build_data(
+                            CB_REPLAY_NAME, {"play_message_id": play_message_id}
+                        ),
+                    )
+                ],
+            ]
         )
+
+    def _run_queueing(
+        self,
+        chat_id: int,
+        queueing: tp.Callable[
+            [tp.Optional[asyncio.Future], asyncio.Future], tp.Coroutine
+        ],
+    ):
+        # Queueing is finished in background, so slow resolution doesn't
+        # hold ⏭, pause and /info of the chat
+        previous = self._queued.get(chat_id)
+        queued = self._queued[chat_id] = asyncio.get_running_loop().create_future()
+        task = self.run_in_background(queueing(previous, queued))
+
+        def forget(_):
+            # Failed request doesn't hold next ones
+            if not queued.done():
+                queued.set_result(None)
+            if self._queued.get(chat_id) is queued:
+                del self._queued[chat_id]
+
+        task.add_done_callback(forget)
+
+    @contextlib.asynccontextmanager
+    async def _queue_section(
+        self, chat_id: int, previous: tp.Optional[asyncio.Future]
+    ):
+        # Requests of chat are queued in order they were sent, even if
+        # later one is resolved faster
+        if previous is not None:
+            await asyncio.wait([previous])
+        async with self.application.ordered(chat_id):
+            yield
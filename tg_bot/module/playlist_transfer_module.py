@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import time
+import typing as tp
+
+from tg_bot.module.basic_utility_module import BasicUtilityModule
+from multimedia.playlist_codec import (
+    PlaylistRecord,
+    PlaylistDecoder,
+    PlaylistCodecError,
+    encode_playlist,
+)
+from database import ResolvedMedia
+
+from telegram.constants import ParseMode
+from telegram.helpers import escape_markdown
+from telegram.ext import CommandHandler, MessageHandler, filters, CallbackContext
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_EXPORT_EMPTY = "🤔 Нечего сохранять, очередь пуста\\."
+MESSAGE_EXPORT_CAPTION = "💾 Очередь: {} шт."
+MESSAGE_IMPORT_NO_DOCUMENT = (
+    "🤔 Отправь файл очереди с подписью /import или ответь /import на него\\."
+)
+MESSAGE_IMPORT_TOO_BIG = "😔 Файл слишком большой\\."
+MESSAGE_IMPORT_BROKEN = "😔 Не получилось прочитать файл: `{}`"
+MESSAGE_IMPORT_SUCCESS = "🎶 Загрузили из файла {} шт\\."
+
+EXPORT_FILENAME = "playlist-{}.pmbq"
+
+# Bot API doesn't allow bots to download bigger files
+MAX_IMPORT_FILE_SIZE = 20 * 1024 * 1024
+
+# File is decoded and records are enqueued by chunks, giving control back
+# to event loop between them.
+IMPORT_CHUNK_SIZE = 32 * 1024
+IMPORT_BATCH_SIZE = 500
+
+
+class PlaylistTransferModule(BasicUtilityModule):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    def _initialize(self):
+        self.add_handler(CommandHandler("export", self.__on_export_command))
+        self.add_handler(CommandHandler("import", self.__on_import_command))
+        self.add_handler(
+            MessageHandler(
+                filters.Document.ALL & filters.CaptionRegex(r"^/import\b"),
+                self.__on_import_command,
+            )
+        )
+
+    async def __on_export_command(
+        self,
+        update: Update,
+        context: CallbackContext.DEFAULT_TYPE,
+    ):
+        try:
+            medias = list(self.callbacks.list_playlist())
+            if not medias:
+                await self._reply(update, MESSAGE_EXPORT_EMPTY)
+                return
+
+            data = encode_playlist(
+                PlaylistRecord(media.mrl, *media.known_metadata) for media in medias
+            )
+
+            await self.application.bot.send_document(
+                chat_id=update.effective_chat.id,
+                document=data,
+                filename=EXPORT_FILENAME.format(time.strftime("%Y%m%d-%H%M%S")),
+                caption=MESSAGE_EXPORT_CAPTION.format(len(medias)),
+            )
+        except Exception:
+            logger.error("Unable to export playlist.", exc_info=True)
+            await self._exception_notify(update)
+
+    async def __on_import_command(
+        self,
+        update: Update,
+        context: CallbackContext.DEFAULT_TYPE,
+    ):
+        try:
+            message = update.message
+            document = message.document
+            if document is None and message.reply_to_message is not None:
+                document = message.reply_to_message.document
+
+            # Do not use self._reply here, cause it may delete sent file.
+            if document is None:
+                await message.reply_text(
+                    MESSAGE_IMPORT_NO_DOCUMENT, parse_mode=ParseMode.MARKDOWN_V2
+                )
+                return
+
+            if document.file_size and document.file_size > MAX_IMPORT_FILE_SIZE:
+                await message.reply_text(
+                    MESSAGE_IMPORT_TOO_BIG, parse_mode=ParseMode.MARKDOWN_V2
+                )
+                return
+
+            file = await context.bot.get_file(document.file_id)
+            data = await file.download_as_bytearray()
+
+            try:
+                added = await self.import_playlist(data, update.effective_user.id)
+            except PlaylistCodecError as e:
+                await message.reply_text(
+                    MESSAGE_IMPORT_BROKEN.format(escape_markdown(str(e), 2)),
+                    parse_mode=ParseMode.MARKDOWN_V2,
+                )
+                return
+
+            await message.reply_text(
+                MESSAGE_IMPORT_SUCCESS.format(added),
+                parse_mode=ParseMode.MARKDOWN_V2,
+            )
+        except Exception:
+            logger.error("Unable to import playlist.", exc_info=True)
+            await self._exception_notify(update)
+
+    async def import_playlist(
+        self, data: bytes, requester: tp.Optional[int] = None
+    ) -> int:
+        # Whole file is checked first, broken one doesn't leave half of
+        # itself in queue
+        decoder = PlaylistDecoder()
+        records: tp.List[PlaylistRecord] = []
+        for i in range(0, len(data), IMPORT_CHUNK_SIZE):
+            records += decoder.feed(bytes(data[i : i + IMPORT_CHUNK_SIZE]))
+            await asyncio.sleep(0)
+        decoder.finish()
+
+        # Entries already carry metadata, so they are enqueued without parsing.
+        # Duplicates may be skipped by policy, only queued ones are counted.
+        added = 0
+        for i in range(0, len(records), IMPORT_BATCH_SIZE):
+            queued = await self.callbacks.add_resolved_to_playlist(
+                [
+                    ResolvedMedia(
+                        uri=record.mrl,
+                        mrl=record.mrl,
+                        title=record.title,
+                        artist=record.artist,
+                        duration=record.duration,
+                    )
+                    for record in records[i : i + IMPORT_BATCH_SIZE]
+                ],
+                requester,
+            )
+            added += len(queued)
+            await asyncio.sleep(0)
+
+        logger.info("Imported %d medias from playlist file", added)
+
+        return added
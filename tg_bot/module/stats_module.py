@@ -0,0 +1,95 @@
+import logging
+
+from tg_bot.module.basic_utility_module import BasicUtilityModule
+from tg_bot.utils import bytes_to_human
+
+from telegram.ext import CommandHandler, CallbackContext
+from telegram import Update
+from telegram.helpers import escape_markdown
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_STATS = """📊 Статистика:
+```
+{}
+```"""
+
+MESSAGE_STATS_PREFETCH = """Кэш предзагрузки:
+  попаданий: {}
+  промахов:  {}
+  сэкономлено: {}
+  занято: {} из {} ({} шт.)"""
+
+MESSAGE_STATS_DISPATCH = """Обработка сообщений:
+  сейчас: {} из {}"""
+MESSAGE_STATS_DISPATCH_CHAT = (
+    "  {}: {} шт., очередь {} (макс. {}), ожидание {:.2f}/{:.2f} с"
+)
+
+# Chats with longest waits are shown
+STATS_DISPATCH_CHATS = 5
+
+
+class StatsModule(BasicUtilityModule):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    def _initialize(self):
+        self.add_handler(CommandHandler("stats", self.__on_stats_command))
+
+    def build_dispatch_section(self) -> str:
+        application = self.application
+        chats = sorted(
+            application.dispatch_stats.items(),
+            key=lambda item: -item[1].max_wait,
+        )[:STATS_DISPATCH_CHATS]
+
+        return "\n".join(
+            [
+                MESSAGE_STATS_DISPATCH.format(
+                    application.in_flight, application.max_concurrent_updates
+                )
+            ]
+            + [
+                MESSAGE_STATS_DISPATCH_CHAT.format(
+                    chat,
+                    stats.processed,
+                    stats.depth,
+                    stats.max_depth,
+                    stats.average_wait,
+                    stats.max_wait,
+                )
+                for chat, stats in chats
+            ]
+        )
+
+    def build_stats_sections(self):
+        prefetch = self.callbacks.get_prefetch_stats()
+
+        return [
+            MESSAGE_STATS_PREFETCH.format(
+                prefetch.hits,
+                prefetch.misses,
+                bytes_to_human(prefetch.bytes_saved),
+                bytes_to_human(prefetch.used_bytes),
+                bytes_to_human(prefetch.byte_budget),
+                prefetch.entries,
+            ),
+            self.build_dispatch_section(),
+        ]
+
+    async def __on_stats_command(
+        self,
+        update: Update,
+        context: CallbackContext.DEFAULT_TYPE,
+    ):
+        try:
+            await self._reply(
+                update,
+                MESSAGE_STATS.format(
+                    escape_markdown("\n\n".join(self.build_stats_sections()), 2)
+                ),
+            )
+        except Exception:
+            logger.error("Unable to show stats.", exc_info=True)
+            await self._exception_notify(update)
@@ -19,7 +19,7 @@ class WhereAmIModule(BasicUtilityModule):
         super().__init__(*args, **kwargs)
 
     def _initialize(self):
-        self.application.add_handler(
+        self.add_handler(
             CommandHandler("whereami", self.__on_whereami_command)
         )
 
@@ -54,3 +54,11 @@ def seconds_to_time(seconds: int) -> str:
     if hours == 0:
         return f"{minutes:02}:{seconds:02}"
     return f"{hours}:{minutes:02}:{seconds:02}"
+
+
+def bytes_to_human(size: int) -> str:
+    for unit in ("Б", "КБ", "МБ"):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} ГБ"
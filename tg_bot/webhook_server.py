@@ -0,0 +1,108 @@
+import asyncio
+import dataclasses
+import typing as tp
+import logging
+import json
+import hmac
+from http import HTTPStatus
+from urllib.parse import urlparse
+
+from http_server import HttpServer, HttpRequest, HttpResponse
+
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = "x-telegram-bot-api-secret-token"
+
+
+@dataclasses.dataclass()
+class WebhookConfig:
+    # Public url, that reverse proxy forwards to `listen`:`port`
+    url: str
+    listen: str = "127.0.0.1"
+    port: int = 8443
+    secret_token: tp.Optional[str] = None
+
+    def __post_init__(self):
+        # Bad url would only fail later, deep inside bot start
+        if not self.url or urlparse(self.url).scheme != "https":
+            raise ValueError(
+                f"Webhook mode needs public https url (TG_WEBHOOK_URL), "
+                f"got {self.url!r}"
+            )
+
+    @property
+    def url_path(self) -> str:
+        return urlparse(self.url).path
+
+
+# Used instead of `Updater.start_webhook`, which needs tornado of
+# `python-telegram-bot[webhooks]` and has no bound for pending updates.
+class WebhookServer:
+    def __init__(
+        self,
+        application: Application,
+        listen: str,
+        port: int,
+        url_path: str,
+        secret_token: tp.Optional[str] = None,
+        queue_size: int = 256,
+    ):
+        self._application = application
+        self._url_path = "/" + url_path.strip("/")
+        self._secret_token = secret_token
+
+        # Requests are answered as soon as update is queued, decoding and
+        # handling is done by worker. Full queue makes Telegram retry later.
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._worker_task: tp.Optional[asyncio.Task] = None
+
+        self._http = HttpServer(self._on_request, host=listen, port=port)
+
+    @property
+    def port(self) -> int:
+        return self._http.port
+
+    async def start(self):
+        await self._http.start()
+        self._worker_task = asyncio.create_task(self._worker())
+
+    async def stop(self):
+        await self._http.stop()
+        if self._worker_task is not None:
+            self._worker_task.cancel()
+            self._worker_task = None
+
+    async def _on_request(self, request: HttpRequest) -> HttpResponse:
+        if request.path != self._url_path:
+            return HttpResponse(status=HTTPStatus.NOT_FOUND)
+
+        if request.method != "POST":
+            return HttpResponse(status=HTTPStatus.METHOD_NOT_ALLOWED)
+
+        if self._secret_token is not None and not hmac.compare_digest(
+            request.headers.get(SECRET_TOKEN_HEADER, ""), self._secret_token
+        ):
+            logger.warning("Webhook request with wrong secret token")
+            return HttpResponse(status=HTTPStatus.FORBIDDEN)
+
+        try:
+            self._queue.put_nowait(request.body)
+        except asyncio.QueueFull:
+            logger.warning("Webhook queue is full, asking Telegram to retry")
+            return HttpResponse(status=HTTPStatus.SERVICE_UNAVAILABLE)
+
+        return HttpResponse()
+
+    async def _worker(self):
+        while True:
+            body = await self._queue.get()
+            try:
+                update = Update.de_json(json.loads(body), self._application.bot)
+                await self._application.update_queue.put(update)
+            except Exception:
+                logger.error("Unable to decode webhook update", exc_info=True)
+            finally:
+                self._queue.task_done()
@@ -0,0 +1,81 @@
+# Latency of inline search over big library, queries are typed letter
+# by letter, like in Telegram client.
+#
+#   python -m tools.search_benchmark --documents 100000
+import argparse
+import random
+import statistics
+import time
+
+from multimedia.playlist_entry import PlaylistEntry
+from multimedia.search_index import SearchIndex
+
+SYLLABLES = "ka ro mi ne lo va tu shi den gar bel mor lin sta qui ber zo ra".split()
+
+
+def word() -> str:
+    return "".join(random.choices(SYLLABLES, k=random.randint(1, 3)))
+
+
+def measure(count: int):
+    random.seed(0)
+    artists = [f"{word().title()} {word().title()}" for _ in range(3000)]
+
+    index = SearchIndex()
+    started = time.perf_counter()
+    for i in range(count):
+        title = " ".join(word() for _ in range(random.randint(1, 4))).capitalize()
+        index.add(
+            f"https://example.com/track/{i}.mp3",
+            title,
+            random.choice(artists),
+            random.randint(90, 400),
+            seen_at=i,
+        )
+    elapsed = time.perf_counter() - started
+    print(f"indexed {len(index)} titles in {elapsed:.2f} s")
+
+    entries = [
+        PlaylistEntry(f"https://example.com/track/{i}.mp3")
+        for i in random.sample(range(count * 2), 1000)
+    ]
+
+    started = time.perf_counter()
+    index.set_queue(entries)
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"queue of {len(entries)} synced in {elapsed:.1f} ms")
+
+    queries = []
+    for _ in range(200):
+        document = index.get(random.randint(1, count))
+        text = f"{document.title} {document.artist}".lower()
+        start = random.randrange(max(1, len(text) - 8))
+        queries += [text[start : start + n] for n in range(1, 9)]
+    queries += ["", "ka", "ro mi", "zzz", "gar bel"]
+
+    latencies = []
+    sizes = []
+    for query in queries:
+        started = time.perf_counter()
+        sizes.append(len(index.search(query)))
+        latencies.append(time.perf_counter() - started)
+
+    latencies = sorted(latency * 1000 for latency in latencies)
+    print(
+        f"{len(queries)} queries: p50 {statistics.median(latencies):.2f} ms, "
+        f"p99 {latencies[int(len(latencies) * 0.99) - 1]:.2f} ms, "
+        f"max {latencies[-1]:.2f} ms, avg results {statistics.mean(sizes):.1f}"
+    )
+    print([d.display_title for d in index.search("ro mi", 5)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--documents", type=int, default=100_000)
+    args = parser.parse_args()
+
+    measure(args.documents)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# Compares long polling and webhook mode of bot against local fake
+# Bot API: idle CPU and requests, latency from command to reply.
+#
+#   python -m tools.webhook_benchmark --idle-seconds 30 --commands 100
+import argparse
+import asyncio
+import collections
+import json
+import statistics
+import threading
+import time
+import typing as tp
+from urllib.parse import parse_qs
+
+from telegram import Update
+from telegram.ext import ApplicationBuilder, CommandHandler
+
+from http_server import HttpRequest, HttpResponse, HttpServer
+from tg_bot.webhook_server import WebhookServer
+
+TOKEN = "123456:BENCH"
+
+
+# Stand-in for Telegram servers, posts updates to local webhook server.
+class WebhookTestClient:
+    def __init__(
+        self,
+        port: int,
+        url_path: str,
+        secret_token: tp.Optional[str] = None,
+        host: str = "127.0.0.1",
+    ):
+        self._host = host
+        self._port = port
+        self._url_path = "/" + url_path.strip("/")
+        self._secret_token = secret_token
+
+    async def post_update(self, update: tp.Dict[str, tp.Any]) -> tp.Tuple[int, float]:
+        # Returns http status and round trip time in seconds
+        body = json.dumps(update).encode("utf-8")
+
+        headers = [
+            f"POST {self._url_path} HTTP/1.1",
+            f"Host: {self._host}:{self._port}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(body)}",
+            "Connection: close",
+        ]
+        if self._secret_token is not None:
+            headers.append(f"X-Telegram-Bot-Api-Secret-Token: {self._secret_token}")
+
+        started = time.perf_counter()
+        reader, writer = await asyncio.open_connection(self._host, self._port)
+        try:
+            writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+            await writer.drain()
+            status_line = await reader.readline()
+            await reader.read()
+        finally:
+            writer.close()
+
+        return int(status_line.split()[1]), time.perf_counter() - started
+
+    async def post_command(
+        self,
+        chat_id: int,
+        text: str,
+        update_id: int = 1,
+    ) -> tp.Tuple[int, float]:
+        return await self.post_update(command_update(chat_id, text, update_id))
+
+
+def command_update(
+    chat_id: int, text: str, update_id: int = 1
+) -> tp.Dict[str, tp.Any]:
+    # Update with bot command, as Telegram sends it
+    command_length = len(text.split(" ", 1)[0])
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "group", "title": "test"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "test"},
+            "text": text,
+            "entities": [
+                {"type": "bot_command", "offset": 0, "length": command_length}
+            ],
+        },
+    }
+
+
+# Local Bot API with long polling like Telegram. It runs in its own
+# thread, so only CPU time of bot's thread is measured.
+class FakeBotApi:
+    def __init__(self):
+        self.requests: tp.Counter[str] = collections.Counter()
+        self.on_reply: tp.Callable[[], None] = lambda: None
+
+        self._loop = asyncio.new_event_loop()
+        self._updates: tp.List[tp.Dict[str, tp.Any]] = []
+        self._new_update: tp.Optional[asyncio.Event] = None
+        self._server = HttpServer(self._on_request)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.port}/bot"
+
+    def start(self):
+        started = threading.Event()
+
+        def run():
+            self._new_update = asyncio.Event()
+            self._loop.run_until_complete(self._server.start())
+            started.set()
+            self._loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        started.wait()
+
+    def push_update(self, update: tp.Dict[str, tp.Any]):
+        def push():
+            self._updates.append(update)
+            self._new_update.set()
+
+        self._loop.call_soon_threadsafe(push)
+
+    async def _on_request(self, request: HttpRequest) -> HttpResponse:
+        method = request.path.rsplit("/", 1)[-1]
+        self.requests[method] += 1
+        params = {}
+        for name, values in parse_qs(request.body.decode("utf-8")).items():
+            # Only non-string values are encoded as JSON
+            try:
+                params[name] = json.loads(values[0])
+            except ValueError:
+                params[name] = values[0]
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "b", "username": "b"}
+        elif method == "getUpdates":
+            result = await self._get_updates(
+                params.get("offset", 0), params.get("timeout", 0)
+            )
+        elif method == "sendMessage":
+            self.on_reply()
+            result = {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": params["chat_id"], "type": "group"},
+                "text": params["text"],
+            }
+        else:
+            result = True
+
+        body = json.dumps({"ok": True, "result": result}).encode("utf-8")
+        return HttpResponse(body=body, content_type="application/json")
+
+    async def _get_updates(self, offset: int, timeout: float):
+        # Request is held until update arrives or timeout passes
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates:
+            self._new_update.clear()
+            try:
+                await asyncio.wait_for(self._new_update.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates
+
+
+async def measure(mode: str, idle_seconds: float, commands: int):
+    api = FakeBotApi()
+    api.start()
+
+    application = ApplicationBuilder().token(TOKEN).base_url(api.base_url).build()
+
+    async def on_ping(update: Update, context):
+        await update.effective_message.reply_text("pong")
+
+    application.add_handler(CommandHandler("ping", on_ping))
+    await application.initialize()
+
+    webhook = None
+    if mode == "polling":
+        # Same parameters as TelegramBot.run uses
+        await application.updater.start_polling(
+            poll_interval=0.0, timeout=10, read_timeout=2
+        )
+    else:
+        webhook = WebhookServer(application, "127.0.0.1", 0, "/hook")
+        await webhook.start()
+    await application.start()
+    await asyncio.sleep(0.5)
+
+    # Idle: nobody writes to bot
+    api.requests.clear()
+    cpu, wall = time.thread_time(), time.monotonic()
+    await asyncio.sleep(idle_seconds)
+    idle_cpu = (time.thread_time() - cpu) / (time.monotonic() - wall)
+    idle_requests = sum(api.requests.values())
+
+    # Command to reaction: update sent by Telegram until reply reaches it
+    loop = asyncio.get_running_loop()
+    replied = asyncio.Event()
+    api.on_reply = lambda: loop.call_soon_threadsafe(replied.set)
+    client = WebhookTestClient(webhook.port, "/hook") if webhook else None
+
+    latencies = []
+    for update_id in range(1, commands + 1):
+        replied.clear()
+        started = time.perf_counter()
+        if client is not None:
+            await client.post_update(command_update(1, "/ping", update_id))
+        else:
+            api.push_update(command_update(1, "/ping", update_id))
+        await replied.wait()
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.05)
+
+    if application.updater.running:
+        await application.updater.stop()
+    await application.stop()
+    if webhook is not None:
+        await webhook.stop()
+    await application.shutdown()
+
+    latencies = sorted(latency * 1000 for latency in latencies)
+    print(
+        f"{mode:>8}: idle CPU {idle_cpu * 100:.3f}% "
+        f"({idle_requests} requests in {idle_seconds:.0f} s), "
+        f"command to reply p50 {statistics.median(latencies):.1f} ms, "
+        f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--idle-seconds", type=float, default=30.0)
+    parser.add_argument("--commands", type=int, default=100)
+    args = parser.parse_args()
+
+    for mode in ("polling", "webhook"):
+        asyncio.run(measure(mode, args.idle_seconds, args.commands))
+
+
+if __name__ == "__main__":
+    main()